@@ -1,20 +1,66 @@
-from django.contrib import admin
+import datetime
+from collections import Counter
+
+from django.contrib import admin, messages
 
 # Register your models here.
 # This code registers the models with the admin site. and then 
 # calls the admin.site.register() method to register the models
 
-from .models import Author, Genre, Book, BookInstance, Language
+from .models import Author, Genre, Book, BookInstance, Hold, Language
+from .forms import BookInstanceAdminForm
+from .circulation import RENEWED, RESERVED, RETURNED, renew_copies, return_copies
+from .holds import cancel_hold, lend_held_copy
+from .pagination import EstimatedCountPaginator
 
 #admin.site.register(Book)
 #admin.site.register(Author)
-admin.site.register(Genre)
 #admin.site.register(BookInstance)
-admin.site.register(Language)
 
-class BookInline(admin.TabularInline):
+## GENRE AND LANGUAGE ADMIN
+# The counts are maintained columns (see catalog/counters.py), so showing
+# them costs nothing per row.
+class GenreAdmin(admin.ModelAdmin):
+    list_display = ('name', 'book_count', 'available_count')
+
+admin.site.register(Genre, GenreAdmin)
+
+class LanguageAdmin(admin.ModelAdmin):
+    list_display = ('name', 'book_count', 'available_count')
+
+admin.site.register(Language, LanguageAdmin)
+
+class SharedChoicesInlineMixin:
+    """Inline whose select boxes are filled by one query for all its rows.
+
+    Every form of an inline formset runs the queryset of its select boxes
+    again, so a book with 500 copies would fetch the patron list 500 times.
+    Fields named in ``shared_choices_fields`` get the choices evaluated once
+    instead.
+    """
+
+    shared_choices_fields = ()
+
+    def share_choices(self, db_field, formfield):
+        if formfield is not None and db_field.name in self.shared_choices_fields:
+            formfield.choices = [(str(value), label) for value, label in formfield.choices]
+        return formfield
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        return self.share_choices(db_field, super().formfield_for_foreignkey(db_field, request, **kwargs))
+
+    def formfield_for_manytomany(self, db_field, request, **kwargs):
+        return self.share_choices(db_field, super().formfield_for_manytomany(db_field, request, **kwargs))
+
+
+class BookInline(SharedChoicesInlineMixin, admin.TabularInline):
     model = Book
     extra = 0
+    shared_choices_fields = ('genre', 'language')
+
+    def get_queryset(self, request):
+        # The genre and language selects show each book's current values.
+        return super().get_queryset(request).prefetch_related('genre', 'language')
 ## AUTHOR ADMIN
 class AuthorAdmin(admin.ModelAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
@@ -26,16 +72,32 @@ class AuthorAdmin(admin.ModelAdmin):
 admin.site.register(Author, AuthorAdmin)
 
 #BOOK INSTANCE INLINE
-class BooksInstanceInline(admin.TabularInline):
+class BooksInstanceInline(SharedChoicesInlineMixin, admin.TabularInline):
     model = BookInstance
     extra = 0
+    shared_choices_fields = ('borrower',)
+
+    def get_queryset(self, request):
+        # Each row is labelled with the copy's str(), which shows the title.
+        return super().get_queryset(request).select_related('book')
 
 
 
 ## BOOK ADMIN
 class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'display_genre', 'display_language')
+    # copy_count and available_count are maintained columns, like the genre
+    # and language counts.
+    list_display = ('title', 'author', 'display_genre', 'display_language', 'copy_count', 'available_count')
     inlines = [BooksInstanceInline]
+    # Join the author and prefetch genres and languages so that the display_*
+    # columns do not cost two queries per row.
+    list_select_related = ('author',)
+    # Size the changelist from the table estimate instead of COUNT(*).
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('genre', 'language')
     
 # Register the BookAdmin class with the model
 admin.site.register(Book, BookAdmin)
@@ -45,11 +107,43 @@ admin.site.register(Book, BookAdmin)
 # this will make the field visible in the Admin section allowing us to assign a User to a 
 # Book instance when needed
 class BookInstanceAdmin(admin.ModelAdmin):
+    # Detects edits made by someone else while the change form was open.
+    form = BookInstanceAdminForm
     list_display = ( 'book','status','borrower', 'due_back', 'id')
     list_filter = ('status', 'due_back')
+    list_select_related = ('book', 'borrower')
+    # Only index-friendly lookups: exact copy id and borrower username, and a
+    # prefix match on the book title (served by the Book (title, id) index).
+    search_fields = ('=id', '^book__title', '=borrower__username')
+    # The copies table is the largest in the catalog: no full COUNT(*) for
+    # the "x total" link or the filter facets, and an estimated page count.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    actions = ['renew_three_weeks', 'mark_returned']
+
+    # Bulk actions run as set-based UPDATEs, see catalog/circulation.py.
+    @admin.action(description="Renew selected copies for 3 weeks", permissions=['mark_returned'])
+    def renew_three_weeks(self, request, queryset):
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
+        outcomes = renew_copies(list(queryset.values_list('pk', flat=True)), renewal_date)
+        self.report_outcomes(request, outcomes)
+
+    @admin.action(description="Mark selected copies as returned", permissions=['mark_returned'])
+    def mark_returned(self, request, queryset):
+        outcomes = return_copies(list(queryset.values_list('pk', flat=True)))
+        self.report_outcomes(request, outcomes)
+
+    def has_mark_returned_permission(self, request):
+        return request.user.has_perm('catalog.can_mark_returned')
+
+    def report_outcomes(self, request, outcomes):
+        for outcome, count in sorted(Counter(outcomes.values()).items()):
+            level = messages.SUCCESS if outcome in (RENEWED, RETURNED, RESERVED) else messages.WARNING
+            self.message_user(request, f"{count} {'copy' if count == 1 else 'copies'} {outcome}.", level)
     fieldsets=(
         (None, {
-            'fields': ('book', 'imprint', 'id')
+            'fields': ('book', 'imprint', 'id', 'loaded_version')
         }),
         ('Availability', {
             'fields': ('status', 'due_back','borrower')
@@ -59,6 +153,36 @@ class BookInstanceAdmin(admin.ModelAdmin):
 admin.site.register(BookInstance, BookInstanceAdmin)
 
 
+## HOLD ADMIN
+# Holds are placed by patrons and allocated on return (catalog/holds.py);
+# librarians lend the copies set aside, or cancel holds. Both actions go
+# through the conditional UPDATEs of catalog/holds.py, one hold at a time.
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('book', 'patron', 'status', 'copy', 'placed_at', 'ready_at')
+    list_filter = ('status',)
+    list_select_related = ('book', 'patron', 'copy__book')
+    search_fields = ('^book__title', '=patron__username')
+    raw_id_fields = ('book', 'patron', 'copy')
+    readonly_fields = ('status', 'copy', 'placed_at', 'ready_at')
+    actions = ['lend_held_copies', 'cancel_holds']
+
+    @admin.action(description="Lend the copies set aside for 3 weeks", permissions=['mark_returned'])
+    def lend_held_copies(self, request, queryset):
+        due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        lent = sum(lend_held_copy(hold, due_back) for hold in queryset.filter(status__exact='r'))
+        self.message_user(request, f"{lent} {'copy' if lent == 1 else 'copies'} lent.", messages.SUCCESS)
+
+    @admin.action(description="Cancel selected holds", permissions=['mark_returned'])
+    def cancel_holds(self, request, queryset):
+        cancelled = sum(cancel_hold(hold) for hold in queryset.active())
+        self.message_user(request, f"{cancelled} {'hold' if cancelled == 1 else 'holds'} cancelled.", messages.SUCCESS)
+
+    def has_mark_returned_permission(self, request):
+        return request.user.has_perm('catalog.can_mark_returned')
+
+admin.site.register(Hold, HoldAdmin)
+
+
 # The line above assumes that you accepted the challenge to create model to represent the natural language of the book.
 
 
@@ -7,3 +7,6 @@ class CatalogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "catalog"
 
+    def ready(self):
+        # Importing the module connects the signal receivers it declares.
+        from . import instrumentation, signals  # noqa: F401
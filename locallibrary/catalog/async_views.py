@@ -0,0 +1,92 @@
+## Async versions of the generic list and detail views
+# Served through locallibrary/asgi.py, an async view does not hold a worker
+# thread while it waits for the database, so one process can serve many
+# more patrons at a time. The mixins below give ListView and DetailView an
+# async get(): the rows of the page (or the object) are fetched with the
+# async ORM (acount(), async iteration, aget()), then the usual
+# get_context_data() and TemplateResponse take over. Django renders a
+# TemplateResponse of an async view in a worker thread, so the template may
+# still follow relations and prefetched or lazy values.
+# Under WSGI the same views work too; Django runs them in an event loop.
+
+from django.core.paginator import InvalidPage
+from django.http import Http404
+from django.utils.translation import gettext as _
+
+
+class AsyncListMixin:
+    """ListView mixin fetching the page with the async ORM in an async get()."""
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        pagination = {}
+        if page_size:
+            paginator, page, rows, is_paginated = await self.apaginate_queryset(self.object_list, page_size)
+            pagination = {'paginator': paginator, 'page_obj': page, 'is_paginated': is_paginated}
+        else:
+            rows = [obj async for obj in self.object_list]
+        if not rows and not self.get_allow_empty():
+            raise Http404(_('Empty list and “%(class_name)s.allow_empty” is False.') % {
+                'class_name': self.__class__.__name__,
+            })
+        # The page is fetched already: get_context_data() must not paginate
+        # (that would query synchronously) but take it from the arguments.
+        # self.object_list stays the queryset: the template and context
+        # object names derive from its model.
+        self.paginate_by = None
+        context_object_name = self.get_context_object_name(self.object_list)
+        if context_object_name is not None:
+            pagination[context_object_name] = rows
+        context = self.get_context_data(object_list=rows, **pagination)
+        return self.render_to_response(context)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """Async paginate_queryset(): same result, counted and fetched with the async ORM."""
+        paginator = self.get_paginator(
+            queryset,
+            page_size,
+            orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        # Paginator.count is a cached property; fill it in before it is read.
+        paginator.count = await queryset.acount()
+        page_kwarg = self.page_kwarg
+        page = self.kwargs.get(page_kwarg) or self.request.GET.get(page_kwarg) or 1
+        try:
+            page_number = int(page)
+        except ValueError:
+            if page == 'last':
+                page_number = paginator.num_pages
+            else:
+                raise Http404(_('Page is not “last”, nor can it be converted to an int.'))
+        try:
+            page = paginator.page(page_number)
+        except InvalidPage as e:
+            raise Http404(_('Invalid page (%(page_number)s): %(message)s') % {
+                'page_number': page_number,
+                'message': str(e),
+            })
+        page.object_list = [obj async for obj in page.object_list]
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+class AsyncDetailMixin:
+    """DetailView mixin fetching the object with the async ORM in an async get()."""
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await self.aget_object()
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
+
+    async def aget_object(self, queryset=None):
+        """Async get_object() for views looked up by primary key."""
+        if queryset is None:
+            queryset = self.get_queryset()
+        try:
+            # aget() also runs the queryset's prefetch_related() lookups.
+            return await queryset.aget(pk=self.kwargs.get(self.pk_url_kwarg))
+        except queryset.model.DoesNotExist:
+            raise Http404(_('No %(verbose_name)s found matching the query') % {
+                'verbose_name': queryset.model._meta.verbose_name,
+            })
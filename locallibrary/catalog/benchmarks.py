@@ -0,0 +1,210 @@
+## Per-view benchmarks
+# run_benchmarks() requests every catalog URL and every admin changelist
+# through the test client, as a superuser so that the permission-protected
+# pages are rendered and the anonymous page cache does not hide the cost
+# of the views. Each page is requested once to warm up, then ``repeat``
+# times while timing it, then once more under tracemalloc to measure the
+# peak memory it allocates (tracemalloc slows everything down, so that
+# request is not timed). The result of a run is a JSON document holding
+# the size of the catalog and, per page, the p50 and p95 latency, the number
+# of queries and the peak memory; compare_results() lines up two of them.
+#
+# Typical use, one database file per scale:
+#   DJANGO_DB_NAME=bench-medium.sqlite3 manage.py migrate
+#   DJANGO_DB_NAME=bench-medium.sqlite3 manage.py generate_catalog --scale medium
+#   DJANGO_DB_NAME=bench-medium.sqlite3 manage.py benchmark_views --output medium.json
+#   ... after a change: benchmark_views --compare medium.json
+# Run with DJANGO_DEBUG=False for the production settings (SQLite profile,
+# instrumentation sampling, no query log), and against a scratch database
+# as above: the requests run and commit as in production, so that the
+# on_commit work of the pages (stamps, statistics) is part of what is
+# measured. The run deletes its superuser and session when it is done.
+
+import datetime
+import math
+import statistics
+import time
+import tracemalloc
+import uuid
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Author, Book, BookInstance
+
+
+# Catalog URLs that only accept POST (actions that write and redirect); the
+# benchmarks only request pages.
+POST_ONLY_URLS = {'book-hold', 'hold-cancel'}
+
+
+def catalog_targets():
+    """Return (name, path) for every catalog URL, using rows of the current catalog."""
+    book = Book.objects.order_by('pk').first()
+    author = Author.objects.order_by('pk').first()
+    copy = BookInstance.objects.filter(status__exact='o').order_by('pk').first()
+    # Incremental exports, as the data warehouse runs them.
+    since = (timezone.localdate() - datetime.timedelta(days=1)).isoformat()
+    word = book.title.split()[-1] if book else 'book'
+
+    targets = [
+        ('index', reverse('index')),
+        ('books', reverse('books')),
+        ('books (last page)', reverse('books') + '?page=last'),
+        ('search', reverse('search') + f'?q={word}'),
+        ('browse', reverse('browse')),
+        ('browse (available)', reverse('browse') + '?available=1'),
+        ('authors', reverse('authors')),
+        ('my-borrowed', reverse('my-borrowed')),
+        ('my-holds', reverse('my-holds')),
+        ('all-borrowed', reverse('all-borrowed')),
+        ('overdue', reverse('overdue')),
+        ('bulk-renew-return', reverse('bulk-renew-return')),
+        ('book-create', reverse('book-create')),
+        ('author-create', reverse('author-create')),
+        ('export (books)', reverse('export', args=['books']) + f'?since={since}'),
+        ('export (copies)', reverse('export', args=['copies']) + f'?since={since}'),
+    ]
+    if book:
+        targets += [(name, reverse(name, args=[book.pk])) for name in ['book-detail', 'book-update', 'book-delete']]
+    if author:
+        targets += [(name, reverse(name, args=[author.pk])) for name in ['author-detail', 'author-update', 'author-delete']]
+    if copy:
+        targets.append(('renew-book-librarian', reverse('renew-book-librarian', args=[copy.pk])))
+    return targets
+
+
+def admin_targets():
+    """Return (name, path) for the changelist of every model in the admin site."""
+    return sorted(
+        (f'admin:{model._meta.label_lower}', reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist'))
+        for model in admin.site._registry
+    )
+
+
+def catalog_scale():
+    """Return the row counts describing the size of the catalog."""
+    return {
+        'books': Book.objects.count(),
+        'copies': BookInstance.objects.count(),
+        'authors': Author.objects.count(),
+        'users': get_user_model().objects.count(),
+        'loans': BookInstance.objects.filter(status__exact='o').count(),
+    }
+
+
+def percentile(values, percent):
+    """Return the given percentile of values (nearest rank)."""
+    values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries run (connection.queries is capped)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def fetch(client, path):
+    response = client.get(path)
+    if response.streaming:
+        # A streamed export is produced while it is consumed.
+        for chunk in response.streaming_content:
+            pass
+    return response
+
+
+def measure(client, path, repeat, cold=False):
+    """Return the figures of one page, see module comment."""
+    fetch(client, path)
+    timings = []
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            started = time.perf_counter()
+            response = fetch(client, path)
+            timings.append(time.perf_counter() - started)
+
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        fetch(client, path)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p95_ms': round(percentile(timings, 95) * 1000, 2),
+        'mean_ms': round(statistics.mean(timings) * 1000, 2),
+        'queries': queries.count,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(repeat=20, cold=False, names=None, progress=None):
+    """Benchmark the catalog and admin pages; return the result document.
+
+    ``names`` limits the run to the targets of the given names, ``cold``
+    clears the cache before every request, ``progress`` is called with each
+    page's result as it is measured.
+    """
+    document = {
+        'created': timezone.now().isoformat(),
+        'repeat': repeat,
+        'cold': cold,
+        'scale': catalog_scale(),
+        'results': [],
+    }
+    # The test client talks to the "testserver" host.
+    user = get_user_model().objects.create_superuser(f'benchmark-{uuid.uuid4().hex[:8]}', password=None)
+    # A failing page is reported with its status instead of stopping the run.
+    client = Client(raise_request_exception=False)
+    try:
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            client.force_login(user)
+            for name, path in catalog_targets() + admin_targets():
+                if names and name not in names:
+                    continue
+                result = {'name': name, 'path': path, **measure(client, path, repeat, cold)}
+                document['results'].append(result)
+                if progress:
+                    progress(result)
+    finally:
+        client.logout()
+        user.delete()
+    return document
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """Compare two result documents page by page.
+
+    Return a list of (name, p95 ratio, query difference, regressed) for the
+    pages in both; a page regressed when it runs more queries than in the
+    baseline or its p95 grew by more than ``tolerance``.
+    """
+    before = {result['name']: result for result in baseline['results']}
+    comparison = []
+    for result in results['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        ratio = result['p95_ms'] / old['p95_ms'] if old['p95_ms'] else 1.0
+        queries = result['queries'] - old['queries']
+        comparison.append((result['name'], ratio, queries, queries > 0 or ratio > 1 + tolerance))
+    return comparison
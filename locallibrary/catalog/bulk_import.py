@@ -0,0 +1,262 @@
+## Bulk import of books, authors and copies
+# Vendor feeds come as CSV or JSON Lines with one book per record:
+#
+#   title, summary, isbn, author ("Last, First") or author_first_name and
+#   author_last_name, genres and languages (lists in JSON, ";"-separated in
+#   CSV), copies (number of copies to create), imprint, status
+#
+# Records are read one at a time and loaded in chunks. Each chunk is one
+# transaction of a handful of bulk_create() calls; authors, genres and
+# languages are resolved through in-memory maps, so a chunk costs the same
+# few queries whatever its size. bulk_create() sends no model signals, so the
+# importer updates the derived data itself: search index, book, genre and
+# language counters, the cached home page statistics and the cached catalog
+# pages.
+# Used by "manage.py import_catalog".
+
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from .caching import AUTHOR_LIST, BOOK_LIST, author_stamp, bump_stamps
+from .counters import apply_counter_deltas, copy_counter_deltas
+from .models import Author, Book, BookInstance, Genre, Language
+from .search import index_books
+from .stats import invalidate_catalog_stats
+
+STATUS_CODES = {code for code, label in BookInstance.LOAN_STATUS}
+
+
+class RejectedRecord(ValueError):
+    """Raised for a record that cannot be imported."""
+
+
+def read_records(stream, format):
+    """Yield (line number, record dict) pairs from a CSV or JSONL stream."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif format == 'jsonl':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_num, e
+                continue
+            yield line_num, record
+    else:
+        raise ValueError(f'Unknown format: {format}')
+
+
+def _names(value):
+    """Split a genre or language cell into a list of names."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    return [name.strip() for name in value if name and name.strip()]
+
+
+def _text(record, key, max_length=None, default=''):
+    value = record.get(key)
+    value = default if value is None else str(value).strip()
+    if max_length and len(value) > max_length:
+        raise RejectedRecord(f'{key} longer than {max_length} characters')
+    return value
+
+
+@dataclass
+class ImportRow:
+    """A record checked and normalised, ready to be loaded."""
+
+    title: str
+    summary: str
+    isbn: str
+    author: tuple
+    genres: list
+    languages: list
+    copies: int
+    imprint: str
+    status: str
+
+
+@dataclass
+class ImportReport:
+    records: int = 0
+    books: int = 0
+    copies: int = 0
+    authors: int = 0
+    genres: int = 0
+    languages: int = 0
+    duplicates: int = 0
+    rejected: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rate(self):
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+
+def parse_record(record):
+    """Check a raw record and return an ImportRow, or raise RejectedRecord."""
+    if isinstance(record, Exception):
+        raise RejectedRecord(f'invalid JSON: {record}')
+    if not isinstance(record, dict):
+        raise RejectedRecord('not a JSON object')
+    title = _text(record, 'title', Book._meta.get_field('title').max_length)
+    if not title:
+        raise RejectedRecord('missing title')
+    isbn = _text(record, 'isbn', Book._meta.get_field('isbn').max_length)
+    if not isbn:
+        raise RejectedRecord('missing isbn')
+    summary = _text(record, 'summary', Book._meta.get_field('summary').max_length, 'No summary available')
+
+    if record.get('author'):
+        last_name, _, first_name = str(record['author']).partition(',')
+    else:
+        first_name, last_name = record.get('author_first_name') or '', record.get('author_last_name') or ''
+    author = (first_name.strip(), last_name.strip())
+    if not author[1]:
+        raise RejectedRecord('missing author')
+    if any(len(part) > Author._meta.get_field('last_name').max_length for part in author):
+        raise RejectedRecord('author name too long')
+
+    try:
+        copies = int(record.get('copies') or 0)
+    except (TypeError, ValueError):
+        raise RejectedRecord('copies is not a number')
+    if copies < 0:
+        raise RejectedRecord('copies is negative')
+    status = _text(record, 'status', default='m') or 'm'
+    if status not in STATUS_CODES:
+        raise RejectedRecord(f'unknown status {status!r}')
+
+    return ImportRow(
+        title=title,
+        summary=summary,
+        isbn=isbn,
+        author=author,
+        genres=_names(record.get('genres')),
+        languages=_names(record.get('languages')),
+        copies=copies,
+        imprint=_text(record, 'imprint', BookInstance._meta.get_field('imprint').max_length),
+        status=status,
+    )
+
+
+class CatalogImporter:
+    """Load parsed records in chunks with bulk_create, see module comment."""
+
+    def __init__(self, chunk_size=1000):
+        self.chunk_size = chunk_size
+        self.report = ImportReport()
+        self.seen_isbns = set()
+        self.authors = {}
+        # Genre names are unique case-insensitively
+        # (genre_name_case_insensitive_unique), so the map is keyed on lower().
+        self.genres = {genre.name.lower(): genre for genre in Genre.objects.all()}
+        self.languages = {language.name: language for language in Language.objects.all()}
+
+    def run(self, records):
+        """Import (line number, record) pairs and return the ImportReport."""
+        started = time.perf_counter()
+        chunk = []
+        for line_num, record in records:
+            self.report.records += 1
+            try:
+                row = parse_record(record)
+            except RejectedRecord as e:
+                self.report.rejected.append((line_num, str(e)))
+                continue
+            if row.isbn in self.seen_isbns:
+                self.report.duplicates += 1
+                continue
+            self.seen_isbns.add(row.isbn)
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self.load_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.load_chunk(chunk)
+        invalidate_catalog_stats()
+        self.report.elapsed = time.perf_counter() - started
+        return self.report
+
+    @transaction.atomic
+    def load_chunk(self, rows):
+        # Dedupe against books already in the database.
+        existing = set(Book.objects.filter(isbn__in=[row.isbn for row in rows]).values_list('isbn', flat=True))
+        rows = [row for row in rows if row.isbn not in existing]
+        self.report.duplicates += len(existing)
+        if not rows:
+            return
+
+        self.resolve_authors({row.author for row in rows})
+        self.genres.update(self.create_missing(Genre, self.genres, [name for row in rows for name in row.genres], str.lower))
+        self.languages.update(self.create_missing(Language, self.languages, [name for row in rows for name in row.languages]))
+
+        # The books are new: their copy counters are known up front.
+        books = Book.objects.bulk_create([
+            Book(
+                title=row.title, summary=row.summary, isbn=row.isbn, author=self.authors[row.author],
+                **copy_counter_deltas(row.status, row.copies),
+            )
+            for row in rows
+        ])
+        genre_links, language_links, copies = [], [], []
+        genre_deltas, language_deltas = defaultdict(Counter), defaultdict(Counter)
+        for book, row in zip(books, rows):
+            available = row.copies if row.status == 'a' else 0
+            for genre_id in {self.genres[name.lower()].pk for name in row.genres}:
+                genre_links.append(Book.genre.through(book_id=book.pk, genre_id=genre_id))
+                genre_deltas[genre_id]['book_count'] += 1
+                genre_deltas[genre_id]['available_count'] += available
+            for language_id in {self.languages[name].pk for name in row.languages}:
+                language_links.append(Book.language.through(book_id=book.pk, language_id=language_id))
+                language_deltas[language_id]['book_count'] += 1
+                language_deltas[language_id]['available_count'] += available
+            copies += [BookInstance(book=book, imprint=row.imprint, status=row.status) for _ in range(row.copies)]
+        Book.genre.through.objects.bulk_create(genre_links)
+        Book.language.through.objects.bulk_create(language_links)
+        BookInstance.objects.bulk_create(copies, batch_size=self.chunk_size)
+
+        apply_counter_deltas(Genre, genre_deltas)
+        apply_counter_deltas(Language, language_deltas)
+        index_books([book.pk for book in books])
+        bump_stamps([BOOK_LIST, AUTHOR_LIST, *{author_stamp(book.author_id) for book in books}])
+        self.report.books += len(books)
+        self.report.copies += len(copies)
+
+    def resolve_authors(self, names):
+        """Fill self.authors for the given (first, last) names, creating the missing."""
+        missing = names - self.authors.keys()
+        if not missing:
+            return
+        for author in Author.objects.filter(last_name__in={last for first, last in missing}):
+            key = (author.first_name, author.last_name)
+            if key in missing:
+                self.authors.setdefault(key, author)
+        missing -= self.authors.keys()
+        created = Author.objects.bulk_create([Author(first_name=first, last_name=last) for first, last in missing])
+        self.authors.update({(author.first_name, author.last_name): author for author in created})
+        self.report.authors += len(created)
+
+    def create_missing(self, model, lookup, names, key=lambda name: name):
+        """bulk_create the named rows that are not in lookup yet; return key -> object."""
+        new = {}
+        for name in names:
+            if key(name) not in lookup and key(name) not in new:
+                new[key(name)] = model(name=name)
+        created = model.objects.bulk_create(new.values())
+        if model is Genre:
+            self.report.genres += len(created)
+        else:
+            self.report.languages += len(created)
+        return {key(obj.name): obj for obj in created}
@@ -0,0 +1,133 @@
+## Caching of the catalog pages
+# The book and author pages are read far more often than the catalog is
+# written, so their rendered responses are kept in the cache. Every page
+# depends on one "version stamp": a token in the cache that is replaced
+# whenever something shown on the page is written.
+#
+#   book-list         books (titles) and authors (names)
+#   author-list       authors
+#   book:<pk>         the book, its author's name, genres, languages and copies
+#   author:<pk>       the author, their books and those books' genres
+#   book-copies:<pk>  the copies of the book (the copies fragment of its
+#                     detail page, cached for every visitor)
+#   facets            the genres and languages of books, and their names
+#                     (with book-list: the browse page and its facet counts,
+#                     see catalog/facets.py)
+#
+# The cache key of a page includes the current token of its stamp, so
+# replacing the token makes the old entry unreachable (it expires on its
+# own); no cache entry is ever searched for or deleted. The receivers in
+# catalog/signals.py replace the stamps a write affects, and the code that
+# writes with queryset.update() or bulk_create() does it explicitly.
+#
+# Only anonymous visitors are served from the cache: for a logged-in user the
+# sidebar carries their name, their permission dependent links and a CSRF
+# token, so those pages are always rendered.
+# Works with any cache backend (local memory, file based, memcached, ...).
+
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+
+from .models import Book
+
+VIEW_CACHE_TIMEOUT = 60 * 15
+
+BOOK_LIST = 'book-list'
+AUTHOR_LIST = 'author-list'
+FACETS = 'facets'
+
+
+def book_stamp(pk):
+    return f'book:{pk}'
+
+
+def author_stamp(pk):
+    return f'author:{pk}'
+
+
+def copies_stamp(pk):
+    return f'book-copies:{pk}'
+
+
+def _stamp_key(name):
+    return f'catalog:stamp:{name}'
+
+
+def get_stamps(names):
+    """Return the current token of each named stamp, creating the missing ones."""
+    keys = [_stamp_key(name) for name in names]
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            # add() rather than set(): never replace a token bumped meanwhile.
+            cache.add(key, uuid.uuid4().hex, None)
+            tokens[key] = cache.get(key) or uuid.uuid4().hex
+    return [tokens[key] for key in keys]
+
+
+async def aget_stamps(names):
+    """Async get_stamps(), for async views."""
+    keys = [_stamp_key(name) for name in names]
+    tokens = await cache.aget_many(keys)
+    for key in keys:
+        if key not in tokens:
+            await cache.aadd(key, uuid.uuid4().hex, None)
+            tokens[key] = await cache.aget(key) or uuid.uuid4().hex
+    return [tokens[key] for key in keys]
+
+
+def bump_stamps(names):
+    """Give the named stamps new tokens, now and again when the transaction commits."""
+    names = {name for name in names if name is not None}
+    if not names:
+        return
+
+    def bump():
+        cache.set_many({_stamp_key(name): uuid.uuid4().hex for name in names}, None)
+
+    bump()
+    # A concurrent request may cache a page under the new token before this
+    # transaction commits; the second bump makes that entry unreachable.
+    transaction.on_commit(bump)
+
+
+def books_changed(book_ids):
+    """Bump the pages of the given books and of their authors."""
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+    author_ids = Book.objects.filter(pk__in=book_ids, author__isnull=False).values_list('author_id', flat=True)
+    bump_stamps([*map(book_stamp, book_ids), *map(author_stamp, set(author_ids))])
+
+
+class StampedCacheMixin:
+    """Serve a view's GET responses to anonymous visitors from the cache.
+
+    Subclasses return the stamps their page depends on from get_cache_stamps().
+    """
+
+    cache_timeout = VIEW_CACHE_TIMEOUT
+
+    def get_cache_stamps(self):
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs):
+        # The catalog views are async (see catalog/async_views.py).
+        user = await request.auser()
+        if user.is_authenticated:
+            return await super().get(request, *args, **kwargs)
+        tokens = await aget_stamps(self.get_cache_stamps())
+        digest = hashlib.md5('\n'.join([request.get_full_path(), *tokens]).encode()).hexdigest()
+        key = f'catalog:page:{digest}'
+        response = await cache.aget(key)
+        if response is None:
+            response = await super().get(request, *args, **kwargs)
+            if response.status_code == 200 and not response.cookies:
+                response.add_post_render_callback(lambda response: cache.set(key, response, self.cache_timeout))
+        # Logged-in visitors are told apart by their session cookie.
+        patch_vary_headers(response, ('Cookie',))
+        return response
@@ -0,0 +1,92 @@
+## Circulation: renewing and returning copies in bulk
+# The single-copy renewal view loads a BookInstance and saves it. At the end
+# of term librarians renew or check in hundreds of copies at once, so these
+# functions work on a set of copy ids with set-based UPDATE statements inside
+# one transaction, and report what happened to every copy.
+# queryset.update() sends no model signals, so the derived data that the
+# signal receivers would maintain is updated here: updated_at, the copy
+# counters of the books, the genre and language availability counters and
+# the cached home page statistics. Every UPDATE also increments
+# BookInstance.version, so that a librarian saving a copy loaded before the
+# bulk change gets a conflict instead of undoing it.
+# The cached pages and copies fragments of the books concerned are bumped
+# as well, and the book list when availability changes.
+# Returned copies are set aside for the first waiting holds on their books,
+# see catalog/holds.py.
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import BOOK_LIST, book_stamp, bump_stamps, copies_stamp
+from .counters import copies_moved
+from .holds import allocate_copies
+from .models import BookInstance
+from .stats import invalidate_catalog_stats
+
+# Outcomes reported per copy
+RENEWED = 'renewed'
+RETURNED = 'returned'
+RESERVED = 'returned and reserved for a hold'
+NOT_FOUND = 'not found'
+NOT_ON_LOAN = 'not on loan'
+
+
+def _on_loan(copy_ids):
+    """Split copy_ids into a {id: book_id} dict of copies on loan and a report."""
+    rows = BookInstance.objects.filter(pk__in=copy_ids).values_list('pk', 'book_id', 'status')
+    found = {pk: (book_id, status) for pk, book_id, status in rows}
+    on_loan = {}
+    report = {}
+    for pk in copy_ids:
+        if pk not in found:
+            report[pk] = NOT_FOUND
+        elif found[pk][1] != 'o':
+            report[pk] = NOT_ON_LOAN
+        else:
+            on_loan[pk] = found[pk][0]
+    return on_loan, report
+
+
+@transaction.atomic
+def renew_copies(copy_ids, renewal_date):
+    """Set the due date of the given copies on loan; return {copy id: outcome}.
+
+    The date is expected to have been validated already (see BulkLoanForm).
+    """
+    on_loan, report = _on_loan(copy_ids)
+    if on_loan:
+        BookInstance.objects.filter(pk__in=on_loan, status__exact='o').update(
+            due_back=renewal_date,
+            updated_at=timezone.now(),
+            version=F('version') + 1,
+        )
+        bump_stamps([*map(book_stamp, set(on_loan.values())), *map(copies_stamp, set(on_loan.values()))])
+    report.update(dict.fromkeys(on_loan, RENEWED))
+    return {pk: report[pk] for pk in copy_ids}
+
+
+@transaction.atomic
+def return_copies(copy_ids):
+    """Mark the given copies on loan as available again; return {copy id: outcome}."""
+    on_loan, report = _on_loan(copy_ids)
+    if on_loan:
+        BookInstance.objects.filter(pk__in=on_loan, status__exact='o').update(
+            status='a',
+            due_back=None,
+            borrower=None,
+            updated_at=timezone.now(),
+            version=F('version') + 1,
+        )
+        bump_stamps([BOOK_LIST, *map(book_stamp, set(on_loan.values())), *map(copies_stamp, set(on_loan.values()))])
+        for book_id, returned in Counter(on_loan.values()).items():
+            copies_moved((book_id, 'o'), (book_id, 'a'), returned)
+        invalidate_catalog_stats()
+        transaction.on_commit(invalidate_catalog_stats)
+    report.update(dict.fromkeys(on_loan, RETURNED))
+    for book_id in set(on_loan.values()):
+        reserved = allocate_copies(book_id)
+        report.update(dict.fromkeys(reserved.keys() & on_loan.keys(), RESERVED))
+    return {pk: report[pk] for pk in copy_ids}
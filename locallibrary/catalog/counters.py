@@ -0,0 +1,168 @@
+## Maintained counters for the catalog
+# Genre and Language carry the number of books they hold and of those books'
+# copies that are available (book_count, available_count), so that genre and
+# language facets are read from one row instead of joining and counting.
+# Book carries the number of its copies, in all and per status (copy_count,
+# available_count, on_loan_count, ...), for the availability shown in the
+# book pages and the "available only" filter.
+# The counters are moved by single UPDATE ... SET x = x + n statements from
+# the signal receivers in catalog/signals.py, and by the code that writes
+# copies with queryset.update() or bulk_create(). recount_genre_language_counts()
+# and recount_book_counts() recompute them from scratch ("manage.py
+# repair_counters").
+
+from collections import Counter
+
+from django.db.models import Count, F, IntegerField, Max, Min, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Book, BookInstance, Genre, Language
+
+
+def _bump(queryset, **deltas):
+    """Add the given deltas to counter fields of every row in queryset."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        queryset.update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def available_copies(book_ids):
+    """Return the number of available copies across the given books."""
+    return BookInstance.objects.filter(book__in=book_ids, status__exact='a').count()
+
+
+def books_added(model, pks, book_ids, sign=1):
+    """Count books as added to (sign=1) or removed from (sign=-1) genres or languages.
+
+    Each book is counted once in each of the ``pks`` rows of ``model``.
+    """
+    book_ids = list(book_ids)
+    if not pks or not book_ids:
+        return
+    _bump(
+        model.objects.filter(pk__in=pks),
+        book_count=sign * len(book_ids),
+        available_count=sign * available_copies(book_ids),
+    )
+
+
+def copy_availability_changed(book_id, delta):
+    """Move available_count of the genres and languages of a book by delta."""
+    if book_id is None or not delta:
+        return
+    _bump(Genre.objects.filter(book=book_id), available_count=delta)
+    _bump(Language.objects.filter(book=book_id), available_count=delta)
+
+
+def copy_counter_deltas(status, count=1):
+    """Return the Book counter deltas for ``count`` copies in ``status``."""
+    deltas = Counter(copy_count=count)
+    if status in Book.STATUS_COUNTERS:
+        deltas[Book.STATUS_COUNTERS[status]] += count
+    return deltas
+
+
+def copies_moved(old, new, count=1):
+    """Update the counters for ``count`` copies moving from old to new.
+
+    old and new are (book id, status) pairs; (None, None) stands for copies
+    that did not exist yet, or no longer exist.
+    """
+    if old == new:
+        return
+    deltas = {}
+    (old_book, old_status), (new_book, new_status) = old, new
+    if old_book is not None:
+        deltas[old_book] = copy_counter_deltas(old_status, -count)
+    if new_book is not None:
+        deltas.setdefault(new_book, Counter()).update(copy_counter_deltas(new_status, count))
+    for book_id, fields in deltas.items():
+        _bump(Book.objects.filter(pk=book_id), **fields)
+        copy_availability_changed(book_id, fields['available_count'])
+
+
+def apply_counter_deltas(model, deltas):
+    """Apply {pk: {field: delta}} to the counters of model, one UPDATE per row.
+
+    Used by bulk loads, which bypass the model signals.
+    """
+    for pk, fields in deltas.items():
+        _bump(model.objects.filter(pk=pk), **fields)
+
+
+def recount_genre_language_counts():
+    """Recompute every genre and language counter, one UPDATE per table."""
+    for model, relation in [(Genre, 'genre'), (Language, 'language')]:
+        books = (
+            Book.objects.filter(**{relation: OuterRef('pk')})
+            .order_by()
+            .values(relation)
+            .annotate(n=Count('pk'))
+            .values('n')
+        )
+        copies = (
+            BookInstance.objects.filter(**{f'book__{relation}': OuterRef('pk')}, status__exact='a')
+            .order_by()
+            .values(f'book__{relation}')
+            .annotate(n=Count('pk'))
+            .values('n')
+        )
+        model.objects.update(
+            book_count=Coalesce(Subquery(books, output_field=IntegerField()), Value(0)),
+            available_count=Coalesce(Subquery(copies, output_field=IntegerField()), Value(0)),
+        )
+
+
+def _copies_subquery(**filters):
+    copies = (
+        BookInstance.objects.filter(book=OuterRef('pk'), **filters)
+        .order_by()
+        .values('book')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    return Coalesce(Subquery(copies, output_field=IntegerField()), Value(0))
+
+
+def book_count_expressions():
+    """Return {counter field: expression counting the copies} for Book."""
+    expressions = {'copy_count': _copies_subquery()}
+    for status, field in Book.STATUS_COUNTERS.items():
+        expressions[field] = _copies_subquery(status__exact=status)
+    return expressions
+
+
+def recount_book_counts(book_ids=None):
+    """Recompute the copy counters of the given books (default all) in one UPDATE."""
+    books = Book.objects.all() if book_ids is None else Book.objects.filter(pk__in=book_ids)
+    # queryset.update() leaves updated_at alone: availability is not part of
+    # the exported book record.
+    return books.update(**book_count_expressions())
+
+
+def recount_all_book_counts(chunk_size=5000):
+    """Recompute the copy counters of every book, one UPDATE per range of ids.
+
+    Each UPDATE covers at most ``chunk_size`` consecutive ids, so no statement
+    holds the write lock for long on a large catalog. Returns the number of
+    books recounted.
+    """
+    bounds = Book.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    total = 0
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        books = Book.objects.filter(pk__gte=start, pk__lt=start + chunk_size)
+        total += books.update(**book_count_expressions())
+    return total
+
+
+def books_with_wrong_counts(books=None):
+    """Return the books (of the given queryset) whose counters disagree with their copies."""
+    books = Book.objects.all() if books is None else books
+    expressions = book_count_expressions()
+    books = books.annotate(**{f'actual_{field}': expression for field, expression in expressions.items()})
+    wrong = Q()
+    for field in expressions:
+        wrong |= ~Q(**{field: F(f'actual_{field}')})
+    return books.filter(wrong)
@@ -0,0 +1,134 @@
+## Faceted browsing of the catalog
+# The browse page filters the books on genre, language, author and
+# availability, one value per facet, and shows next to every value of a
+# facet the number of books the page lists once that value is selected. A
+# value replaces the one selected in its facet, so each facet is counted
+# over the books matching the other facets' selections only. All the
+# counts of a filter take four queries, however many values the facets
+# have: a GROUP BY over the genre links and one over the language links of
+# the books, a GROUP BY of the books on their author and one aggregate for
+# availability, read from the maintained available_count of the books.
+# When no other facet is selected, the genre and language counts are the
+# maintained book_count columns instead (see catalog/counters.py).
+#
+# The counts of a filter are kept in the cache under the filter and the
+# "book-list" and "facets" version stamps (see catalog/caching.py), so the
+# popular combinations are computed once per catalog change and the rare
+# ones simply expire.
+
+import hashlib
+from dataclasses import asdict, dataclass, replace
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils.http import urlencode
+
+from .caching import BOOK_LIST, FACETS, VIEW_CACHE_TIMEOUT, get_stamps
+from .models import Book, Genre, Language
+
+# The author facet lists the authors with the most books in the result.
+AUTHOR_FACET_SIZE = 20
+
+
+def _id(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+@dataclass(frozen=True)
+class FacetFilter:
+    """The facet values selected on the browse page, one per facet at most."""
+
+    genre: int = None
+    language: int = None
+    author: int = None
+    available: bool = False
+
+    @classmethod
+    def from_query(cls, query):
+        """Read the filter from request.GET; malformed values are ignored."""
+        return cls(
+            genre=_id(query.get('genre')),
+            language=_id(query.get('language')),
+            author=_id(query.get('author')),
+            available=query.get('available') == '1',
+        )
+
+    def params(self):
+        """Return the filter as query string parameters."""
+        params = {name: value for name, value in asdict(self).items() if value}
+        if self.available:
+            params['available'] = 1
+        return params
+
+    def query(self, **changes):
+        """Return the query string of this filter with the given facets changed."""
+        return urlencode(replace(self, **changes).params())
+
+    def apply(self, books):
+        """Filter a Book queryset."""
+        if self.genre:
+            books = books.filter(genre=self.genre)
+        if self.language:
+            books = books.filter(language=self.language)
+        if self.author:
+            books = books.filter(author=self.author)
+        if self.available:
+            books = books.filter(available_count__gt=0)
+        return books
+
+
+def _link_counts(facet_filter, facet, model):
+    """Return (id, name, number of books) of the genres or languages, see module comment."""
+    others = replace(facet_filter, **{facet: None})
+    if others == FacetFilter():
+        return model.objects.filter(book_count__gt=0).values_list('pk', 'name', 'book_count')
+    links = getattr(Book, facet).through.objects
+    return (
+        links.filter(book__in=others.apply(Book.objects.order_by()).values('pk'))
+        .values_list(f'{facet}_id', f'{facet}__name')
+        .annotate(count=Count('book_id'))
+    )
+
+
+def compute_facet_counts(facet_filter):
+    """Run the facet queries for a filter, see module comment."""
+    genres = _link_counts(facet_filter, 'genre', Genre)
+    languages = _link_counts(facet_filter, 'language', Language)
+    authors = (
+        replace(facet_filter, author=None).apply(Book.objects.order_by())
+        .filter(author__isnull=False)
+        .values_list('author_id', 'author__last_name', 'author__first_name')
+        .annotate(count=Count('pk'))
+        .order_by('-count', 'author__last_name', 'author__first_name')[:AUTHOR_FACET_SIZE]
+    )
+    totals = replace(facet_filter, available=False).apply(Book.objects.order_by()).aggregate(
+        books=Count('pk'), available=Count('pk', filter=Q(available_count__gt=0)),
+    )
+
+    def by_count(rows):
+        return sorted(rows, key=lambda row: (-row[2], row[1]))
+
+    return {
+        'books': totals['available'] if facet_filter.available else totals['books'],
+        'available': totals['available'],
+        'genre': by_count(genres),
+        'language': by_count(languages),
+        'author': [(pk, f'{last_name}, {first_name}', count) for pk, last_name, first_name, count in authors],
+    }
+
+
+def get_facet_counts(facet_filter):
+    """Return the facet counts of a filter, computing them only on a cache miss.
+
+    Returns a dict: 'books' (number of books in the result), 'available'
+    (number of them with a copy available, availability left out of the
+    filter), and for 'genre', 'language' and 'author' a list of (id, name,
+    number of books with that value selected) by decreasing number.
+    """
+    tokens = get_stamps([BOOK_LIST, FACETS])
+    digest = hashlib.md5('\n'.join([facet_filter.query(), *tokens]).encode()).hexdigest()
+    return cache.get_or_set(f'catalog:facets:{digest}', lambda: compute_facet_counts(facet_filter), VIEW_CACHE_TIMEOUT)
@@ -4,15 +4,22 @@
 from django import forms
 
 import datetime
+import uuid
 
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
+from .models import BookInstance
+
+CONFLICT_MESSAGE = _('This copy was changed by someone else since you opened it. Reload the page and try again.')
+
 # remember  from the testing perspective 
 # this form has one field which will have a label and the help text which 
 # we will need to verify
 class RenewBookForm(forms.Form):
     renewal_date = forms.DateField(help_text="Enter a date between now and 4 weeks (default 3).")
+    # BookInstance.version when the form was shown, see renew_book_librarian.
+    version = forms.IntegerField(required=False, widget=forms.HiddenInput)
 
     def clean_renewal_date(self):
         ## this is the step that gets the  data already converted 
@@ -23,13 +30,116 @@ class RenewBookForm(forms.Form):
         ## then we call the value of the dictionary as below
         data = self.cleaned_data['renewal_date']
 
-        # Check if a date is not in the past.
-        if data < datetime.date.today():
-            raise ValidationError(_('Invalid date - renewal in past'))
-
-        # Check if a date is in the allowed range (+4 weeks from today).
-        if data > datetime.date.today() + datetime.timedelta(weeks=4):
-            raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
+        # The rules are shared with the bulk renewal form below.
+        check_renewal_date(data)
 
         # Remember to always return the cleaned data.
         return data
+
+
+def check_renewal_date(data):
+    """Raise ValidationError unless data is between today and 4 weeks ahead."""
+    # Check if a date is not in the past.
+    if data < datetime.date.today():
+        raise ValidationError(_('Invalid date - renewal in past'))
+
+    # Check if a date is in the allowed range (+4 weeks from today).
+    if data > datetime.date.today() + datetime.timedelta(weeks=4):
+        raise ValidationError(_('Invalid date - renewal more than 4 weeks ahead'))
+
+
+# Filters for the librarians' "all borrowed" list. Every field maps onto a
+# condition in the SQL query of AllLoanedBooksListView, none is applied in Python.
+class LoanFilterForm(forms.Form):
+    overdue = forms.BooleanField(required=False, help_text="Only copies past their due date.")
+    due_this_week = forms.BooleanField(required=False, help_text="Only copies due in the next 7 days.")
+    borrower = forms.CharField(required=False, max_length=150, help_text="Username of the borrower.")
+
+
+class MultipleValueTextarea(forms.Textarea):
+    """Textarea that also accepts the field posted several times."""
+
+    def value_from_datadict(self, data, files, name):
+        if hasattr(data, 'getlist'):
+            return data.getlist(name)
+        return data.get(name)
+
+
+# A list of copy ids, posted either as several values (checkboxes on the
+# all-borrowed page) or pasted into one box separated by spaces, commas or
+# new lines.
+class CopyIdListField(forms.Field):
+    widget = MultipleValueTextarea
+
+    def to_python(self, value):
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = [value]
+        ids = []
+        for item in value:
+            for text in item.replace(',', ' ').split():
+                try:
+                    ids.append(uuid.UUID(text))
+                except ValueError:
+                    raise ValidationError(_('Invalid copy id: %(id)s'), params={'id': text})
+        # Keep the order given but drop repeats
+        return list(dict.fromkeys(ids))
+
+    def prepare_value(self, value):
+        if isinstance(value, (list, tuple)):
+            return '\n'.join(str(item) for item in value)
+        return value
+
+
+# Bulk renew or return for librarians (catalog/circulation.py). The renewal
+# date is checked once for all the copies, with the RenewBookForm rules.
+class BulkLoanForm(forms.Form):
+    ACTIONS = (
+        ('renew', _('Renew')),
+        ('return', _('Mark returned')),
+    )
+
+    copies = CopyIdListField(help_text="Copy ids, one per line.")
+    action = forms.ChoiceField(choices=ACTIONS)
+    renewal_date = forms.DateField(required=False, help_text="Enter a date between now and 4 weeks (default 3).")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('action') == 'renew':
+            renewal_date = cleaned_data.get('renewal_date')
+            if renewal_date is None:
+                if 'renewal_date' not in self.errors:
+                    self.add_error('renewal_date', _('A renewal date is needed to renew copies.'))
+            else:
+                try:
+                    check_renewal_date(renewal_date)
+                except ValidationError as e:
+                    self.add_error('renewal_date', e)
+        return cleaned_data
+
+
+# Admin change form for copies: the version of the copy when the form was
+# shown is posted back, and the form refuses to save over a newer change.
+# (BookInstance.version is not editable, hence the separate field name.)
+class BookInstanceAdminForm(forms.ModelForm):
+    loaded_version = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
+    class Meta:
+        model = BookInstance
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.instance._state.adding:
+            self.initial.setdefault('loaded_version', self.instance.version)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        version = cleaned_data.get('loaded_version')
+        if version is not None and not self.instance._state.adding:
+            if version != self.instance.version:
+                raise ValidationError(CONFLICT_MESSAGE, code='conflict')
+            # Checked again by BookInstance.save() in the UPDATE itself.
+            self.instance.version = version
+        return cleaned_data
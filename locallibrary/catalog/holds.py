@@ -0,0 +1,175 @@
+## Holds: the reservation queue of a book
+# A patron places a hold on a book and waits in its queue (catalog.models.Hold).
+# Whenever a copy of the book is available while holds are waiting, the copy
+# is set aside for the first of them: the copy becomes "Reserved" (with the
+# patron as its borrower) and the hold "Ready for collection". This happens
+# when a hold is placed, when copies are returned (return_copies() in
+# catalog/circulation.py) and when a ready hold is cancelled.
+#
+# Allocation never locks the queue. It reads the head of the queue and an
+# available copy, then claims each with a short UPDATE that only matches if
+# the row is still in the state it was read in: of two returns racing for the
+# same hold, one UPDATE matches and the other matches no row and moves on to
+# the next hold. Both claims are made in one savepoint, so a copy is never
+# left reserved for nobody.
+# The UPDATEs send no model signals, so the copy counters, statistics and
+# cached pages are updated here, as in catalog/circulation.py.
+# A reserved copy saved with another status (from the admin, say) no longer
+# serves its ready hold: the receivers in catalog/signals.py call
+# copy_left_reserve(), which marks the hold collected if the copy was lent to
+# its patron and otherwise puts it back at the front of the queue. The same
+# receivers allocate copies once the transaction commits whenever a copy is
+# saved as available (returned or back from maintenance in the admin, say)
+# or a hold goes back in the queue (allocate_on_commit()).
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import BOOK_LIST, book_stamp, bump_stamps, copies_stamp
+from .counters import copies_moved
+from .models import BookInstance, Hold
+from .stats import invalidate_catalog_stats
+
+
+class _Taken(Exception):
+    """The hold or copy read for an allocation was claimed by someone else."""
+
+
+def _copies_changed(book_id, old_status, new_status, count):
+    """Update the derived data after count copies of a book changed status."""
+    if not count:
+        return
+    copies_moved((book_id, old_status), (book_id, new_status), count)
+    bump_stamps([BOOK_LIST, book_stamp(book_id), copies_stamp(book_id)])
+    invalidate_catalog_stats()
+    transaction.on_commit(invalidate_catalog_stats)
+
+
+def _claim(hold_id, patron_id, copy_id, now):
+    """Set the copy aside for the hold, or raise _Taken if either was claimed meanwhile."""
+    copies = BookInstance.objects.filter(pk=copy_id, status__exact='a')
+    if not copies.update(status='r', borrower=patron_id, due_back=None, updated_at=now, version=F('version') + 1):
+        raise _Taken
+    if not Hold.objects.filter(pk=hold_id, status__exact='w').update(status='r', copy=copy_id, ready_at=now):
+        raise _Taken
+
+
+@transaction.atomic
+def allocate_copies(book_id):
+    """Set available copies of the book aside for its first waiting holds.
+
+    Returns {copy id: hold id} for the copies set aside.
+    """
+    allocated = {}
+    now = timezone.now()
+    while True:
+        # Served by hold_queue_idx and bookinst_book_status_idx.
+        head = Hold.objects.waiting().filter(book_id=book_id).order_by('id').values_list('pk', 'patron_id').first()
+        if head is None:
+            break
+        shelf = BookInstance.objects.filter(book_id=book_id, status__exact='a').order_by().values_list('pk', flat=True)
+        copy_ids = list(shelf[:1])
+        if not copy_ids:
+            break
+        copy_id = copy_ids[0]
+        try:
+            with transaction.atomic():
+                _claim(*head, copy_id, now)
+        except _Taken:
+            continue
+        except IntegrityError:
+            # hold_one_ready_per_copy: a ready hold still names the copy,
+            # which was put back on the shelf behind the signals. That hold
+            # lost its copy; queue it again and retry.
+            release_copy_holds([copy_id])
+            continue
+        allocated[copy_id] = head[0]
+    _copies_changed(book_id, 'a', 'r', len(allocated))
+    return allocated
+
+
+def release_copy_holds(copy_ids):
+    """Put the ready holds of the given copies back in the queue; return how many.
+
+    A hold keeps its id, and with it its place at the front of the queue.
+    """
+    return Hold.objects.filter(copy__in=copy_ids, status__exact='r').update(status='w', copy=None, ready_at=None)
+
+
+def copy_left_reserve(copy_id, status, borrower_id):
+    """Update the ready hold of a reserved copy that was saved with another status.
+
+    Returns the number of holds put back in the queue.
+    """
+    holds = Hold.objects.filter(copy=copy_id, status__exact='r')
+    if status == 'o' and holds.filter(patron=borrower_id).update(status='c'):
+        return 0
+    return release_copy_holds([copy_id])
+
+
+def allocate_on_commit(book_id):
+    """Allocate the available copies of the book once the current transaction commits."""
+    if book_id is not None:
+        transaction.on_commit(lambda: allocate_copies(book_id))
+
+
+@transaction.atomic
+def place_hold(book_id, patron):
+    """Queue patron for the book and return their Hold.
+
+    A patron already queued for the book gets their existing hold back.
+    """
+    try:
+        with transaction.atomic():
+            hold = Hold.objects.create(book_id=book_id, patron=patron)
+    except IntegrityError:
+        # hold_one_active_per_patron
+        return Hold.objects.active().get(book_id=book_id, patron=patron)
+    if allocate_copies(book_id):
+        hold.refresh_from_db()
+    return hold
+
+
+@transaction.atomic
+def cancel_hold(hold):
+    """Cancel a waiting or ready hold; return False if it was no longer active.
+
+    The copy set aside for a ready hold goes to the next hold in the queue,
+    or back on the shelf.
+    """
+    if not Hold.objects.filter(pk=hold.pk, status__exact='w').update(status='x'):
+        if not Hold.objects.filter(pk=hold.pk, status__exact='r').update(status='x'):
+            return False
+        hold.refresh_from_db()
+        released = BookInstance.objects.filter(pk=hold.copy_id, status__exact='r').update(
+            status='a', borrower=None, updated_at=timezone.now(), version=F('version') + 1,
+        )
+        _copies_changed(hold.book_id, 'r', 'a', released)
+        allocate_copies(hold.book_id)
+    hold.refresh_from_db()
+    return True
+
+
+@transaction.atomic
+def lend_held_copy(hold, due_back):
+    """Lend the copy set aside for a ready hold to its patron; return False if not ready.
+
+    Nothing is written unless both the hold is still ready and its copy still
+    reserved.
+    """
+    try:
+        with transaction.atomic():
+            if not Hold.objects.filter(pk=hold.pk, status__exact='r').update(status='c'):
+                raise _Taken
+            hold.refresh_from_db()
+            lent = BookInstance.objects.filter(pk=hold.copy_id, status__exact='r').update(
+                status='o', borrower=hold.patron_id, due_back=due_back, updated_at=timezone.now(), version=F('version') + 1,
+            )
+            if not lent:
+                raise _Taken
+    except _Taken:
+        hold.refresh_from_db()
+        return False
+    _copies_changed(hold.book_id, 'r', 'o', lent)
+    return True
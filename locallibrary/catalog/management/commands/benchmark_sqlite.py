@@ -0,0 +1,148 @@
+## manage.py benchmark_sqlite
+# Measures read and write throughput of SQLite under concurrent load with
+# the default connection setup and with the production profile configured
+# in settings.py (SQLITE_PRAGMAS, BEGIN IMMEDIATE, persistent connections).
+#
+# Each profile gets a scratch database file holding a copies table like
+# catalog_bookinstance. Worker threads then run a mix of loan list reads and
+# renewals (read the copy, then update it, in one transaction) for a fixed
+# time; a renewal that fails with "database is locked" is counted as an
+# error. With the default profile every operation opens its own connection,
+# as Django does per request when CONN_MAX_AGE is 0.
+# The production database is never touched.
+
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE copy (
+    id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL,
+    due_back TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX copy_status_due ON copy (status, due_back);
+"""
+
+
+def profiles():
+    return {
+        "default": {"pragmas": {}, "begin": "BEGIN", "persistent": False},
+        "production": {"pragmas": settings.SQLITE_PRAGMAS, "begin": "BEGIN IMMEDIATE", "persistent": True},
+    }
+
+
+def connect(path, pragmas):
+    # isolation_level=None: the statements below manage the transactions.
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name}={value}")
+    return connection
+
+
+def create_database(path, rows, pragmas):
+    connection = connect(path, pragmas)
+    connection.executescript(SCHEMA)
+    today = datetime.date.today()
+    connection.execute("BEGIN")
+    connection.executemany(
+        "INSERT INTO copy (id, status, due_back) VALUES (?, ?, ?)",
+        [
+            (pk, "o" if pk % 3 else "a", (today + datetime.timedelta(days=pk % 60 - 30)).isoformat())
+            for pk in range(1, rows + 1)
+        ],
+    )
+    connection.execute("COMMIT")
+    connection.close()
+
+
+def worker(path, profile, rows, write_ratio, deadline, seed, results):
+    rng = random.Random(seed)
+    persistent = connect(path, profile["pragmas"]) if profile["persistent"] else None
+    counts = Counter()
+    today = datetime.date.today().isoformat()
+    while time.perf_counter() < deadline:
+        connection = persistent or connect(path, profile["pragmas"])
+        kind = "writes" if rng.random() < write_ratio else "reads"
+        try:
+            if kind == "reads":
+                connection.execute(
+                    "SELECT id, due_back FROM copy WHERE status = 'o' AND due_back < ? "
+                    "ORDER BY due_back LIMIT 20",
+                    [today],
+                ).fetchall()
+            else:
+                pk = rng.randint(1, rows)
+                connection.execute(profile["begin"])
+                try:
+                    connection.execute("SELECT version FROM copy WHERE id = ?", [pk]).fetchone()
+                    connection.execute(
+                        "UPDATE copy SET due_back = ?, version = version + 1 WHERE id = ?", [today, pk]
+                    )
+                    connection.execute("COMMIT")
+                except sqlite3.Error:
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                    raise
+            counts[kind] += 1
+        except sqlite3.OperationalError:
+            counts[f"{kind} errors"] += 1
+        finally:
+            if persistent is None:
+                connection.close()
+    if persistent is not None:
+        persistent.close()
+    results.append(counts)
+
+
+class Command(BaseCommand):
+    help = "Compare SQLite throughput with the default and the production connection profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each run.")
+        parser.add_argument("--writes", type=float, default=0.2, help="Share of operations that write.")
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--profile", action="append", choices=sorted(profiles()), dest="profiles")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['threads']} threads, {options['seconds']}s per run, "
+            f"{options['writes']:.0%} writes, {options['rows']} rows"
+        )
+        self.stdout.write(f"{'profile':<12}{'reads/s':>10}{'writes/s':>10}{'locked':>8}")
+        for name in options["profiles"] or ["default", "production"]:
+            counts = self.run(profiles()[name], options)
+            seconds = options["seconds"]
+            self.stdout.write(
+                f"{name:<12}{counts['reads'] / seconds:>10.0f}{counts['writes'] / seconds:>10.0f}"
+                f"{counts['reads errors'] + counts['writes errors']:>8}"
+            )
+
+    def run(self, profile, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark.sqlite3")
+            create_database(path, options["rows"], profile["pragmas"])
+            results = []
+            deadline = time.perf_counter() + options["seconds"]
+            threads = [
+                threading.Thread(
+                    target=worker,
+                    args=(path, profile, options["rows"], options["writes"], deadline, seed, results),
+                )
+                for seed in range(options["threads"])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return sum(results, Counter())
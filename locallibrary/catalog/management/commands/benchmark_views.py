@@ -0,0 +1,105 @@
+## manage.py benchmark_views
+# Times every catalog page and admin changelist against the current
+# database, see catalog/benchmarks.py. The results can be saved as JSON
+# (--output) and compared with an earlier run (--compare) to spot pages
+# that became slower or run more queries.
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.benchmarks import compare_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure latency, query count and peak memory of the catalog and admin pages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Timed requests per page (default 20).",
+        )
+        parser.add_argument(
+            "--cold", action="store_true", help="Clear the cache before every request."
+        )
+        parser.add_argument(
+            "--page",
+            action="append",
+            dest="pages",
+            help="Only benchmark the named page.",
+        )
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--compare", help="JSON file of an earlier run to compare with."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Growth of p95 latency reported as a regression (default 0.2, i.e. 20%%).",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error when a page regressed against --compare.",
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"], encoding="utf-8") as stream:
+                    baseline = json.load(stream)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        self.stdout.write(
+            f"{'page':<40}{'status':>7}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KiB':>10}"
+        )
+        results = run_benchmarks(
+            repeat=options["repeat"],
+            cold=options["cold"],
+            names=options["pages"],
+            progress=self.write_result,
+        )
+        scale = ", ".join(f"{count} {name}" for name, count in results["scale"].items())
+        self.stdout.write(f"Catalog: {scale}")
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                json.dump(results, stream, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = self.write_comparison(
+                compare_results(results, baseline, options["tolerance"]), baseline
+            )
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{regressions} page(s) regressed.")
+
+    def write_result(self, result):
+        self.stdout.write(
+            f"{result['name']:<40}{result['status']:>7}{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+            f"{result['queries']:>9}{result['peak_kb']:>10.0f}"
+        )
+
+    def write_comparison(self, comparison, baseline):
+        scale = ", ".join(
+            f"{count} {name}" for name, count in baseline["scale"].items()
+        )
+        self.stdout.write(
+            f"\nCompared with the run of {baseline['created']} ({scale}):"
+        )
+        regressions = 0
+        for name, ratio, queries, regressed in comparison:
+            line = f"{name:<40}p95 x{ratio:.2f}  queries {queries:+d}"
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(f"{line}  REGRESSION"))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,51 @@
+## manage.py export_catalog
+# Writes a streaming export of books or copies (catalog/export.py) to a file
+# or standard output, e.g. for the nightly data warehouse load.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.export import EXPORTS, FORMATS, export_lines, parse_since
+
+
+class Command(BaseCommand):
+    help = "Export every book or copy as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(EXPORTS))
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument(
+            "--since",
+            help="Only rows written at or after this ISO date or datetime.",
+        )
+        parser.add_argument(
+            "--output",
+            "-o",
+            help="File to write (default: standard output).",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = parse_since(options["since"])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        lines = export_lines(options["kind"], options["format"], since)
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as f:
+                count = self.write_lines(f, lines)
+            self.stderr.write(f"Wrote {count} lines to {options['output']}.")
+        else:
+            self.write_lines(self.stdout, lines)
+
+    def write_lines(self, out, lines):
+        count = 0
+        for line in lines:
+            # The lines carry their own line endings.
+            if out is self.stdout:
+                out.write(line, ending="")
+            else:
+                out.write(line)
+            count += 1
+        return count
@@ -0,0 +1,78 @@
+## manage.py generate_catalog
+# Fills the database with a synthetic catalog for benchmarks, see
+# catalog/synthetic.py. Meant for a scratch database (DJANGO_DB_NAME).
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.synthetic import SCALES, CatalogGenerator, synthetic_data_exists
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic books, copies, patrons and Zipf distributed loans."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            choices=list(SCALES),
+            default="small",
+            help="Preset sizes: "
+            + "; ".join(
+                f"{name}: {books} books, {copies} copies, {patrons} patrons, {loans} loans"
+                for name, (books, copies, patrons, loans) in SCALES.items()
+            ),
+        )
+        parser.add_argument(
+            "--books", type=int, help="Number of books (overrides the scale)."
+        )
+        parser.add_argument(
+            "--copies",
+            type=int,
+            help="Approximate number of copies (overrides the scale).",
+        )
+        parser.add_argument(
+            "--patrons", type=int, help="Number of patrons (overrides the scale)."
+        )
+        parser.add_argument(
+            "--loans",
+            type=int,
+            help="Number of loans drawn (overrides the scale); fewer are made when "
+            "the most popular books run out of copies.",
+        )
+        parser.add_argument(
+            "--zipf",
+            type=float,
+            default=1.1,
+            help="Exponent of the Zipf distribution of loans over books (default 1.1).",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Random seed (default 0)."
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of books loaded per transaction (default 1000).",
+        )
+
+    def handle(self, *args, **options):
+        if synthetic_data_exists():
+            raise CommandError(
+                "The database already holds synthetic data; use a fresh database."
+            )
+        books, copies, patrons, loans = SCALES[options["scale"]]
+        generator = CatalogGenerator(
+            books=options["books"] if options["books"] is not None else books,
+            copies=options["copies"] if options["copies"] is not None else copies,
+            patrons=options["patrons"] if options["patrons"] is not None else patrons,
+            loans=options["loans"] if options["loans"] is not None else loans,
+            seed=options["seed"],
+            exponent=options["zipf"],
+            chunk_size=options["chunk_size"],
+        )
+        report = generator.run()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {report.books} books, {report.copies} copies, {report.patrons} patrons "
+                f"and {report.loans} loans in {report.elapsed:.1f}s."
+            )
+        )
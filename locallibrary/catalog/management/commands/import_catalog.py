@@ -0,0 +1,61 @@
+## manage.py import_catalog
+# Streams a CSV or JSON Lines vendor feed into the catalog, see
+# catalog/bulk_import.py for the record format.
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.bulk_import import CatalogImporter, read_records
+
+
+class Command(BaseCommand):
+    help = "Import books, authors and copies from a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for standard input.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="Input format (default: from the file extension).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of books loaded per transaction (default 1000).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"]
+        if format is None:
+            if path.endswith(".csv"):
+                format = "csv"
+            elif path.endswith((".jsonl", ".ndjson")):
+                format = "jsonl"
+            else:
+                raise CommandError("Cannot tell the format from the file name; use --format.")
+
+        importer = CatalogImporter(chunk_size=options["chunk_size"])
+        if path == "-":
+            report = importer.run(read_records(sys.stdin, format))
+        else:
+            try:
+                stream = open(path, newline="", encoding="utf-8")
+            except OSError as e:
+                raise CommandError(str(e))
+            with stream:
+                report = importer.run(read_records(stream, format))
+
+        for line_num, reason in report.rejected:
+            self.stderr.write(f"Rejected line {line_num}: {reason}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report.books} books and {report.copies} copies "
+                f"({report.authors} new authors, {report.genres} new genres, "
+                f"{report.languages} new languages) from {report.records} records "
+                f"in {report.elapsed:.1f}s ({report.rate:.0f} records/s); "
+                f"{report.duplicates} duplicate ISBNs skipped, {len(report.rejected)} rejected."
+            )
+        )
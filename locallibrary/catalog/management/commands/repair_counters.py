@@ -0,0 +1,50 @@
+## manage.py repair_counters
+# Recomputes the maintained counters (catalog/counters.py) from the copies
+# and the genre and language links, e.g. after a bulk load or a raw SQL fix
+# that bypassed the model signals. --check only reports the books whose copy
+# counters are wrong.
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.counters import (
+    books_with_wrong_counts,
+    recount_all_book_counts,
+    recount_genre_language_counts,
+)
+from catalog.stats import invalidate_catalog_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the book, genre and language counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Number of book ids recounted per UPDATE (default 5000).",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the number of books with wrong copy counters.",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            wrong = books_with_wrong_counts().count()
+            style = self.style.WARNING if wrong else self.style.SUCCESS
+            self.stdout.write(style(f"{wrong} books with wrong copy counters."))
+            return
+        started = time.perf_counter()
+        total = recount_all_book_counts(chunk_size=options["chunk_size"])
+        with transaction.atomic():
+            recount_genre_language_counts()
+        invalidate_catalog_stats()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Recounted {total} books, genres and languages in {elapsed:.1f}s.")
+        )
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0006_book_language"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="author",
+            name="date_of_death",
+            field=models.DateField(blank=True, null=True, verbose_name="died"),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["title", "id"], name="book_title_id_idx"),
+        ),
+    ]
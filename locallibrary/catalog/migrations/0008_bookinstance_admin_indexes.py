@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0007_book_title_id_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(fields=["due_back", "id"], name="bookinst_due_back_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(
+                fields=["status", "due_back"], name="bookinst_status_due_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0008_bookinstance_admin_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="author",
+            index=models.Index(
+                fields=["last_name", "first_name"], name="author_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(
+                fields=["book", "status"], name="bookinst_book_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(
+                condition=models.Q(("status", "o")),
+                fields=["borrower", "due_back"],
+                name="bookinst_loan_borrower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=models.Index(
+                condition=models.Q(("status", "o")),
+                fields=["due_back", "id"],
+                name="bookinst_loan_due_idx",
+            ),
+        ),
+    ]
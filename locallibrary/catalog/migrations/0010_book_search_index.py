@@ -0,0 +1,54 @@
+# Creates the FTS5 full-text index used by catalog/search.py and fills it
+# from the existing books. FTS5 is SQLite only; on other databases this
+# migration does nothing and search falls back to a plain filter.
+
+from django.db import migrations
+
+SEARCH_TABLE = "catalog_book_fts"
+SEARCH_COLUMNS = ("title", "summary", "author", "genre", "isbn")
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5({', '.join(SEARCH_COLUMNS)}, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    Book = apps.get_model("catalog", "Book")
+    placeholders = ", ".join(["%s"] * (len(SEARCH_COLUMNS) + 1))
+    insert_sql = f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES ({placeholders})"
+    books = (
+        Book.objects.select_related("author")
+        .prefetch_related("genre")
+        .iterator(chunk_size=2000)
+    )
+    with schema_editor.connection.cursor() as cursor:
+        for book in books:
+            author = (
+                f"{book.author.first_name} {book.author.last_name}"
+                if book.author
+                else ""
+            )
+            genres = " ".join(genre.name for genre in book.genre.all())
+            cursor.execute(
+                insert_sql,
+                [book.pk, book.title, book.summary, author, genres, book.isbn],
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP TABLE {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0009_loan_status_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:04
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model("catalog", "Book")
+    BookInstance = apps.get_model("catalog", "BookInstance")
+    for model_name, relation in [("Genre", "genre"), ("Language", "language")]:
+        model = apps.get_model("catalog", model_name)
+        books = (
+            Book.objects.filter(**{relation: OuterRef("pk")})
+            .order_by()
+            .values(relation)
+            .annotate(n=Count("pk"))
+            .values("n")
+        )
+        copies = (
+            BookInstance.objects.filter(
+                **{f"book__{relation}": OuterRef("pk")}, status="a"
+            )
+            .order_by()
+            .values(f"book__{relation}")
+            .annotate(n=Count("pk"))
+            .values("n")
+        )
+        model.objects.update(
+            book_count=Coalesce(Subquery(books, output_field=IntegerField()), Value(0)),
+            available_count=Coalesce(
+                Subquery(copies, output_field=IntegerField()), Value(0)
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0010_book_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="genre",
+            name="available_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="genre",
+            name="book_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="language",
+            name="available_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="language",
+            name="book_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
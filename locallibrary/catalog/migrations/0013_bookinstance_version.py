@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0012_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookinstance",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
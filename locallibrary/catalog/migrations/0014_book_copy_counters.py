@@ -0,0 +1,68 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+STATUS_COUNTERS = {
+    "m": "maintenance_count",
+    "o": "on_loan_count",
+    "a": "available_count",
+    "r": "reserved_count",
+}
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model("catalog", "Book")
+    BookInstance = apps.get_model("catalog", "BookInstance")
+
+    def copies(**filters):
+        counted = (
+            BookInstance.objects.filter(book=OuterRef("pk"), **filters)
+            .order_by()
+            .values("book")
+            .annotate(n=Count("pk"))
+            .values("n")
+        )
+        return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+    Book.objects.update(
+        copy_count=copies(),
+        **{field: copies(status=status) for status, field in STATUS_COUNTERS.items()},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0013_bookinstance_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="available_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="copy_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="maintenance_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="on_loan_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="reserved_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0014_book_copy_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Hold",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("w", "Waiting"),
+                            ("r", "Ready for collection"),
+                            ("c", "Collected"),
+                            ("x", "Cancelled"),
+                        ],
+                        default="w",
+                        max_length=1,
+                    ),
+                ),
+                ("placed_at", models.DateTimeField(auto_now_add=True)),
+                ("ready_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="catalog.book"
+                    ),
+                ),
+                (
+                    "copy",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="catalog.bookinstance",
+                    ),
+                ),
+                (
+                    "patron",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", "w")),
+                        fields=["book", "id"],
+                        name="hold_queue_idx",
+                    ),
+                    models.Index(
+                        condition=models.Q(("status__in", ["w", "r"])),
+                        fields=["patron", "id"],
+                        name="hold_patron_active_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("status__in", ["w", "r"])),
+                        fields=("book", "patron"),
+                        name="hold_one_active_per_patron",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("status", "r")),
+                        fields=("copy",),
+                        name="hold_one_ready_per_copy",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0015_holds"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="bookinstance",
+            name="bookinst_status_due_idx",
+        ),
+        migrations.AlterField(
+            model_name="bookinstance",
+            name="book",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.RESTRICT,
+                to="catalog.book",
+            ),
+        ),
+    ]
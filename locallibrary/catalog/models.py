@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.urls import (reverse,)               # USED IN THE get_absolute_url() method to get the URL for the specified ID
 from django.db.models import UniqueConstraint    #   Constrains a field to unique values
 from django.db.models.functions import (Lower,)  #  A function that converts a string to lowercase
@@ -18,7 +18,27 @@ from datetime import date                        #  A module that allows the man
 # The  model that contains the foreign Key field is on the many side of the relationship
 # while the model referenced by the ForeignKey is on the one side of the relationship
 
-class Genre(models.Model):
+class CounterFieldsMixin:
+    """Keep maintained counter columns out of ordinary saves.
+
+    The counters listed in ``counter_fields`` are only moved by UPDATE
+    statements (see catalog/counters.py). A plain save() of a row loaded
+    earlier must not write its possibly stale counter values back.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class Genre(CounterFieldsMixin, models.Model):
     """Model representing a book genre."""
 
     name = models.CharField(
@@ -27,6 +47,11 @@ class Genre(models.Model):
         help_text="""Enter a book genre (e.g. Science Fiction, 
                 French Poetry etc.)""",
     )
+    # Maintained counters (see catalog/counters.py): the number of books in
+    # this genre and of their copies available for loan.
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    available_count = models.PositiveIntegerField(default=0, editable=False)
+    counter_fields = ("book_count", "available_count")
 
     def __str__(self):
         """String for representing the Model object."""
@@ -58,7 +83,7 @@ class Genre(models.Model):
 # But this does not include a particular physical instance of a book (which would be a BookInstance).
 
 
-class Book(models.Model):
+class Book(CounterFieldsMixin, models.Model):
     """Model representing a book (but not a specific copy of a book)."""
 
     title = models.CharField(max_length=200)
@@ -92,6 +117,24 @@ class Book(models.Model):
 
     genre = models.ManyToManyField(Genre, help_text="Select a genre for this book")
     language = models.ManyToManyField("Language", help_text="Select languages for this book")
+    # Last time the row was written, for incremental exports (catalog/export.py).
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Maintained counters (see catalog/counters.py): the copies of this book,
+    # in all and per status, so that "3 of 7 copies available" is read from
+    # the book row instead of counting its copies.
+    copy_count = models.PositiveIntegerField(default=0, editable=False)
+    available_count = models.PositiveIntegerField(default=0, editable=False)
+    on_loan_count = models.PositiveIntegerField(default=0, editable=False)
+    reserved_count = models.PositiveIntegerField(default=0, editable=False)
+    maintenance_count = models.PositiveIntegerField(default=0, editable=False)
+    counter_fields = ("copy_count", "available_count", "on_loan_count", "reserved_count", "maintenance_count")
+    # The counter of the copies in each BookInstance.status
+    STATUS_COUNTERS = {
+        "m": "maintenance_count",
+        "o": "on_loan_count",
+        "a": "available_count",
+        "r": "reserved_count",
+    }
 
     # Using the Many to Many field to allow multiple languages to be associated with a book
     # Also multiple languages can have multiple books
@@ -102,16 +145,33 @@ class Book(models.Model):
     def get_absolute_url(self):
         """Returns the url to access a detail record for this book."""
         return reverse("book-detail", args=[str(self.id)])
+    # The display helpers slice in Python rather than in the query: slicing
+    # .all() would issue a new LIMIT query even when the genres or languages
+    # were already loaded with prefetch_related(), one query per book in lists.
     def display_genre(self):
         """Create a string for the Genre. This is required to display genre in Admin."""
-        return ", ".join([genre.name for genre in self.genre.all()[:3]])
+        return ", ".join([genre.name for genre in self.genre.all()][:3])
     def display_language(self):
         """Create a string for the Language. This is required to display language in Admin."""
-        return ", ".join([language.name for language in self.language.all()[:3]])
+        return ", ".join([language.name for language in self.language.all()][:3])
+
+    def copy_status_counts(self):
+        """Return (status, label, count) for each status some copies are in, from the counters."""
+        counts = [
+            (status, label, getattr(self, self.STATUS_COUNTERS[status]))
+            for status, label in BookInstance.LOAN_STATUS
+        ]
+        return [(status, label, count) for status, label, count in counts if count]
 
     display_genre.short_description = "Genre"
     display_language.short_description = "Language"
 
+    class Meta:
+        # Supports the (title, id) ordering and keyset seeks of the book list.
+        indexes = [
+            models.Index(fields=["title", "id"], name="book_title_id_idx"),
+        ]
+
     ## this model below is used to store information about the book Instance
     ## The BookInstance model represents a specific copy of a
     # book that someone might borrow and includes information about
@@ -127,15 +187,47 @@ class Book(models.Model):
 #Below is the Book Instance Model
 import uuid  # Required for unique book instances
 
+
+class ConcurrentUpdateError(Exception):
+    """Raised when a BookInstance was changed by someone else since it was loaded."""
+
+
+class BookInstanceQuerySet(models.QuerySet):
+    """Loan state of copies as SQL conditions, so that it is never worked out in Python."""
+
+    def on_loan(self):
+        return self.filter(status__exact="o")
+
+    def overdue(self, today=None):
+        """Copies on loan whose due date has passed.
+
+        status = 'o' AND due_back < today, served by the partial index
+        bookinst_loan_due_idx on (due_back, id) WHERE status = 'o'.
+        """
+        return self.on_loan().filter(due_back__lt=today or date.today())
+
+    def with_overdue(self, today=None):
+        """Annotate each copy with an overdue boolean computed by the database."""
+        return self.annotate(
+            overdue=models.ExpressionWrapper(
+                models.Q(status__exact="o", due_back__lt=today or date.today()),
+                output_field=models.BooleanField(),
+            )
+        )
+
+
 class BookInstance(models.Model):
     """Model representing a specific copy of a book (i.e. that can be borrowed from the library)."""
 
+    objects = BookInstanceQuerySet.as_manager()
+
     id = models.UUIDField(
         primary_key=True,
         default=uuid.uuid4,
         help_text="Unique ID for this particular book across whole library",
     )
-    book = models.ForeignKey("Book", on_delete=models.RESTRICT, null=True)
+    # Indexed by bookinst_book_status_idx, whose leading column it is.
+    book = models.ForeignKey("Book", on_delete=models.RESTRICT, null=True, db_index=False)
     imprint = models.CharField(max_length=200)
     due_back = models.DateField(null=True, blank=True)
 
@@ -160,17 +252,127 @@ class BookInstance(models.Model):
           null=True,
             blank=True
     )
+    # Last time the row was written, for incremental exports (catalog/export.py).
+    # Set explicitly by code that writes with queryset.update().
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Incremented by every write of the row; save() only writes when the
+    # stored version is still the one that was loaded (optimistic locking).
+    # Code that writes with queryset.update() must increment it too.
+    version = models.PositiveIntegerField(default=0, editable=False)
 # class Meta is used to  create permissions which can then be used by the administrator to grant access to certain users
     class Meta:
         ordering = ["due_back"]
         permissions = (("can_mark_returned", "Set book as returned"),)
+        # Back the due date ordering of the copies (the admin changelist, also
+        # when filtered on status or due date). The partial indexes only hold
+        # copies on loan, the rows the loan views read: a patron's loans by
+        # due date, and all loans by due date. (book, status) serves the
+        # copies of a book, by status or not, and stands in for the index of
+        # the book foreign key. Each is checked against the query it serves
+        # in catalog/tests/test_query_plans.py.
+        indexes = [
+            models.Index(fields=["due_back", "id"], name="bookinst_due_back_idx"),
+            models.Index(fields=["book", "status"], name="bookinst_book_status_idx"),
+            models.Index(
+                fields=["borrower", "due_back"],
+                condition=models.Q(status="o"),
+                name="bookinst_loan_borrower_idx",
+            ),
+            models.Index(
+                fields=["due_back", "id"],
+                condition=models.Q(status="o"),
+                name="bookinst_loan_due_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_loaded_values()
+
+    def _remember_loaded_values(self):
+        # Remember the stored values, so that save() can write only the
+        # changed columns and the signal handlers maintaining the availability
+        # counters can tell what a save changed.
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def changed_fields(self):
+        """Return the names of the fields changed since the row was loaded."""
+        loaded = getattr(self, "_loaded_values", {})
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.attname in self.__dict__
+            and (field.attname not in loaded or loaded[field.attname] != self.__dict__[field.attname])
+        ]
+
+    def save(self, *args, **kwargs):
+        """Save the copy, writing only the changed fields of a loaded row.
+
+        A row that was loaded from the database is only written if its stored
+        version is still the loaded one; otherwise ConcurrentUpdateError is
+        raised and nothing is written. A loaded row with no changed field is
+        not written at all: like Model.save(update_fields=[]), save() then
+        returns at once, without pre_save and post_save (nothing derived from
+        the row can have changed) and without checking the stored version.
+        """
+        if self._state.adding or not hasattr(self, "_loaded_values"):
+            super().save(*args, **kwargs)
+            self._remember_loaded_values()
+            return
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            update_fields = self.changed_fields()
+            if not update_fields:
+                return
+        kwargs["update_fields"] = {*update_fields, "version", "updated_at"}
+        self._expected_version = self.version
+        self.version += 1
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        try:
+            # In a savepoint, so that a conflict leaves the caller's
+            # transaction usable.
+            with transaction.atomic(using=using):
+                super().save(*args, **kwargs)
+        except Exception:
+            self.version = self._expected_version
+            raise
+        finally:
+            self._expected_version = None
+        self._remember_loaded_values()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # Add the version check to the UPDATE ... WHERE of save().
+        expected = getattr(self, "_expected_version", None)
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        updated = super()._do_update(
+            base_qs.filter(version=expected), using, pk_val, values, update_fields, forced_update
+        )
+        if not updated:
+            raise ConcurrentUpdateError(f"Copy {pk_val} was changed or deleted since it was loaded.")
+        return updated
 
     def __str__(self):
         """String for representing the Model object."""
         return f"{self.id} ({self.book.title})"
     def is_overdue(self):
         """Determines if the book is overdue based on due date and current date."""
-        return bool(self.due_back and date.today() > self.due_back)
+        # Copies fetched with BookInstance.objects.with_overdue() carry the
+        # answer from the database.
+        if "overdue" in self.__dict__:
+            return self.overdue
+        return bool(self.status == "o" and self.due_back and date.today() > self.due_back)
     
 ## this model below is used to store information about the author
 class Author(models.Model):
@@ -183,6 +385,9 @@ class Author(models.Model):
 
     class Meta:
         ordering = ["last_name", "first_name"]
+        indexes = [
+            models.Index(fields=["last_name", "first_name"], name="author_name_idx"),
+        ]
 
     def get_absolute_url(self):
         """Returns the url to access a particular author instance."""
@@ -195,7 +400,7 @@ class Author(models.Model):
 ##This model below is for the Language model
 # The Language model is used to store information about the language in which the book is written.
 # The model is very simple, with only a single field to store the language name.
-class Language(models.Model):
+class Language(CounterFieldsMixin, models.Model):
     """Model representing a Language (e.g. English, French, Japanese, etc.)"""
 
     name = models.CharField(
@@ -203,7 +408,98 @@ class Language(models.Model):
         unique=True,
         help_text="Enter the book's natural language (e.g. English, French, Japanese etc.)",
     )
+    # Maintained counters, as on Genre.
+    book_count = models.PositiveIntegerField(default=0, editable=False)
+    available_count = models.PositiveIntegerField(default=0, editable=False)
+    counter_fields = ("book_count", "available_count")
 
     def __str__(self):
         """String for representing the Model object."""
         return self.name
+
+
+## Reservation queue for the "Reserved" copy status, see catalog/holds.py
+# A patron places a hold on a book; holds are served in the order they were
+# placed, which is the order of their ids. When a copy of the book comes back
+# it is set aside (status "Reserved") for the first waiting hold.
+class HoldQuerySet(models.QuerySet):
+    def waiting(self):
+        return self.filter(status__exact="w")
+
+    def active(self):
+        """Holds still waiting or with a copy set aside."""
+        return self.filter(status__in=["w", "r"])
+
+    def with_position(self):
+        """Annotate each hold with its place in the queue of its book (1 is next).
+
+        Holds that are not waiting get None. Each position is an index-only
+        COUNT on the partial index hold_queue_idx.
+        """
+        ahead = (
+            Hold.objects.waiting()
+            .filter(book=models.OuterRef("book"), id__lte=models.OuterRef("id"))
+            .order_by()
+            .values("book")
+            .annotate(n=models.Count("pk"))
+            .values("n")
+        )
+        return self.annotate(
+            position=models.Case(
+                models.When(status__exact="w", then=models.Subquery(ahead)),
+                default=None,
+                output_field=models.IntegerField(),
+            )
+        )
+
+
+class Hold(models.Model):
+    """Model representing a patron's place in the queue for a book."""
+
+    objects = HoldQuerySet.as_manager()
+
+    HOLD_STATUS = (
+        ("w", "Waiting"),
+        ("r", "Ready for collection"),
+        ("c", "Collected"),
+        ("x", "Cancelled"),
+    )
+
+    book = models.ForeignKey("Book", on_delete=models.CASCADE)
+    patron = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    status = models.CharField(max_length=1, choices=HOLD_STATUS, default="w")
+    # The copy set aside for the patron, once the hold is ready.
+    copy = models.ForeignKey("BookInstance", on_delete=models.SET_NULL, null=True, blank=True)
+    placed_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            # One place in the queue per patron and book.
+            UniqueConstraint(
+                fields=["book", "patron"],
+                condition=models.Q(status__in=["w", "r"]),
+                name="hold_one_active_per_patron",
+            ),
+            # A copy is set aside for one hold at a time.
+            UniqueConstraint(
+                fields=["copy"],
+                condition=models.Q(status="r"),
+                name="hold_one_ready_per_copy",
+            ),
+        ]
+        # The waiting holds of a book in queue order (the head of the queue
+        # and the positions), and a patron's active holds ("my holds").
+        indexes = [
+            models.Index(fields=["book", "id"], condition=models.Q(status="w"), name="hold_queue_idx"),
+            models.Index(
+                fields=["patron", "id"],
+                condition=models.Q(status__in=["w", "r"]),
+                name="hold_patron_active_idx",
+            ),
+        ]
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f"{self.book} ({self.patron}, {self.get_status_display()})"
@@ -0,0 +1,191 @@
+## Keyset ("seek") pagination for the catalog list views
+# The default ListView pagination runs a COUNT(*) and then an OFFSET query,
+# so page 5000 makes the database walk past 50000 rows before returning ten.
+# With keyset pagination the request carries the ordering values of the last
+# row it has seen (the cursor) and the next page is fetched with a WHERE clause
+# that seeks past them, which an index on the ordering columns answers
+# directly no matter how deep the page is.
+
+import base64
+import json
+from contextlib import nullcontext
+
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q, QuerySet
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+
+def encode_cursor(values):
+    """Turn a list of ordering values into an opaque URL-safe string."""
+    data = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor(); raises ValueError for a malformed cursor."""
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (TypeError, ValueError) as e:
+        raise ValueError(cursor) from e
+    if not isinstance(values, list):
+        raise ValueError(cursor)
+    return values
+
+
+def seek_filter(fields, values):
+    """Build the Q object selecting the rows that sort after ``values``.
+
+    For fields (a, b, c) this is a > x OR (a = x AND b > y) OR (a = x AND
+    b = y AND c > z), the row-value comparison (a, b, c) > (x, y, z), ANDed
+    with a >= x: the planner cannot seek an index on an OR of conditions,
+    but it can start its range on (a, b, c) at that bound.
+    """
+    condition = Q()
+    for i, field in enumerate(fields):
+        equal = {fields[j]: values[j] for j in range(i)}
+        condition |= Q(**equal, **{f'{field}__gt': values[i]})
+    if len(fields) > 1:
+        condition = Q(**{f'{fields[0]}__gte': values[0]}) & condition
+    return condition
+
+
+class KeysetPage:
+    """A page of results fetched by seeking past a cursor.
+
+    It exposes the parts of django.core.paginator.Page that the templates use;
+    there is no page number or page count because nothing was counted.
+    """
+
+    def __init__(self, object_list, has_next):
+        self.object_list = object_list
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return True
+
+    def has_other_pages(self):
+        return True
+
+
+class KeysetPaginationMixin:
+    """ListView mixin adding keyset pagination next to ``paginate_by``.
+
+    ``keyset_fields`` must match the ordering of the queryset and end with a
+    unique field. Requests without the cursor parameter get the normal page
+    numbers; every page offers a ``next_cursor`` so that following "next"
+    switches to seeking and stays cheap however far the patron goes.
+    """
+
+    keyset_fields = ('id',)
+    cursor_param = 'after'
+
+    def get_cursor(self, obj):
+        return encode_cursor([getattr(obj, field) for field in self.keyset_fields])
+
+    def get_seek_queryset(self, queryset, page_size):
+        """Return the rows to fetch for the request's cursor, or None without one."""
+        cursor = self.request.GET.get(self.cursor_param)
+        if cursor is None:
+            return None
+
+        try:
+            values = decode_cursor(cursor)
+        except ValueError:
+            raise Http404(_('Invalid page cursor.'))
+        if len(values) != len(self.keyset_fields):
+            raise Http404(_('Invalid page cursor.'))
+
+        # Fetch one extra row to learn whether there is a next page
+        # without counting the rest of the table.
+        return queryset.filter(seek_filter(self.keyset_fields, values))[:page_size + 1]
+
+    def keyset_page(self, rows, page_size):
+        page = KeysetPage(rows[:page_size], has_next=len(rows) > page_size)
+        return (None, page, page.object_list, True)
+
+    def paginate_queryset(self, queryset, page_size):
+        rows = self.get_seek_queryset(queryset, page_size)
+        if rows is None:
+            return super().paginate_queryset(queryset, page_size)
+        return self.keyset_page(list(rows), page_size)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """Async paginate_queryset(), for async views (catalog/async_views.py)."""
+        rows = self.get_seek_queryset(queryset, page_size)
+        if rows is None:
+            return await super().apaginate_queryset(queryset, page_size)
+        return self.keyset_page([row async for row in rows], page_size)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        context['keyset_paginated'] = isinstance(page, KeysetPage)
+        if page is not None and page.has_next():
+            context['next_cursor'] = self.get_cursor(list(page.object_list)[-1])
+        return context
+
+
+## Estimated counts for very large tables
+# Counting every row of a table with millions of copies costs a full scan on
+# each admin changelist load. The database already keeps a row estimate in
+# its planner statistics, which is good enough to size the page links.
+
+def estimated_row_count(model, using='default'):
+    """Return the planner's row estimate for the model's table, or None."""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+    elif connection.vendor == 'sqlite':
+        # Filled in by ANALYZE, one row per index; the first number of a row
+        # is the number of rows in the index. A partial index holds only some
+        # of the table, so the table size is the largest of them.
+        sql = 'SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s'
+    else:
+        return None
+    # Inside a transaction a failing query must not break it, hence the
+    # savepoint; outside one there is nothing to protect, and an atomic
+    # block would take the write lock under BEGIN IMMEDIATE (see settings).
+    guard = transaction.atomic(using=using) if connection.in_atomic_block else nullcontext()
+    try:
+        with guard, connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 only exists once ANALYZE has been run.
+        return None
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that uses the row estimate for large unfiltered querysets.
+
+    Filtered querysets, and tables smaller than ``exact_count_threshold``
+    according to the estimate, are still counted exactly.
+    """
+
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        object_list = self.object_list
+        if isinstance(object_list, QuerySet) and not object_list.query.where:
+            estimate = estimated_row_count(object_list.model, object_list.db)
+            if estimate is not None and estimate > self.exact_count_threshold:
+                return estimate
+        return super().count
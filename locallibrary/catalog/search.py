@@ -0,0 +1,176 @@
+## Full-text search over the catalog
+# Filtering Book.title or Book.summary with icontains reads every row of the
+# table. Instead the catalog keeps an SQLite FTS5 index (an inverted index
+# from words to books) with one document per book: title, summary, author
+# name, genres and ISBN, stored under the book id as rowid.
+# The table is created by migration 0010, kept up to date by the receivers
+# in catalog/signals.py and rebuilt in bulk by "manage.py rebuild_search_index".
+# On other database backends search falls back to a plain (unranked) filter.
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Book
+
+SEARCH_TABLE = 'catalog_book_fts'
+SEARCH_COLUMNS = ('title', 'summary', 'author', 'genre', 'isbn')
+# bm25() weights, in SEARCH_COLUMNS order: a hit in the title, ISBN or
+# author name counts for more than one in the summary.
+SEARCH_WEIGHTS = (10.0, 1.0, 5.0, 2.0, 10.0)
+
+def search_available():
+    """True when the database keeps the FTS5 index (SQLite only)."""
+    return connection.vendor == 'sqlite'
+
+
+def book_document(book):
+    """Return the indexed column values for a book, in SEARCH_COLUMNS order.
+
+    The book should come with its author joined and genres prefetched when
+    many books are indexed at once.
+    """
+    return (
+        book.title,
+        book.summary,
+        f"{book.author.first_name} {book.author.last_name}" if book.author else '',
+        ' '.join(genre.name for genre in book.genre.all()),
+        book.isbn,
+    )
+
+
+def _books_for_indexing(book_ids):
+    return Book.objects.filter(pk__in=book_ids).select_related('author').prefetch_related('genre')
+
+
+def index_books(book_ids):
+    """(Re)write the search documents of the given books."""
+    if not search_available():
+        return
+    book_ids = list(book_ids)
+    rows = [(book.pk, *book_document(book)) for book in _books_for_indexing(book_ids)]
+    placeholders = ', '.join(['%s'] * (len(SEARCH_COLUMNS) + 1))
+    with connection.cursor() as cursor:
+        # Books that no longer exist are dropped from the index.
+        found = {row[0] for row in rows}
+        missing = [(book_id,) for book_id in book_ids if book_id not in found]
+        if missing:
+            cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", missing)
+        if rows:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                rows,
+            )
+
+
+def unindex_books(book_ids):
+    """Remove the given books from the search index."""
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(pk,) for pk in book_ids])
+
+
+def rebuild_index(chunk_size=2000):
+    """Rebuild the whole index from the Book table and return the book count.
+
+    Books are streamed in chunks so memory use does not grow with the
+    catalog; run it inside a transaction to make the swap atomic.
+    """
+    if not search_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    books = (
+        Book.objects.select_related('author')
+        .prefetch_related('genre')
+        .order_by('pk')
+        .iterator(chunk_size=chunk_size)
+    )
+    placeholders = ', '.join(['%s'] * (len(SEARCH_COLUMNS) + 1))
+    insert_sql = f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES ({placeholders})"
+    total = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for book in books:
+            batch.append((book.pk, *book_document(book)))
+            if len(batch) >= chunk_size:
+                cursor.executemany(insert_sql, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert_sql, batch)
+            total += len(batch)
+        # Merge the b-trees written by the bulk load into one.
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def match_expression(query):
+    """Turn patron input into a safe FTS5 MATCH expression.
+
+    Every word must appear (implicit AND); words are quoted so that FTS5
+    operators and punctuation in the input cannot cause syntax errors, and
+    the last word is matched as a prefix for search-as-you-type.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = ['"%s"' % word.replace('"', '""') for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class SearchResults:
+    """Lazy, sliceable search result set that Django's Paginator can page.
+
+    count() and each slice run one query against the FTS index; the books of
+    a page are then loaded by primary key in one further query.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.expression = match_expression(query)
+
+    def count(self):
+        if not self.expression:
+            return 0
+        if not search_available():
+            return self._fallback_queryset().count()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+                [self.expression],
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if not self.expression:
+            return []
+        start = index.start or 0
+        limit = index.stop - start
+        if not search_available():
+            return list(self._fallback_queryset()[start:index.stop])
+        weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s OFFSET %s",
+                [self.expression, limit, start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        books = Book.objects.select_related('author').in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
+
+    def _fallback_queryset(self):
+        condition = Q()
+        for word in re.findall(r'\w+', self.query):
+            condition &= Q(title__icontains=word) | Q(isbn=word) | Q(author__last_name__iexact=word)
+        return Book.objects.filter(condition).select_related('author').order_by('title', 'id')
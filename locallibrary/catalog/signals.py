@@ -0,0 +1,273 @@
+## Signal handlers for the catalog application
+# These receivers keep derived data (cached statistics and the like) in step
+# with the models. They are connected when the app registry is ready, see
+# CatalogConfig.ready() in catalog/apps.py.
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Author, Book, BookInstance, Genre, Language
+from .caching import (
+    AUTHOR_LIST, BOOK_LIST, FACETS, author_stamp, book_stamp, books_changed, bump_stamps, copies_stamp,
+)
+from .counters import books_added, copies_moved
+from .export import touch_books
+from .holds import allocate_on_commit, copy_left_reserve, release_copy_holds
+from .search import index_books, unindex_books
+from .stats import invalidate_catalog_stats
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+@receiver(m2m_changed, sender=Book.genre.through)
+def catalog_stats_changed(sender, **kwargs):
+    """Drop the cached home page statistics after any counted write."""
+    invalidate_catalog_stats()
+    # A concurrent request may refill the cache before this transaction
+    # commits, so forget the figures once more when the write is visible.
+    transaction.on_commit(invalidate_catalog_stats)
+
+
+## Full-text search index (catalog/search.py)
+# A book's search document holds its own fields, its author's name and its
+# genre names, so writes to any of those rewrite the affected documents.
+
+@receiver(post_save, sender=Book)
+def book_saved_reindex(sender, instance, **kwargs):
+    index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_unindex(sender, instance, **kwargs):
+    unindex_books([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed_reindex(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # book.genre.add()/remove()/clear()/set()
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            index_books([instance.pk])
+    elif action == 'pre_clear':
+        # genre.book_set.clear(): remember the books before the rows go away
+        instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        index_books(getattr(instance, '_search_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        index_books(pk_set)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def book_names_changed_reindex(sender, instance, created, **kwargs):
+    if not created:
+        index_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+def genre_deleting_remember_books(sender, instance, **kwargs):
+    instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def genre_deleted_reindex(sender, instance, **kwargs):
+    index_books(getattr(instance, '_search_book_ids', []))
+
+
+## Genre and language counters (catalog/counters.py)
+
+@receiver(m2m_changed, sender=Book.genre.through)
+@receiver(m2m_changed, sender=Book.language.through)
+def book_facets_changed_count(sender, instance, action, reverse, model, pk_set, **kwargs):
+    # Forward (book.genre.add(...)): instance is the book and pk_set holds
+    # genre ids. Reverse (genre.book_set.add(...)): the other way round.
+    if reverse:
+        related = instance.book_set
+    else:
+        related = getattr(instance, 'genre' if sender is Book.genre.through else 'language')
+    if action in ('pre_clear', 'pre_remove'):
+        # The rows are gone by post_clear, so note which ones are cleared.
+        # post_remove gets pk_set as given to remove(), links that never
+        # existed included (post_add only gets the new ones), so note the
+        # removed links that do exist too.
+        linked = related.all() if action == 'pre_clear' else related.filter(pk__in=pk_set)
+        instance._unlinked_pks = getattr(instance, '_unlinked_pks', {})
+        instance._unlinked_pks[sender] = list(linked.values_list('pk', flat=True))
+        return
+    if action in ('post_clear', 'post_remove'):
+        pk_set, sign = instance._unlinked_pks.pop(sender, []), -1
+    elif action == 'post_add':
+        sign = 1
+    else:
+        return
+    if reverse:
+        books_added(type(instance), [instance.pk], pk_set, sign=sign)
+    else:
+        books_added(model, pk_set, [instance.pk], sign=sign)
+
+
+@receiver(pre_delete, sender=Book)
+def book_deleting_count(sender, instance, **kwargs):
+    # Deleting a book removes its genre and language rows without m2m_changed.
+    books_added(Genre, list(instance.genre.values_list('pk', flat=True)), [instance.pk], sign=-1)
+    books_added(Language, list(instance.language.values_list('pk', flat=True)), [instance.pk], sign=-1)
+
+
+@receiver(post_save, sender=BookInstance)
+def copy_saved_count(sender, instance, created, **kwargs):
+    new = (instance.book_id, instance.status)
+    if created:
+        old = (None, None)
+    elif hasattr(instance, '_loaded_values'):
+        loaded = instance._loaded_values
+        old = (loaded.get('book_id', instance.book_id), loaded.get('status', instance.status))
+    else:
+        # Saved without being loaded first: nothing is known about the
+        # stored row, so leave the counters to the next recount.
+        return
+    copies_moved(old, new)
+
+
+@receiver(post_delete, sender=BookInstance)
+def copy_deleted_count(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    copies_moved((loaded.get('book_id', instance.book_id), loaded.get('status', instance.status)), (None, None))
+
+
+## Holds (catalog/holds.py)
+# A copy set aside for a hold that is saved with another status, moved to
+# another book or deleted no longer serves the hold. A copy saved as
+# available goes to the first waiting hold of its book, if any.
+
+@receiver(post_save, sender=BookInstance)
+def copy_saved_holds(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    left_reserve = not created and loaded.get('status') == 'r' and (
+        (instance.book_id, instance.status) != (loaded.get('book_id'), 'r')
+    )
+    if left_reserve and copy_left_reserve(instance.pk, instance.status, instance.borrower_id):
+        allocate_on_commit(loaded.get('book_id'))
+    if instance.status == 'a':
+        allocate_on_commit(instance.book_id)
+
+
+@receiver(pre_delete, sender=BookInstance)
+def copy_deleting_holds(sender, instance, **kwargs):
+    # Before Hold.copy is set to NULL by the delete.
+    if release_copy_holds([instance.pk]):
+        allocate_on_commit(instance.book_id)
+
+
+## Last write time of the books (catalog/export.py)
+# An exported book row holds its author's name and its genre and language
+# names, none of which are written by Book.save().
+
+@receiver(m2m_changed, sender=Book.genre.through)
+@receiver(m2m_changed, sender=Book.language.through)
+def book_facets_changed_touch(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_books([instance.pk])
+    elif action == 'pre_clear':
+        # genre.book_set.clear(): the rows are gone by post_clear.
+        touch_books(instance.book_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        touch_books(pk_set)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+def book_names_changed_touch(sender, instance, created, **kwargs):
+    if not created:
+        touch_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Language)
+def facet_deleting_touch(sender, instance, **kwargs):
+    # Deleting a genre or language removes its rows without m2m_changed.
+    touch_books(instance.book_set.values_list('pk', flat=True))
+
+
+## Version stamps of the cached catalog pages (catalog/caching.py)
+
+@receiver(pre_save, sender=Book)
+def book_saving_remember_author(sender, instance, **kwargs):
+    # A book moved to another author drops off the old author's page too.
+    if not instance._state.adding:
+        instance._stored_author_id = (
+            Book.objects.filter(pk=instance.pk).values_list('author_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_written_stamps(sender, instance, **kwargs):
+    bump_stamps([
+        BOOK_LIST,
+        book_stamp(instance.pk),
+        instance.author_id and author_stamp(instance.author_id),
+        getattr(instance, '_stored_author_id', None) and author_stamp(instance._stored_author_id),
+    ])
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def author_written_stamps(sender, instance, **kwargs):
+    # Authors with books cannot be deleted (on_delete=RESTRICT).
+    bump_stamps([BOOK_LIST, AUTHOR_LIST, author_stamp(instance.pk)])
+    bump_stamps(book_stamp(pk) for pk in instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def copy_written_stamps(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', {})
+    book_ids = {instance.book_id, loaded.get('book_id')} - {None}
+    # The book list shows the availability counters: bump it when they move.
+    counted = kwargs.get('created') or kwargs['signal'] is post_delete or (
+        (loaded.get('book_id'), loaded.get('status')) != (instance.book_id, instance.status)
+    )
+    bump_stamps([BOOK_LIST if counted else None, *map(book_stamp, book_ids), *map(copies_stamp, book_ids)])
+
+
+@receiver(pre_delete, sender=Genre)
+@receiver(pre_delete, sender=Language)
+def facet_deleting_remember_books(sender, instance, **kwargs):
+    instance._page_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+def facet_written_stamps(sender, instance, **kwargs):
+    bump_stamps([FACETS])
+    if hasattr(instance, '_page_book_ids'):
+        books_changed(instance._page_book_ids)
+    elif not kwargs.get('created'):
+        books_changed(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+@receiver(m2m_changed, sender=Book.language.through)
+def book_facets_changed_stamps(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_stamps([FACETS])
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_stamps([book_stamp(instance.pk), instance.author_id and author_stamp(instance.author_id)])
+    elif action == 'pre_clear':
+        instance._page_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        books_changed(getattr(instance, '_page_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        books_changed(pk_set)
@@ -0,0 +1,80 @@
+## Home page statistics for the catalog
+# The index view used to run one COUNT query per figure on every request.
+# Here all the figures are computed in a single aggregate query over the
+# BookInstance table (conditional aggregation on the status column) with the
+# counts of the other tables embedded as scalar subqueries.
+# The result is kept in the shared cache and dropped by the signal handlers
+# in catalog/signals.py whenever one of the counted models is written. The
+# overdue count also changes when the date does, so the cached figures never
+# outlive the day they were computed on.
+
+import datetime
+
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, Q, Subquery
+
+from .models import Author, Book, BookInstance, Genre
+
+STATS_CACHE_KEY = 'catalog:stats'
+STATS_CACHE_TIMEOUT = 60 * 60
+
+
+class TableCount(Subquery):
+    """COUNT(*) of a queryset, usable as an aggregate inside aggregate()."""
+
+    template = '(SELECT COUNT(*) FROM (%(subquery)s) _count)'
+    output_field = IntegerField()
+    # The subquery is not correlated with the outer query, so it can sit next
+    # to real aggregates in the same SELECT without a GROUP BY.
+    contains_aggregate = True
+
+    def __init__(self, queryset, **kwargs):
+        super().__init__(queryset.order_by().values('pk'), **kwargs)
+
+
+def _stats_aggregates():
+    fiction_books = Book.objects.filter(genre__name__icontains='fiction').distinct()
+    return dict(
+        num_instances=Count('pk'),
+        num_instances_available=Count('pk', filter=Q(status__exact='a')),
+        num_instances_on_loan=Count('pk', filter=Q(status__exact='o')),
+        num_instances_reserved=Count('pk', filter=Q(status__exact='r')),
+        num_instances_maintenance=Count('pk', filter=Q(status__exact='m')),
+        num_instances_overdue=Count('pk', filter=Q(status__exact='o', due_back__lt=datetime.date.today())),
+        num_books=TableCount(Book.objects.all()),
+        num_authors=TableCount(Author.objects.all()),
+        num_genres_fiction=TableCount(Genre.objects.filter(name__icontains='fiction')),
+        num_books_with_fiction=TableCount(fiction_books),
+    )
+
+
+def compute_catalog_stats():
+    """Run the single statistics query and return the figures as a dict."""
+    return BookInstance.objects.order_by().aggregate(**_stats_aggregates())
+
+
+def _stats_timeout():
+    now = datetime.datetime.now()
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time.min)
+    return min(STATS_CACHE_TIMEOUT, int((midnight - now).total_seconds()) + 1)
+
+
+def get_catalog_stats():
+    """Return the home page figures, computing them only on a cache miss."""
+    return cache.get_or_set(STATS_CACHE_KEY, compute_catalog_stats, _stats_timeout())
+
+
+async def aget_catalog_stats():
+    """Async get_catalog_stats(), for async views (async cache and ORM calls)."""
+    stats = await cache.aget(STATS_CACHE_KEY)
+    if stats is None:
+        # All the figures are one statement, so there is nothing left to run
+        # concurrently here.
+        stats = await BookInstance.objects.order_by().aaggregate(**_stats_aggregates())
+        await cache.aset(STATS_CACHE_KEY, stats, _stats_timeout())
+    return stats
+
+
+def invalidate_catalog_stats():
+    """Forget the cached figures so the next request recomputes them."""
+    cache.delete(STATS_CACHE_KEY)
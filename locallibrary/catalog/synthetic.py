@@ -0,0 +1,218 @@
+## Synthetic catalog data for benchmarks
+# generate_catalog() fills the database with a library of a chosen size:
+# authors, genres, languages, books, their copies, patrons and loans. Loans
+# follow a Zipf distribution over the books, as in a real library: a few
+# titles are borrowed all the time (every copy on loan) while most of the
+# catalog sits on the shelves. Everything is drawn from a seeded random
+# generator, so the same arguments give the same catalog.
+#
+# The books go through CatalogImporter (catalog/bulk_import.py), which keeps
+# the search index, counters and cached pages in step; the copies are then
+# bulk created directly in their final state, and the derived data they
+# affect is updated here. Synthetic books have ISBNs starting with "SYN"
+# and synthetic patrons usernames starting with "reader", so they are easy
+# to tell apart. Used by "manage.py generate_catalog".
+
+import datetime
+import random
+import time
+from dataclasses import dataclass
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .bulk_import import CatalogImporter
+from .caching import AUTHOR_LIST, BOOK_LIST, FACETS, book_stamp, bump_stamps, copies_stamp
+from .counters import recount_book_counts, recount_genre_language_counts
+from .models import Book, BookInstance
+from .stats import invalidate_catalog_stats
+
+ISBN_PREFIX = 'SYN'
+USERNAME_PREFIX = 'reader'
+
+# (books, copies, patrons, loans)
+SCALES = {
+    'small': (1000, 10000, 100, 2500),
+    'medium': (100000, 1000000, 10000, 250000),
+    'large': (1000000, 10000000, 100000, 2500000),
+}
+
+GENRES = [
+    'Fantasy', 'Science Fiction', 'Mystery', 'Thriller', 'Romance', 'Historical Fiction', 'Horror',
+    'Biography', 'History', 'Poetry', 'Drama', 'Philosophy', 'Science', 'Travel', 'Cookery',
+    'Children', 'Young Adult', 'Graphic Novel', 'Humour', 'Politics',
+]
+LANGUAGES = ['English', 'French', 'Spanish', 'German', 'Italian', 'Portuguese', 'Japanese', 'Russian']
+FIRST_NAMES = [
+    'Ada', 'Alan', 'Anne', 'Boris', 'Chinua', 'Clarice', 'Doris', 'Elena', 'Fyodor', 'Gabriel',
+    'Haruki', 'Isabel', 'James', 'Jorge', 'Kazuo', 'Leo', 'Margaret', 'Naguib', 'Orhan', 'Toni',
+    'Ursula', 'Virginia', 'Wole', 'Yukio', 'Zadie',
+]
+LAST_NAMES = [
+    'Achebe', 'Atwood', 'Borges', 'Calvino', 'Dickens', 'Eco', 'Ferrante', 'Grass', 'Hesse',
+    'Ishiguro', 'Joyce', 'Kafka', 'Lessing', 'Mahfouz', 'Morrison', 'Nabokov', 'Oe', 'Pamuk',
+    'Rushdie', 'Smith', 'Tolstoy', 'Undset', 'Woolf', 'Yourcenar', 'Zola',
+]
+TITLE_WORDS = [
+    'Shadow', 'River', 'Winter', 'Garden', 'Empire', 'Silence', 'Mirror', 'Island', 'Storm',
+    'Letters', 'Night', 'Summer', 'Tower', 'Journey', 'Kingdom', 'Memory', 'Stranger', 'Harbour',
+    'Fire', 'Glass', 'Forest', 'Crown', 'Promise', 'Road',
+]
+TITLE_ADJECTIVES = [
+    'Last', 'Silent', 'Hidden', 'Broken', 'Golden', 'Distant', 'Forgotten', 'Burning', 'Lost',
+    'Secret', 'Northern', 'Quiet', 'Endless', 'Small',
+]
+PUBLISHERS = ['Penguin', 'Vintage', 'Faber', 'Picador', 'Gallimard', 'Anagrama', 'Suhrkamp', 'Einaudi']
+
+# Status of the copies that are not on loan
+SHELF_STATUSES = ['a', 'm', 'r']
+SHELF_WEIGHTS = [90, 6, 4]
+
+
+@dataclass
+class SyntheticReport:
+    books: int = 0
+    copies: int = 0
+    patrons: int = 0
+    loans: int = 0
+    elapsed: float = 0.0
+
+
+def synthetic_data_exists():
+    return (
+        Book.objects.filter(isbn__startswith=ISBN_PREFIX).exists()
+        or get_user_model().objects.filter(username__startswith=USERNAME_PREFIX).exists()
+    )
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative Zipf weights of ranks 1..n, for random.choices()."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+class CatalogGenerator:
+    """Generate a synthetic catalog, see module comment."""
+
+    def __init__(self, books, copies, patrons, loans, seed=0, exponent=1.1, chunk_size=1000):
+        self.books = books
+        self.copies_per_book = max(copies / books, 1) if books else 0
+        self.patrons = patrons
+        # Loans need patrons to borrow the copies.
+        self.loans = loans if patrons else 0
+        self.exponent = exponent
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.report = SyntheticReport()
+
+    def run(self):
+        started = time.perf_counter()
+        patron_ids = self.create_patrons()
+        self.create_books()
+        demand = self.loan_demand()
+        self.create_copies(demand, patron_ids)
+        # The copies bypassed the signals: recount the genre and language
+        # counters in one statement per table and drop the cached statistics
+        # and the cached list pages and facet counts.
+        recount_genre_language_counts()
+        invalidate_catalog_stats()
+        bump_stamps([BOOK_LIST, AUTHOR_LIST, FACETS])
+        self.report.elapsed = time.perf_counter() - started
+        return self.report
+
+    def create_patrons(self):
+        User = get_user_model()
+        # One unusable password for all: hashing a password per patron would
+        # take longer than everything else.
+        password = make_password(None)
+        for start in range(0, self.patrons, self.chunk_size):
+            User.objects.bulk_create([
+                User(
+                    username=f'{USERNAME_PREFIX}{number:07d}',
+                    first_name=self.random.choice(FIRST_NAMES),
+                    last_name=self.random.choice(LAST_NAMES),
+                    password=password,
+                )
+                for number in range(start, min(start + self.chunk_size, self.patrons))
+            ])
+        self.report.patrons = self.patrons
+        return list(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list('pk', flat=True))
+
+    def book_records(self):
+        # About ten books per author.
+        authors = [
+            (self.random.choice(FIRST_NAMES), f'{self.random.choice(LAST_NAMES)} {number}')
+            for number in range(max(self.books // 10, 1))
+        ]
+        for number in range(self.books):
+            first_name, last_name = self.random.choice(authors)
+            title = f'The {self.random.choice(TITLE_ADJECTIVES)} {self.random.choice(TITLE_WORDS)}'
+            if self.random.random() < 0.3:
+                title += f' of the {self.random.choice(TITLE_WORDS)}'
+            record = {
+                'title': title,
+                'summary': f'A {self.random.choice(GENRES).lower()} novel.',
+                'isbn': f'{ISBN_PREFIX}{number:010d}',
+                'author_first_name': first_name,
+                'author_last_name': last_name,
+                'genres': self.random.sample(GENRES, self.random.choice([1, 1, 2, 3])),
+                'languages': ['English'] if self.random.random() < 0.7 else self.random.sample(LANGUAGES, 1),
+                'copies': 0,
+            }
+            yield number, record
+
+    def create_books(self):
+        report = CatalogImporter(chunk_size=self.chunk_size).run(self.book_records())
+        self.report.books = report.books
+
+    def loan_demand(self):
+        """Return {book number: loans wanted}, Zipf distributed over a random popularity order."""
+        if not self.loans or not self.books:
+            return {}
+        popularity = list(range(self.books))
+        self.random.shuffle(popularity)
+        demand = {}
+        ranks = self.random.choices(range(self.books), cum_weights=zipf_cum_weights(self.books, self.exponent), k=self.loans)
+        for rank in ranks:
+            number = popularity[rank]
+            demand[number] = demand.get(number, 0) + 1
+        return demand
+
+    def create_copies(self, demand, patron_ids):
+        books = Book.objects.filter(isbn__startswith=ISBN_PREFIX).order_by('isbn').values_list('pk', 'isbn')
+        chunk = []
+        for book_id, isbn in books.iterator(chunk_size=self.chunk_size):
+            chunk.append((book_id, int(isbn[len(ISBN_PREFIX):])))
+            if len(chunk) >= self.chunk_size:
+                self.load_copies(chunk, demand, patron_ids)
+                chunk = []
+        if chunk:
+            self.load_copies(chunk, demand, patron_ids)
+
+    @transaction.atomic
+    def load_copies(self, books, demand, patron_ids):
+        today = datetime.date.today()
+        copies = []
+        for book_id, number in books:
+            count = self.random.randint(1, round(2 * self.copies_per_book) - 1)
+            on_loan = min(demand.get(number, 0), count)
+            self.report.loans += on_loan
+            for index in range(count):
+                copy = BookInstance(
+                    book_id=book_id,
+                    imprint=f'{self.random.choice(PUBLISHERS)}, {self.random.randint(1950, today.year)}',
+                )
+                if index < on_loan:
+                    copy.status = 'o'
+                    copy.borrower_id = self.random.choice(patron_ids)
+                    # Some of them overdue
+                    copy.due_back = today + datetime.timedelta(days=self.random.randint(-14, 28))
+                else:
+                    copy.status = self.random.choices(SHELF_STATUSES, SHELF_WEIGHTS)[0]
+                copies.append(copy)
+        BookInstance.objects.bulk_create(copies, batch_size=self.chunk_size)
+        self.report.copies += len(copies)
+        book_ids = [book_id for book_id, number in books]
+        recount_book_counts(book_ids)
+        bump_stamps([*map(book_stamp, book_ids), *map(copies_stamp, book_ids)])
@@ -0,0 +1,91 @@
+# Tests for the catalog admin changelists and the estimated count paginator.
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.pagination import EstimatedCountPaginator, estimated_row_count
+
+User = get_user_model()
+
+
+class CatalogAdminChangelistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(username='admin', password='1X<ISRUkw+tuK')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.language = Language.objects.create(name='English')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def add_books(self, count):
+        for book_id in range(count):
+            book = Book.objects.create(title=f'Title {book_id}', isbn=f'{Book.objects.count():013}', author=self.author)
+            book.genre.set([self.genre])
+            book.language.set([self.language])
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=self.admin_user)
+
+    def assertConstantQueries(self, url):
+        self.add_books(2)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_books(20)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(small), len(large))
+
+    def test_book_changelist_constant_queries(self):
+        self.assertConstantQueries(reverse('admin:catalog_book_changelist'))
+
+    def test_bookinstance_changelist_constant_queries(self):
+        self.assertConstantQueries(reverse('admin:catalog_bookinstance_changelist'))
+
+    def test_bookinstance_search_by_title_prefix(self):
+        self.add_books(3)
+        response = self.client.get(reverse('admin:catalog_bookinstance_changelist'), {'q': '"Title 1"'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+    def test_mark_returned_action(self):
+        self.add_books(2)
+        response = self.client.post(reverse('admin:catalog_bookinstance_changelist'), {
+            'action': 'mark_returned',
+            '_selected_action': [str(pk) for pk in BookInstance.objects.values_list('pk', flat=True)],
+        }, follow=True)
+        self.assertContains(response, '2 copies returned.')
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 2)
+
+class EstimatedCountPaginatorTest(TestCase):
+    def test_falls_back_to_exact_count(self):
+        Author.objects.create(first_name='John', last_name='Smith')
+        paginator = EstimatedCountPaginator(Author.objects.all(), 10)
+        self.assertEqual(paginator.count, 1)
+
+    def test_uses_estimate_for_large_unfiltered_tables(self):
+        Author.objects.create(first_name='John', last_name='Smith')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute(
+                'UPDATE sqlite_stat1 SET stat = %s WHERE tbl = %s',
+                ['2000000 1', Author._meta.db_table],
+            )
+        self.assertEqual(estimated_row_count(Author), 2000000)
+        self.assertEqual(EstimatedCountPaginator(Author.objects.all(), 10).count, 2000000)
+        # A filtered changelist is still counted exactly
+        self.assertEqual(EstimatedCountPaginator(Author.objects.filter(last_name='Smith'), 10).count, 1)
+
+    def test_estimate_ignores_partial_indexes(self):
+        # bookinst_loan_due_idx only holds the copies on loan.
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Title', isbn='1', author=author)
+        BookInstance.objects.bulk_create(
+            [BookInstance(book=book, imprint='Imprint', status='o' if number < 3 else 'a') for number in range(200)]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimated_row_count(BookInstance), 200)
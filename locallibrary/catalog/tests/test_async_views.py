@@ -0,0 +1,58 @@
+# Tests for the async catalog views (catalog/async_views.py), run through
+# the async test client as they are under ASGI.
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import resolve, reverse
+
+from catalog.models import Author, Book, BookInstance, Genre
+
+
+class AsyncCatalogViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        genre = Genre.objects.create(name='Fantasy')
+        for book_id in range(12):
+            book = Book.objects.create(title=f'Title {book_id:02}', isbn=f'{book_id:013}', author=cls.author)
+            book.genre.set([genre])
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        cls.book = book
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [
+            reverse('index'),
+            reverse('books'),
+            reverse('authors'),
+            reverse('book-detail', args=[self.book.pk]),
+            reverse('author-detail', args=[self.author.pk]),
+        ]
+
+    def test_views_are_async(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertTrue(iscoroutinefunction(resolve(url).func))
+
+    async def test_pages_render(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('books'), {'page': 2})
+        self.assertEqual([book.title for book in response.context['book_list']], ['Title 10', 'Title 11'])
+        response = await self.async_client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertContains(response, 'Fantasy')
+
+    async def test_keyset_page(self):
+        response = await self.async_client.get(reverse('books'))
+        response = await self.async_client.get(reverse('books'), {'after': response.context['next_cursor']})
+        self.assertTrue(response.context['keyset_paginated'])
+        self.assertEqual(len(response.context['book_list']), 2)
+
+    async def test_missing_object_and_page_are_404(self):
+        response = await self.async_client.get(reverse('book-detail', args=[self.book.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('authors'), {'page': 5})
+        self.assertEqual(response.status_code, 404)
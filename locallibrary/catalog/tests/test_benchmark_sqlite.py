@@ -0,0 +1,18 @@
+# Smoke test for "manage.py benchmark_sqlite" (scratch databases only).
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+
+class BenchmarkSqliteCommandTest(SimpleTestCase):
+    def test_reports_both_profiles(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', threads=2, seconds=0.2, rows=100, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[1].split(), ['profile', 'reads/s', 'writes/s', 'locked'])
+        self.assertEqual([line.split()[0] for line in lines[2:]], ['default', 'production'])
+        # The figures depend on the machine; only their shape is checked.
+        for line in lines[2:]:
+            self.assertTrue(all(figure.isdigit() for figure in line.split()[1:]), line)
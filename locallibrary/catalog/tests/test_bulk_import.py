@@ -0,0 +1,72 @@
+# Tests for the bulk import of vendor feeds (catalog/bulk_import.py and
+# the import_catalog management command).
+
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.search import SearchResults
+
+CSV_FEED = """title,isbn,author,genres,languages,copies,status
+A Wizard of Earthsea,9780553383041,"Le Guin, Ursula",fantasy;Young Adult,English,3,a
+The Dispossessed,9780061054884,"Le Guin, Ursula",Science Fiction,English,1,o
+Duplicate in file,9780061054884,"Le Guin, Ursula",,,0,
+,9780000000001,"Nobody, No",,,0,
+Bad copies,9780000000002,"Nobody, No",,,many,
+Already there,1111111111111,"Smith, John",,,0,
+"""
+
+
+class ImportCatalogCommandTest(TestCase):
+    def setUp(self):
+        self.fantasy = Genre.objects.create(name='Fantasy')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        Book.objects.create(title='Existing', isbn='1111111111111', author=author)
+
+    def import_file(self, content, suffix, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False, encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', f.name, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_import(self):
+        out, err = self.import_file(CSV_FEED, '.csv', chunk_size=2)
+        self.assertIn('Imported 2 books and 4 copies', out)
+        self.assertIn('2 duplicate ISBNs skipped, 2 rejected', out)
+        self.assertIn('Rejected line 5: missing title', err)
+        self.assertIn('Rejected line 6: copies is not a number', err)
+
+        book = Book.objects.get(isbn='9780553383041')
+        self.assertEqual((book.author.first_name, book.author.last_name), ('Ursula', 'Le Guin'))
+        self.assertEqual(Author.objects.filter(last_name='Le Guin').count(), 1)
+        # "fantasy" reuses the existing genre despite the different case
+        self.assertCountEqual(book.genre.all(), [self.fantasy, Genre.objects.get(name='Young Adult')])
+        self.assertEqual(BookInstance.objects.filter(book=book, status='a').count(), 3)
+        self.assertEqual((book.copy_count, book.available_count), (3, 3))
+
+        # Derived data is kept up to date despite bulk_create
+        self.fantasy.refresh_from_db()
+        self.assertEqual((self.fantasy.book_count, self.fantasy.available_count), (1, 3))
+        english = Language.objects.get(name='English')
+        self.assertEqual((english.book_count, english.available_count), (2, 3))
+        self.assertEqual(SearchResults('earthsea').count(), 1)
+
+    def test_jsonl_import(self):
+        records = [
+            {'title': 'Tombs of Atuan', 'isbn': '9780689845369', 'author_first_name': 'Ursula',
+             'author_last_name': 'Le Guin', 'genres': ['Fantasy'], 'copies': 2},
+            'not an object',
+        ]
+        content = '\n'.join(json.dumps(record) for record in records) + '\n{broken\n'
+        out, err = self.import_file(content, '.jsonl')
+        self.assertIn('Imported 1 books and 2 copies', out)
+        self.assertIn('Rejected line 2: not a JSON object', err)
+        self.assertIn('Rejected line 3: invalid JSON', err)
+        self.assertEqual(BookInstance.objects.filter(book__isbn='9780689845369', status='m').count(), 2)
@@ -0,0 +1,151 @@
+# Tests for the version-stamped page and fragment caches (catalog/caching.py).
+# The cache is cleared before each test because the local memory cache
+# outlives the transaction that every TestCase rolls back.
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.circulation import return_copies
+from catalog.models import Author, Book, BookInstance, Genre
+
+User = get_user_model()
+
+
+class CatalogPageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='patron', password='1X<ISRUkw+tuK')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.book = Book.objects.create(title='Book Title', isbn='ABCDEFG', author=cls.author)
+        cls.other_book = Book.objects.create(title='Other Title', isbn='HIJKLMN', author=cls.author)
+        cls.book.genre.set([cls.genre])
+        cls.copy = BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o')
+
+    def setUp(self):
+        cache.clear()
+        self.book_url = reverse('book-detail', args=[self.book.pk])
+        self.other_url = reverse('book-detail', args=[self.other_book.pk])
+        self.author_url = reverse('author-detail', args=[self.author.pk])
+
+    def assertCached(self, url):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def assertRendered(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.templates)
+        return response
+
+    def visit_all(self):
+        for url in [reverse('books'), reverse('authors'), self.book_url, self.other_url, self.author_url]:
+            self.assertRendered(url)
+            self.assertCached(url)
+
+    def test_pages_cached_for_anonymous_visitors(self):
+        self.visit_all()
+        response = self.client.get(self.book_url)
+        self.assertContains(response, 'Book Title')
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_book_save_bumps_its_pages_only(self):
+        self.visit_all()
+        self.book.title = 'New Title'
+        self.book.save()
+        self.assertContains(self.assertRendered(self.book_url), 'New Title')
+        self.assertContains(self.assertRendered(reverse('books')), 'New Title')
+        self.assertContains(self.assertRendered(self.author_url), 'New Title')
+        self.assertCached(self.other_url)
+        self.assertCached(reverse('authors'))
+
+    def test_copy_change_bumps_book_page(self):
+        self.visit_all()
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.imprint = 'New Imprint'
+        copy.save()
+        self.assertContains(self.assertRendered(self.book_url), 'New Imprint')
+        self.assertCached(self.other_url)
+        self.assertCached(reverse('books'))
+        self.assertCached(self.author_url)
+
+    def test_copy_status_change_bumps_book_list(self):
+        # The book list shows the number of available copies.
+        self.visit_all()
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.status = 'm'
+        copy.save()
+        self.assertContains(self.assertRendered(self.book_url), 'Maintenance')
+        self.assertContains(self.assertRendered(reverse('books')), '0 of 1 copies available')
+        self.assertCached(self.other_url)
+        self.assertCached(self.author_url)
+
+    def test_bulk_return_bumps_book_page(self):
+        self.visit_all()
+        return_copies([self.copy.pk])
+        self.assertContains(self.assertRendered(self.book_url), 'Available')
+        self.assertCached(self.other_url)
+
+    def test_genre_rename_bumps_its_books_and_authors(self):
+        self.visit_all()
+        self.genre.name = 'Epic Fantasy'
+        self.genre.save()
+        self.assertContains(self.assertRendered(self.book_url), 'Epic Fantasy')
+        self.assertContains(self.assertRendered(self.author_url), 'Epic Fantasy')
+        self.assertCached(self.other_url)
+
+    def test_author_rename_bumps_lists_and_books(self):
+        self.visit_all()
+        self.author.last_name = 'Smythe'
+        self.author.save()
+        for url in [reverse('books'), reverse('authors'), self.book_url, self.other_url, self.author_url]:
+            self.assertContains(self.assertRendered(url), 'Smythe')
+
+    def test_logged_in_users_not_served_from_cache(self):
+        self.visit_all()
+        self.client.force_login(self.user)
+        self.assertContains(self.assertRendered(self.book_url), 'User: patron')
+
+
+class BookCopiesFragmentCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='patron', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', isbn='ABCDEFG', author=author)
+        for copy in range(30):
+            BookInstance.objects.create(book=cls.book, imprint=f'Imprint {copy}', status='a')
+
+    def setUp(self):
+        cache.clear()
+        # Logged in, so the page itself is rendered on every request.
+        self.client.force_login(self.user)
+        self.url = reverse('book-detail', args=[self.book.pk])
+
+    def test_copies_fragment_skips_queries_when_cached(self):
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Available: 30')
+        copy_queries = [query for query in second if 'catalog_bookinstance' in query['sql']]
+        self.assertEqual(copy_queries, [])
+        self.assertLess(len(second), len(first))
+
+    def test_copy_change_refreshes_fragment(self):
+        self.client.get(self.url)
+        copy = BookInstance.objects.filter(book=self.book).first()
+        copy.status = 'm'
+        copy.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Maintenance: 1')
+        self.assertContains(response, 'Available: 29')
+
+    def test_fragment_cached_per_copies_page(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url, {'copies_page': 2})
+        self.assertContains(response, 'Copies page 2 of 2.')
@@ -0,0 +1,153 @@
+# Tests for minimal-write saves and the optimistic locking of BookInstance.
+
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.db.models.signals import post_save, pre_save
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.circulation import return_copies
+from catalog.counters import recount_book_counts
+from catalog.models import Author, Book, BookInstance, ConcurrentUpdateError, Genre
+
+User = get_user_model()
+
+
+class BookInstanceConcurrencyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='1X<ISRUkw+tuK')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.borrower = User.objects.create_user(username='borrower', password='2HJ1vRV0Z&3iD')
+        cls.admin_user = User.objects.create_superuser(username='admin', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG', author=author)
+        cls.book.genre.set([cls.genre])
+
+    def setUp(self):
+        self.copy = BookInstance.objects.create(
+            book=self.book,
+            imprint='Imprint',
+            status='o',
+            borrower=self.borrower,
+            due_back=datetime.date.today() + datetime.timedelta(days=2),
+        )
+
+    def test_save_writes_only_changed_fields(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        with CaptureQueriesContext(connection) as queries:
+            copy.save()
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "catalog_bookinstance"')]
+        self.assertEqual(len(updates), 1)
+        set_clause = updates[0].split(' WHERE ')[0]
+        self.assertIn('"due_back"', set_clause)
+        self.assertNotIn('"status"', set_clause)
+        self.assertNotIn('"borrower_id"', set_clause)
+        self.assertNotIn('"imprint"', set_clause)
+        self.assertEqual(copy.version, 1)
+
+    def test_unchanged_save_writes_nothing(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        sent = []
+
+        def receiver(signal, **kwargs):
+            sent.append(signal)
+
+        pre_save.connect(receiver, sender=BookInstance)
+        post_save.connect(receiver, sender=BookInstance)
+        self.addCleanup(pre_save.disconnect, receiver, sender=BookInstance)
+        self.addCleanup(post_save.disconnect, receiver, sender=BookInstance)
+        with self.assertNumQueries(0):
+            copy.save()
+        self.assertEqual(sent, [])
+        # Nor is the stored version checked.
+        BookInstance.objects.filter(pk=self.copy.pk).update(version=5)
+        copy.save()
+        self.assertEqual(copy.version, 0)
+
+    def test_stale_copy_is_not_saved(self):
+        first = BookInstance.objects.get(pk=self.copy.pk)
+        second = BookInstance.objects.get(pk=self.copy.pk)
+        first.status = 'm'
+        first.save()
+        second.due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        with self.assertRaises(ConcurrentUpdateError):
+            second.save()
+        self.assertEqual(second.version, 0)
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'm')
+        self.assertEqual(self.copy.due_back, datetime.date.today() + datetime.timedelta(days=2))
+
+    def test_bulk_return_bumps_version(self):
+        stale = BookInstance.objects.get(pk=self.copy.pk)
+        return_copies([self.copy.pk])
+        stale.due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        with self.assertRaises(ConcurrentUpdateError):
+            stale.save()
+
+    def test_counters_follow_minimal_saves(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.status = 'a'
+        copy.save()
+        copy.imprint = 'Other imprint'
+        copy.save()
+        self.genre.refresh_from_db()
+        self.assertEqual(self.genre.available_count, 1)
+
+    def test_renewal_view_conflict(self):
+        self.client.force_login(self.librarian)
+        url = reverse('renew-book-librarian', kwargs={'pk': self.copy.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.context['form'].initial['version'], 0)
+
+        BookInstance.objects.filter(pk=self.copy.pk).update(status='m', borrower=None, version=1)
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
+        response = self.client.post(url, {'renewal_date': renewal_date, 'version': 0})
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, 'changed by someone else', status_code=409)
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'm')
+        self.assertNotEqual(self.copy.due_back, renewal_date)
+
+    def test_renewal_view_saves_current_version(self):
+        self.client.force_login(self.librarian)
+        url = reverse('renew-book-librarian', kwargs={'pk': self.copy.pk})
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
+        response = self.client.post(url, {'renewal_date': renewal_date, 'version': 0})
+        self.assertRedirects(response, reverse('all-borrowed'))
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.due_back, renewal_date)
+        self.assertEqual(self.copy.version, 1)
+
+    def test_admin_change_form_conflict(self):
+        self.client.force_login(self.admin_user)
+        url = reverse('admin:catalog_bookinstance_change', args=[self.copy.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        data = {
+            'book': self.book.pk,
+            'imprint': 'Imprint',
+            'id': self.copy.pk,
+            'loaded_version': 0,
+            'status': 'o',
+            'due_back': '',
+            'borrower': self.borrower.pk,
+        }
+        # Someone else's save, done behind the signals: recount the book.
+        BookInstance.objects.filter(pk=self.copy.pk).update(status='m', version=1)
+        recount_book_counts([self.book.pk])
+        response = self.client.post(url, data)
+        self.assertContains(response, 'changed by someone else')
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'm')
+
+        data['loaded_version'] = 1
+        response = self.client.post(url, data)
+        self.assertRedirects(response, reverse('admin:catalog_bookinstance_changelist'))
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.version), ('o', 2))
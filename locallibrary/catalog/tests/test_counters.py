@@ -0,0 +1,149 @@
+# Tests for the maintained book, genre and language counters
+# (catalog/counters.py and the repair_counters command).
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from catalog.circulation import return_copies
+from catalog.counters import books_with_wrong_counts, recount_genre_language_counts
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class GenreLanguageCountersTest(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.fantasy = Genre.objects.create(name='Fantasy')
+        self.poetry = Genre.objects.create(name='Poetry')
+        self.english = Language.objects.create(name='English')
+        self.book = Book.objects.create(title='Book Title', isbn='1', author=self.author)
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='o')
+
+    def assertCounts(self, obj, book_count, available_count):
+        obj.refresh_from_db()
+        self.assertEqual((obj.book_count, obj.available_count), (book_count, available_count))
+
+    def assertMatchesRecount(self):
+        before = list(Genre.objects.values_list('book_count', 'available_count').order_by('pk'))
+        before += list(Language.objects.values_list('book_count', 'available_count').order_by('pk'))
+        recount_genre_language_counts()
+        after = list(Genre.objects.values_list('book_count', 'available_count').order_by('pk'))
+        after += list(Language.objects.values_list('book_count', 'available_count').order_by('pk'))
+        self.assertEqual(before, after)
+
+    def test_adding_and_removing_books(self):
+        self.book.genre.set([self.fantasy, self.poetry])
+        self.book.language.add(self.english)
+        self.assertCounts(self.fantasy, 1, 1)
+        self.assertCounts(self.english, 1, 1)
+        self.book.genre.remove(self.poetry)
+        self.assertCounts(self.poetry, 0, 0)
+        self.poetry.book_set.add(self.book)
+        self.assertCounts(self.poetry, 1, 1)
+        self.poetry.book_set.clear()
+        self.assertCounts(self.poetry, 0, 0)
+        self.book.genre.clear()
+        self.assertCounts(self.fantasy, 0, 0)
+        self.assertMatchesRecount()
+
+    def test_removing_unlinked_books(self):
+        # remove() of links that do not exist changes nothing.
+        other = Book.objects.create(title='Other Title', isbn='2', author=self.author)
+        other.genre.add(self.poetry)
+        self.book.genre.add(self.fantasy)
+        self.book.genre.remove(self.poetry)
+        self.assertCounts(self.poetry, 1, 0)
+        self.fantasy.book_set.remove(other)
+        self.assertCounts(self.fantasy, 1, 1)
+        self.book.language.remove(self.english)
+        self.assertCounts(self.english, 0, 0)
+        self.assertMatchesRecount()
+
+    def test_copy_status_changes(self):
+        self.book.genre.set([self.fantasy])
+        self.book.language.set([self.english])
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.status = 'o'
+        copy.save()
+        self.assertCounts(self.fantasy, 1, 0)
+        copy.status = 'a'
+        copy.save()
+        copy.save()
+        self.assertCounts(self.english, 1, 1)
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        self.assertCounts(self.fantasy, 1, 2)
+        copy.delete()
+        self.assertCounts(self.fantasy, 1, 1)
+        self.assertMatchesRecount()
+
+    def test_deleting_book(self):
+        other = Book.objects.create(title='Other', isbn='2', author=self.author)
+        other.genre.set([self.fantasy])
+        self.book.genre.set([self.fantasy])
+        other.delete()
+        self.assertCounts(self.fantasy, 1, 1)
+        self.assertMatchesRecount()
+
+    def test_saving_stale_genre_keeps_counters(self):
+        stale = Genre.objects.get(pk=self.fantasy.pk)
+        self.book.genre.set([self.fantasy])
+        stale.name = 'High Fantasy'
+        stale.save()
+        self.assertCounts(self.fantasy, 1, 1)
+        self.assertEqual(self.fantasy.name, 'High Fantasy')
+
+
+class BookCopyCountersTest(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name='John', last_name='Smith')
+        self.book = Book.objects.create(title='Book Title', isbn='1', author=self.author)
+        self.other = Book.objects.create(title='Other', isbn='2', author=self.author)
+
+    def assertCopyCounts(self, book, copies, available, on_loan=0, maintenance=0, reserved=0):
+        book.refresh_from_db()
+        self.assertEqual(
+            (book.copy_count, book.available_count, book.on_loan_count, book.maintenance_count, book.reserved_count),
+            (copies, available, on_loan, maintenance, reserved),
+        )
+        self.assertFalse(books_with_wrong_counts().exists())
+
+    def test_copy_lifecycle(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='m')
+        self.assertCopyCounts(self.book, 2, 1, maintenance=1)
+        copy.status = 'o'
+        copy.save()
+        copy.save()
+        self.assertCopyCounts(self.book, 2, 0, on_loan=1, maintenance=1)
+        copy.book = self.other
+        copy.status = 'r'
+        copy.save()
+        self.assertCopyCounts(self.book, 1, 0, maintenance=1)
+        self.assertCopyCounts(self.other, 1, 0, reserved=1)
+        copy.delete()
+        self.assertCopyCounts(self.other, 0, 0)
+        self.assertEqual(self.book.copy_status_counts(), [('m', 'Maintenance', 1)])
+
+    def test_saving_stale_book_keeps_counters(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        stale.title = 'New Title'
+        stale.save()
+        self.assertCopyCounts(self.book, 1, 1)
+        self.assertEqual(self.book.title, 'New Title')
+
+    def test_return_copies(self):
+        copies = [BookInstance.objects.create(book=self.book, imprint='Imprint', status='o') for _ in range(2)]
+        return_copies([copy.pk for copy in copies])
+        self.assertCopyCounts(self.book, 2, 2)
+
+    def test_repair_counters(self):
+        BookInstance.objects.bulk_create([BookInstance(book=self.book, imprint='Imprint', status='a') for _ in range(3)])
+        out = StringIO()
+        call_command('repair_counters', check=True, stdout=out)
+        self.assertIn('1 books with wrong copy counters', out.getvalue())
+        call_command('repair_counters', chunk_size=1, stdout=out)
+        self.assertIn('Recounted 2 books', out.getvalue())
+        self.assertCopyCounts(self.book, 3, 3)
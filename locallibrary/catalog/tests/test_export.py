@@ -0,0 +1,107 @@
+# Tests for the streaming catalog exports (catalog/export.py), the export
+# view and the export_catalog management command.
+
+import datetime
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog.export import book_rows
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+User = get_user_model()
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='warehouse', password='1X<ISRUkw+tuK')
+        cls.user.user_permissions.add(
+            Permission.objects.get(codename='view_book'),
+            Permission.objects.get(codename='view_bookinstance'),
+        )
+        User.objects.create_user(username='patron', password='2HJ1vRV0Z&3iD')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        genres = [Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Poetry')]
+        for book_id in range(3):
+            book = Book.objects.create(title=f'Title {book_id}', isbn=f'{book_id:013}', author=author)
+            book.genre.set(genres)
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=cls.user,
+                                        due_back=datetime.date(2030, 1, 1))
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse('export', args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_permissions(self):
+        response = self.client.get(reverse('export', args=['books']))
+        self.assertEqual(response.status_code, 302)
+        self.client.login(username='patron', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('export', args=['copies']))
+        self.assertEqual(response.status_code, 403)
+
+    def test_books_csv(self):
+        self.client.login(username='warehouse', password='1X<ISRUkw+tuK')
+        lines = self.export('books').splitlines()
+        self.assertEqual(lines[0], 'id,title,isbn,author_id,author,genres,languages,summary,updated_at')
+        self.assertEqual(len(lines), 4)
+        self.assertIn('"Smith, John",Fantasy;Poetry', lines[1])
+
+    def test_copies_jsonl(self):
+        self.client.login(username='warehouse', password='1X<ISRUkw+tuK')
+        rows = [json.loads(line) for line in self.export('copies', format='jsonl').splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['borrower'], 'warehouse')
+        self.assertEqual(rows[0]['due_back'], '2030-01-01')
+
+    def test_incremental_export(self):
+        self.client.login(username='warehouse', password='1X<ISRUkw+tuK')
+        cutoff = timezone.now()
+        Book.objects.filter(title='Title 1').update(updated_at=cutoff + datetime.timedelta(seconds=1))
+        Book.objects.exclude(title='Title 1').update(updated_at=cutoff - datetime.timedelta(days=1))
+        rows = self.export('books', format='jsonl', since=cutoff.isoformat()).splitlines()
+        self.assertEqual([json.loads(row)['title'] for row in rows], ['Title 1'])
+        response = self.client.get(reverse('export', args=['books']), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_incremental_export_after_related_changes(self):
+        # Changes to a book's genres, languages or author names show up in
+        # its exported row, so they count as writes of the book.
+        def exported_after(change):
+            Book.objects.update(updated_at=timezone.now() - datetime.timedelta(days=1))
+            cutoff = timezone.now()
+            change()
+            return sorted(row['title'] for row in book_rows(since=cutoff))
+
+        books = {book.title: book for book in Book.objects.all()}
+        fantasy, poetry = Genre.objects.order_by('name')
+        self.assertEqual(exported_after(lambda: books['Title 0'].genre.remove(poetry)), ['Title 0'])
+        self.assertEqual(exported_after(lambda: fantasy.book_set.remove(books['Title 1'])), ['Title 1'])
+        french = Language.objects.create(name='French')
+        self.assertEqual(exported_after(lambda: books['Title 2'].language.add(french)), ['Title 2'])
+        self.assertEqual(exported_after(lambda: french.delete()), ['Title 2'])
+        author = Author.objects.get()
+        author.last_name = 'Smythe'
+        self.assertEqual(exported_after(author.save), ['Title 0', 'Title 1', 'Title 2'])
+
+    def test_flat_query_count(self):
+        # One query for the books of each chunk, plus the genre and language prefetches
+        self.client.login(username='warehouse', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('export', args=['books']))
+        with self.assertNumQueries(3):
+            b''.join(response.streaming_content)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_catalog', 'copies', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'id,book_id,isbn,title,imprint,status,due_back,borrower,updated_at')
+        self.assertEqual(len(lines), 4)
@@ -0,0 +1,143 @@
+# Tests for the faceted browse page and its facet counts (catalog/facets.py).
+
+from dataclasses import replace
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.facets import FacetFilter, compute_facet_counts, get_facet_counts
+from catalog.models import Author, Book, BookInstance, Genre, Language
+
+
+class FacetCountsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.smith = Author.objects.create(first_name='John', last_name='Smith')
+        cls.jones = Author.objects.create(first_name='Ann', last_name='Jones')
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        cls.poetry = Genre.objects.create(name='Poetry')
+        cls.english = Language.objects.create(name='English')
+        cls.french = Language.objects.create(name='French')
+        books = [
+            # title, author, genres, languages, available copies
+            ('One', cls.smith, [cls.fantasy], [cls.english], 1),
+            ('Two', cls.smith, [cls.fantasy, cls.poetry], [cls.english, cls.french], 0),
+            ('Three', cls.jones, [cls.poetry], [cls.french], 2),
+            ('Four', cls.jones, [], [cls.english], 0),
+        ]
+        for number, (title, author, genres, languages, available) in enumerate(books):
+            book = Book.objects.create(title=title, isbn=f'{number}', author=author)
+            book.genre.set(genres)
+            book.language.set(languages)
+            for _ in range(available):
+                BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o')
+
+    def setUp(self):
+        cache.clear()
+
+    def naive_counts(self, facet_filter):
+        """The counts worked out one query per facet value: the books listed once it is selected."""
+
+        def listed(**changes):
+            return replace(facet_filter, **changes).apply(Book.objects.all()).count()
+
+        return {
+            'books': listed(),
+            'available': listed(available=True),
+            'genre': {genre.pk: listed(genre=genre.pk) for genre in Genre.objects.all()},
+            'language': {language.pk: listed(language=language.pk) for language in Language.objects.all()},
+            'author': {author.pk: listed(author=author.pk) for author in Author.objects.all()},
+        }
+
+    def assertCountsRight(self, facet_filter):
+        counts = compute_facet_counts(facet_filter)
+        expected = self.naive_counts(facet_filter)
+        self.assertEqual((counts['books'], counts['available']), (expected['books'], expected['available']))
+        for name in ['genre', 'language', 'author']:
+            self.assertEqual(
+                {pk: count for pk, label, count in counts[name]},
+                {pk: count for pk, count in expected[name].items() if count},
+                name,
+            )
+
+    def test_counts_match_per_value_queries(self):
+        for facet_filter in [
+            FacetFilter(),
+            FacetFilter(genre=self.fantasy.pk),
+            FacetFilter(language=self.french.pk, available=True),
+            FacetFilter(genre=self.poetry.pk, author=self.jones.pk),
+            FacetFilter(available=True),
+        ]:
+            with self.subTest(facet_filter=facet_filter):
+                self.assertCountsRight(facet_filter)
+
+    def test_a_few_grouped_queries(self):
+        # The counters serve the genres and languages without a filter.
+        with self.assertNumQueries(4):
+            compute_facet_counts(FacetFilter())
+        with self.assertNumQueries(4):
+            counts = compute_facet_counts(FacetFilter(genre=self.fantasy.pk))
+        # Another genre replaces the selected one: the genres are counted
+        # over all books, the other facets over the fantasy books.
+        self.assertEqual(counts['genre'], [(self.fantasy.pk, 'Fantasy', 2), (self.poetry.pk, 'Poetry', 2)])
+        self.assertEqual(counts['author'], [(self.smith.pk, 'Smith, John', 2)])
+        self.assertEqual((counts['books'], counts['available']), (2, 1))
+
+    def test_cached_until_catalog_changes(self):
+        facet_filter = FacetFilter(genre=self.poetry.pk)
+        get_facet_counts(facet_filter)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_facet_counts(facet_filter)['books'], 2)
+        Book.objects.get(title='One').genre.add(self.poetry)
+        self.assertEqual(get_facet_counts(facet_filter)['books'], 3)
+        BookInstance.objects.filter(book__title='Three', status='a').delete()
+        self.assertEqual(get_facet_counts(facet_filter)['available'], 1)
+        self.english.name = 'British English'
+        self.english.save()
+        self.assertIn('British English', [label for pk, label, count in get_facet_counts(facet_filter)['language']])
+
+    def test_filter_from_query(self):
+        facet_filter = FacetFilter.from_query(QueryDict('genre=3&language=x&author=-1&available=1&page=2'))
+        self.assertEqual(facet_filter, FacetFilter(genre=3, available=True))
+        self.assertEqual(facet_filter.query(), 'genre=3&available=1')
+        self.assertEqual(facet_filter.query(genre=None, author=5), 'author=5&available=1')
+
+
+class BookBrowseViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        for number in range(15):
+            book = Book.objects.create(title=f'Title {number:02}', isbn=f'{number}', author=author)
+            if number % 3 == 0:
+                book.genre.add(cls.fantasy)
+                BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_browse(self):
+        response = self.client.get(reverse('browse'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_browse.html')
+        self.assertContains(response, '15 books')
+        self.assertContains(response, f'<a href="?genre={self.fantasy.pk}">Fantasy</a> (5)', html=True)
+        self.assertContains(response, '<a href="?available=1">Available now</a> (5)', html=True)
+
+    def test_filtered(self):
+        response = self.client.get(reverse('browse'), {'genre': self.fantasy.pk, 'available': '1'})
+        self.assertEqual([book.title for book in response.context['book_list']], [f'Title {n:02}' for n in range(0, 15, 3)])
+        self.assertContains(response, '<a href="?available=1">clear</a>', html=True)
+        self.assertContains(response, f'<a href="?genre={self.fantasy.pk}">clear</a>', html=True)
+
+    def test_anonymous_page_cached(self):
+        url = reverse('browse') + '?available=1'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        BookInstance.objects.filter(status='a').first().delete()
+        self.assertContains(self.client.get(url), '4 books')
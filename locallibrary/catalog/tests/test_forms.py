@@ -41,3 +41,30 @@ class RenewBookFormTest(TestCase):
         date = timezone.localtime() + datetime.timedelta(weeks=4)
         form = RenewBookForm(data={'renewal_date': date})
         self.assertTrue(form.is_valid())
+
+
+from catalog.forms import BulkLoanForm
+import uuid
+
+class BulkLoanFormTest(TestCase):
+    def test_copy_ids_pasted_or_repeated(self):
+        first, second = uuid.uuid4(), uuid.uuid4()
+        form = BulkLoanForm(data={'copies': f'{first}, {second}\n{first}', 'action': 'return'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['copies'], [first, second])
+
+    def test_invalid_copy_id(self):
+        form = BulkLoanForm(data={'copies': 'not-a-uuid', 'action': 'return'})
+        self.assertFalse(form.is_valid())
+
+    def test_renew_needs_valid_date(self):
+        copies = str(uuid.uuid4())
+        form = BulkLoanForm(data={'copies': copies, 'action': 'renew'})
+        self.assertFalse(form.is_valid())
+        date = datetime.date.today() + datetime.timedelta(weeks=5)
+        form = BulkLoanForm(data={'copies': copies, 'action': 'renew', 'renewal_date': date})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['renewal_date'], ['Invalid date - renewal more than 4 weeks ahead'])
+        date = datetime.date.today() + datetime.timedelta(weeks=2)
+        form = BulkLoanForm(data={'copies': copies, 'action': 'renew', 'renewal_date': date})
+        self.assertTrue(form.is_valid())
@@ -0,0 +1,252 @@
+# Tests for the reservation queue (catalog/holds.py, the Hold model and the
+# hold views).
+
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, skipUnlessDBFeature
+from django.urls import reverse
+
+from catalog.circulation import RESERVED, RETURNED, return_copies
+from catalog.counters import books_with_wrong_counts, recount_book_counts
+from catalog.holds import _claim, _Taken, allocate_copies, cancel_hold, lend_held_copy, place_hold
+from catalog.models import Author, Book, BookInstance, Hold
+from catalog.tests.test_query_plans import QueryPlanTestMixin
+
+User = get_user_model()
+
+
+class HoldQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patrons = [User.objects.create_user(username=f'reader{number}', password='2HJ1vRV0Z&3iD') for number in range(3)]
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', isbn='1', author=author)
+        cls.copies = [
+            BookInstance.objects.create(book=cls.book, imprint='Imprint', status='o', due_back=datetime.date.today())
+            for _ in range(2)
+        ]
+
+    def assertCountersRight(self):
+        self.assertFalse(books_with_wrong_counts().exists())
+
+    def queue(self):
+        return [(hold.patron.username, hold.position) for hold in Hold.objects.waiting().with_position().select_related('patron')]
+
+    def test_positions(self):
+        for patron in self.patrons:
+            place_hold(self.book.pk, patron)
+        # Placing a hold twice keeps the patron's place.
+        self.assertEqual(place_hold(self.book.pk, self.patrons[0]).status, 'w')
+        self.assertEqual(self.queue(), [('reader0', 1), ('reader1', 2), ('reader2', 3)])
+        cancel_hold(Hold.objects.get(patron=self.patrons[0]))
+        self.assertEqual(self.queue(), [('reader1', 1), ('reader2', 2)])
+
+    def test_return_allocates_first_waiting_holds(self):
+        for patron in self.patrons:
+            place_hold(self.book.pk, patron)
+        outcomes = return_copies([self.copies[0].pk])
+        self.assertEqual(outcomes, {self.copies[0].pk: RESERVED})
+        hold = Hold.objects.get(patron=self.patrons[0])
+        self.assertEqual((hold.status, hold.copy_id), ('r', self.copies[0].pk))
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        self.assertEqual((copy.status, copy.borrower), ('r', self.patrons[0]))
+        return_copies([self.copies[1].pk])
+        self.assertEqual(Hold.objects.get(patron=self.patrons[1]).copy_id, self.copies[1].pk)
+        self.assertEqual(self.queue(), [('reader2', 1)])
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.reserved_count, self.book.available_count), (2, 0))
+        self.assertCountersRight()
+
+    def test_return_without_holds(self):
+        self.assertEqual(return_copies([self.copies[0].pk]), {self.copies[0].pk: RETURNED})
+        self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).status, 'a')
+
+    def test_hold_on_available_book_is_ready_at_once(self):
+        return_copies([self.copies[0].pk])
+        hold = place_hold(self.book.pk, self.patrons[0])
+        self.assertEqual((hold.status, hold.copy_id), ('r', self.copies[0].pk))
+        self.assertCountersRight()
+
+    def test_claimed_hold_is_not_claimed_again(self):
+        # Two returns that read the same head of the queue: the second claim
+        # matches no row and leaves its copy on the shelf.
+        hold = place_hold(self.book.pk, self.patrons[0])
+        BookInstance.objects.filter(book=self.book).update(status='a', borrower=None)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        _claim(hold.pk, self.patrons[0].pk, self.copies[0].pk, now)
+        with self.assertRaises(_Taken):
+            with transaction.atomic():
+                _claim(hold.pk, self.patrons[0].pk, self.copies[1].pk, now)
+        self.assertEqual(BookInstance.objects.get(pk=self.copies[1].pk).status, 'a')
+        self.assertEqual(Hold.objects.get(pk=hold.pk).copy_id, self.copies[0].pk)
+
+    def test_cancelled_ready_hold_passes_copy_on(self):
+        first, second = (place_hold(self.book.pk, patron) for patron in self.patrons[:2])
+        return_copies([self.copies[0].pk])
+        first.refresh_from_db()
+        self.assertTrue(cancel_hold(first))
+        self.assertEqual(first.status, 'x')
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.copy_id), ('r', self.copies[0].pk))
+        self.assertTrue(cancel_hold(second))
+        self.assertFalse(cancel_hold(second))
+        self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).status, 'a')
+        self.assertEqual(allocate_copies(self.book.pk), {})
+        self.assertCountersRight()
+
+    def test_reserved_copy_put_back_on_shelf(self):
+        first = place_hold(self.book.pk, self.patrons[0])
+        return_copies([self.copies[0].pk])
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        copy.status = 'a'
+        copy.borrower = None
+        copy.save()
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.copy_id), ('w', None))
+        # The released hold keeps its place and gets the copy back.
+        second = place_hold(self.book.pk, self.patrons[1])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.copy_id, second.status), ('r', self.copies[0].pk, 'w'))
+        self.assertCountersRight()
+
+    def test_copy_returned_with_save(self):
+        # Returning a copy from its admin page allocates it once saved.
+        hold = place_hold(self.book.pk, self.patrons[0])
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        copy.status = 'a'
+        copy.borrower = None
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.save()
+        hold.refresh_from_db()
+        copy.refresh_from_db()
+        self.assertEqual((hold.status, hold.copy_id, copy.status, copy.borrower), ('r', copy.pk, 'r', self.patrons[0]))
+        # So does adding a copy to the shelf.
+        second = place_hold(self.book.pk, self.patrons[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            new_copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.copy_id), ('r', new_copy.pk))
+        self.assertCountersRight()
+
+    def test_released_hold_gets_copy_on_shelf(self):
+        hold = place_hold(self.book.pk, self.patrons[0])
+        return_copies([self.copies[0].pk])
+        BookInstance.objects.filter(pk=self.copies[1].pk).update(status='a', borrower=None)
+        recount_book_counts([self.book.pk])
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        copy.status = 'm'
+        copy.borrower = None
+        with self.captureOnCommitCallbacks(execute=True):
+            copy.save()
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.copy_id), ('r', self.copies[1].pk))
+        self.assertCountersRight()
+
+    def test_reserved_copy_lent_to_its_patron(self):
+        hold = place_hold(self.book.pk, self.patrons[0])
+        return_copies([self.copies[0].pk])
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        copy.status = 'o'
+        copy.save()
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'c')
+
+    def test_reserved_copy_deleted(self):
+        hold = place_hold(self.book.pk, self.patrons[0])
+        return_copies([self.copies[0].pk])
+        BookInstance.objects.get(pk=self.copies[0].pk).delete()
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.copy_id), ('w', None))
+
+    def test_stale_ready_hold_does_not_block_allocation(self):
+        # The copy of a ready hold put back on the shelf behind the signals.
+        first = place_hold(self.book.pk, self.patrons[0])
+        return_copies([self.copies[0].pk])
+        BookInstance.objects.filter(pk=self.copies[0].pk).update(status='a', borrower=None)
+        recount_book_counts([self.book.pk])
+        second = place_hold(self.book.pk, self.patrons[1])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.copy_id, second.status), ('r', self.copies[0].pk, 'w'))
+
+    def test_lend_held_copy_no_longer_reserved(self):
+        hold = place_hold(self.book.pk, self.patrons[0])
+        return_copies([self.copies[0].pk])
+        hold.refresh_from_db()
+        BookInstance.objects.filter(pk=self.copies[0].pk).update(status='m')
+        recount_book_counts([self.book.pk])
+        self.assertFalse(lend_held_copy(hold, datetime.date.today()))
+        self.assertEqual(hold.status, 'r')
+        self.assertEqual(BookInstance.objects.get(pk=self.copies[0].pk).status, 'm')
+
+    def test_lend_held_copy(self):
+        hold = place_hold(self.book.pk, self.patrons[0])
+        self.assertFalse(lend_held_copy(hold, datetime.date.today()))
+        return_copies([self.copies[0].pk])
+        hold.refresh_from_db()
+        self.assertTrue(lend_held_copy(hold, datetime.date.today()))
+        copy = BookInstance.objects.get(pk=self.copies[0].pk)
+        self.assertEqual((hold.status, copy.status, copy.borrower), ('c', 'o', self.patrons[0]))
+        # The patron may queue for the book again.
+        self.assertNotEqual(place_hold(self.book.pk, self.patrons[0]).pk, hold.pk)
+        self.assertCountersRight()
+
+
+class HoldViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patron = User.objects.create_user(username='reader', password='2HJ1vRV0Z&3iD')
+        cls.other = User.objects.create_user(username='other', password='2HJ1vRV0Z&3iD')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.books = [Book.objects.create(title=f'Title {number}', isbn=f'{number}', author=author) for number in range(5)]
+
+    def setUp(self):
+        self.client.force_login(self.patron)
+
+    def test_place_hold(self):
+        self.assertEqual(self.client.get(reverse('book-hold', args=[self.books[0].pk])).status_code, 405)
+        response = self.client.post(reverse('book-hold', args=[self.books[0].pk]))
+        self.assertRedirects(response, reverse('my-holds'))
+        self.assertTrue(Hold.objects.filter(book=self.books[0], patron=self.patron, status='w').exists())
+
+    def test_my_holds(self):
+        for book in self.books:
+            place_hold(book.pk, self.other)
+            place_hold(book.pk, self.patron)
+        # Session, user and permissions, then one COUNT and one SELECT with
+        # the positions, however many holds.
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('my-holds'))
+        self.assertEqual([hold.position for hold in response.context['hold_list']], [2] * 5)
+        self.assertContains(response, 'number 2 in the queue')
+
+    def test_cancel_only_own_holds(self):
+        own = place_hold(self.books[0].pk, self.patron)
+        other = place_hold(self.books[0].pk, self.other)
+        self.assertEqual(self.client.post(reverse('hold-cancel', args=[other.pk])).status_code, 404)
+        self.assertRedirects(self.client.post(reverse('hold-cancel', args=[own.pk])), reverse('my-holds'))
+        self.assertEqual(Hold.objects.get(pk=own.pk).status, 'x')
+
+
+@skipUnlessDBFeature('supports_partial_indexes')
+class HoldQueryPlanTest(QueryPlanTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patron = User.objects.create_user(username='reader', password='2HJ1vRV0Z&3iD')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        for number in range(20):
+            book = Book.objects.create(title=f'Title {number}', isbn=f'{number}', author=author)
+            place_hold(book.pk, cls.patron)
+
+    def test_my_holds_uses_indexes(self):
+        self.client.force_login(self.patron)
+        self.assertViewUsesIndexes(reverse('my-holds'))
+
+    def test_queue_head_uses_index(self):
+        sql, params = Hold.objects.waiting().filter(book_id=1).order_by('id').values('pk')[:1].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any('hold_queue_idx' in step for step in plan), plan)
@@ -0,0 +1,80 @@
+# Tests for the per-request SQL instrumentation (catalog/instrumentation.py).
+
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.instrumentation import QueryInstrumentationMiddleware
+from catalog.models import Author, Book
+
+
+def timings(response):
+    """Return the Server-Timing header as {name: (duration, description)}."""
+    result = {}
+    for metric in response['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        result[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+    return result
+
+
+@override_settings(CATALOG_INSTRUMENTATION_SAMPLE_RATE=1)
+class QueryInstrumentationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        for number in range(6):
+            Book.objects.create(title=f'Book {number}', isbn=f'ISBN{number}', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('books'))
+        metrics = timings(response)
+        self.assertEqual(set(metrics), {'db', 'tpl', 'total'})
+        self.assertEqual(metrics['db'][1], f'{len(queries)} queries')
+        self.assertGreater(metrics['tpl'][0] + metrics['total'][0], 0)
+
+    async def test_async_request(self):
+        response = await self.async_client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+    @override_settings(CATALOG_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_request_untouched(self):
+        response = self.client.get(reverse('books'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_repeated_queries_logged_as_warning(self):
+        def n_plus_one(request):
+            for book in Book.objects.all():
+                Author.objects.get(pk=book.author_id)
+            return HttpResponse()
+
+        middleware = QueryInstrumentationMiddleware(n_plus_one)
+        with self.assertLogs('catalog.instrumentation', 'WARNING') as logs:
+            middleware(RequestFactory().get('/catalog/books/'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/catalog/books/')
+        self.assertEqual(record['queries'], 7)
+        [repeated] = record['repeated']
+        self.assertEqual(repeated['count'], 6)
+        self.assertIn('catalog_author', repeated['sql'])
+
+    def test_distinct_queries_logged_as_info(self):
+        def view(request):
+            list(Book.objects.select_related('author'))
+            return HttpResponse()
+
+        middleware = QueryInstrumentationMiddleware(view)
+        with self.assertLogs('catalog.instrumentation', 'INFO') as logs:
+            middleware(RequestFactory().get('/'))
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(logs.records[0].metrics['repeated'], [])
@@ -0,0 +1,185 @@
+# Query plan tests for the catalog views.
+# Each test requests a page, captures the SQL it ran and asks SQLite for the
+# plan of every statement (EXPLAIN QUERY PLAN). A step reading a catalog
+# table with a bare "SCAN <table>" means a full table scan, which is what the
+# indexes declared on the models are there to avoid.
+
+import datetime
+import re
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.pagination import seek_filter
+
+User = get_user_model()
+
+
+class QueryPlanTestMixin:
+    """Assertions on the SQLite query plans of the SQL a request runs."""
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def table_scans(self, sql):
+        """Return the catalog tables the statement scans in full, aliases resolved.
+
+        Subqueries may reuse an alias for different tables (U0, U1...); a
+        scan of such an alias is reported as all the tables it may stand for.
+        """
+        aliases = {}
+        for table, alias in re.findall(r'"(catalog_\w+)"(?: (?:AS )?"?(\w+)"?)?', sql):
+            if alias:
+                aliases.setdefault(alias, set()).add(table)
+        scans = []
+        for step in self.query_plan(sql):
+            match = re.fullmatch(r'SCAN (\w+)', step)
+            if match is None:
+                continue
+            name = match.group(1)
+            scans.extend(sorted(aliases.get(name, {name} if name.startswith('catalog_') else ())))
+        return scans
+
+    def assertQueryUsesIndex(self, queryset, index):
+        """Fail unless the plan of ``queryset`` reads the index named ``index``."""
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any(f'INDEX {index}' in step for step in plan), plan)
+
+    def assertQuerySeeksIndex(self, queryset, index):
+        """Fail unless the plan of ``queryset`` searches a range of the index named ``index``.
+
+        Unlike assertQueryUsesIndex(), walking the whole index in order
+        ("SCAN ... USING INDEX") does not count.
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any(step.startswith('SEARCH') and f'INDEX {index} (' in step for step in plan), plan)
+
+    def assertViewUsesIndexes(self, url, allowed_scans=()):
+        """Request ``url`` and fail on any full scan of a catalog table.
+
+        ``allowed_scans`` lists tables that may be scanned, e.g. because no
+        index can serve a substring match on them.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for query in queries:
+            sql = query['sql']
+            if 'catalog_' not in sql:
+                continue
+            if sql.startswith('SELECT COUNT(*)') and ' WHERE ' not in sql:
+                # Counting a whole table reads all of it by definition.
+                continue
+            scans = [table for table in self.table_scans(sql) if table not in allowed_scans]
+            self.assertEqual(scans, [], msg=f'Full table scan in: {sql}')
+        return response
+
+
+@skipUnlessDBFeature('supports_partial_indexes')
+class CatalogViewQueryPlanTest(QueryPlanTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        genre = Genre.objects.create(name='Science Fiction')
+        language = Language.objects.create(name='English')
+        today = datetime.date.today()
+        for author_id in range(5):
+            author = Author.objects.create(first_name=f'First {author_id}', last_name=f'Last {author_id}')
+            for book_id in range(10):
+                book = Book.objects.create(
+                    title=f'Title {author_id}-{book_id}',
+                    isbn=f'{author_id}{book_id:012}',
+                    author=author,
+                )
+                book.genre.set([genre])
+                book.language.set([language])
+                for copy in range(4):
+                    BookInstance.objects.create(
+                        book=book,
+                        imprint='Imprint',
+                        status='maor'[copy],
+                        due_back=today + datetime.timedelta(days=copy - 1),
+                        borrower=cls.librarian if copy == 1 else None,
+                    )
+        cls.book = book
+        cls.author = author
+        # No ANALYZE: without statistics SQLite plans as if every table were
+        # large, which is the situation these indexes are meant for.
+
+    def setUp(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+
+    def test_book_list(self):
+        self.assertViewUsesIndexes(reverse('books'))
+
+    def test_book_list_keyset_page(self):
+        # A deep page starts reading the index at the cursor, not at the
+        # first title.
+        books = Book.objects.order_by('title', 'id').filter(seek_filter(['title', 'id'], [self.book.title, self.book.pk]))
+        self.assertQuerySeeksIndex(books[:11], 'book_title_id_idx')
+
+    def test_book_detail(self):
+        self.assertViewUsesIndexes(reverse('book-detail', args=[self.book.pk]))
+
+    def test_author_list(self):
+        self.assertViewUsesIndexes(reverse('authors'))
+
+    def test_author_detail(self):
+        self.assertViewUsesIndexes(reverse('author-detail', args=[self.author.pk]))
+
+    def test_my_borrowed(self):
+        self.assertViewUsesIndexes(reverse('my-borrowed'))
+
+    def test_all_borrowed(self):
+        self.assertViewUsesIndexes(reverse('all-borrowed'))
+        self.assertViewUsesIndexes(reverse('all-borrowed') + '?overdue=on')
+
+    def test_overdue(self):
+        self.assertViewUsesIndexes(reverse('overdue'))
+
+    def test_index(self):
+        # The statistics count every copy, book and author, and a substring
+        # match on the genre name cannot use an index: reading these tables
+        # whole is the point of the query, whose figures are cached.
+        self.assertViewUsesIndexes(reverse('index'), allowed_scans=[
+            'catalog_author', 'catalog_book', 'catalog_book_genre', 'catalog_bookinstance', 'catalog_genre',
+        ])
+
+    def test_browse(self):
+        # The page and its facet GROUP BYs, filtered on a genre or an author.
+        # With only a genre selected, the genre facet lists every genre from
+        # its counter.
+        genre = self.book.genre.get()
+        self.assertViewUsesIndexes(reverse('browse') + f'?genre={genre.pk}', allowed_scans=['catalog_genre'])
+        self.assertViewUsesIndexes(reverse('browse') + f'?author={self.author.pk}&available=1')
+
+    def test_bookinstance_indexes(self):
+        # Every index on the copies table, with a query it serves.
+        today = datetime.date.today()
+        copies = BookInstance.objects.all()
+        self.assertQueryUsesIndex(copies.order_by('due_back', 'id')[:20], 'bookinst_due_back_idx')
+        self.assertQueryUsesIndex(copies.filter(status__exact='m').order_by('due_back')[:20], 'bookinst_due_back_idx')
+        self.assertQueryUsesIndex(copies.filter(book=self.book), 'bookinst_book_status_idx')
+        self.assertQueryUsesIndex(copies.filter(book=self.book, status__exact='a'), 'bookinst_book_status_idx')
+        self.assertQueryUsesIndex(
+            copies.on_loan().filter(borrower=self.librarian).order_by('due_back'), 'bookinst_loan_borrower_idx',
+        )
+        self.assertQueryUsesIndex(copies.overdue(today).order_by('due_back', 'id'), 'bookinst_loan_due_idx')
+        # The foreign key index: a user's copies of any status, as when the
+        # user is deleted and their copies are set to no borrower.
+        self.assertQueryUsesIndex(copies.filter(borrower=self.librarian), 'catalog_bookinstance_borrower_id')
+        self.assertQueryUsesIndex(copies.filter(updated_at__gte=today).order_by(), 'catalog_bookinstance_updated_at')
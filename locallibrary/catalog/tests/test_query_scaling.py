@@ -0,0 +1,172 @@
+# Query count scaling tests for the catalog pages.
+# Each test renders a page with a few related rows (books, copies, loans,
+# ...), then again after adding many more, and fails if the second request
+# ran more queries: a page whose query count grows with its data has an
+# N+1 pattern, a query per row that a select_related(), prefetch_related()
+# or annotation should have folded into the others. The cache is cleared
+# before every request so that cached pages and fragments hide nothing.
+# The streaming exports are left out: they fetch their rows in chunks on
+# purpose (see catalog/export.py).
+
+import datetime
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.search import index_books
+
+User = get_user_model()
+
+
+class QueryScalingTestMixin:
+    """Assert that a page runs as many queries with many rows as with few."""
+
+    small = 10
+    large = 500
+
+    def page_queries(self, url):
+        """Return the SQL of the queries the page runs, parameters left out."""
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        cache.clear()
+        with connection.execute_wrapper(record):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return queries
+
+    def assertConstantQueries(self, url, grow):
+        """Request url after grow(n) has added ``small``, then ``large`` rows."""
+        grow(self.small)
+        # Warm up the per-process caches (content types, permissions, ...).
+        self.page_queries(url)
+        few = self.page_queries(url)
+        grow(self.large - self.small)
+        many = self.page_queries(url)
+        if len(many) > len(few):
+            repeated = Counter(many) - Counter(few)
+            self.fail(
+                f'{url} ran {len(few)} queries with {self.small} rows and {len(many)} with {self.large}:\n'
+                + '\n'.join(f'{count} more x {sql}' for sql, count in repeated.most_common(5))
+            )
+
+
+class CatalogQueryScalingTest(QueryScalingTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('librarian', password='2HJ1vRV0Z&3iD')
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.language = Language.objects.create(name='English')
+        cls.book = Book.objects.create(title='Book Title', isbn='ABCDEFG', author=cls.author)
+        cls.book.genre.add(cls.genre)
+        cls.book.language.add(cls.language)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.count = 0
+
+    # The rows are added with bulk_create(), much faster than saving them one
+    # by one. The pages only read them, so the derived data that the model
+    # signals would maintain is not needed, except the search index.
+
+    def numbers(self, n):
+        self.count += n
+        return range(self.count - n, self.count)
+
+    def add_books(self, n, author=None):
+        """Add n books with a genre, a language and a copy, by the given or new authors."""
+        numbers = self.numbers(n)
+        if author is None:
+            authors = Author.objects.bulk_create([Author(first_name='A', last_name=f'{number}') for number in numbers])
+        else:
+            authors = [author] * n
+        books = Book.objects.bulk_create([
+            Book(title=f'Book {number:09d}', isbn=f'{number:013d}', author=author)
+            for number, author in zip(numbers, authors)
+        ])
+        Book.genre.through.objects.bulk_create([Book.genre.through(book=book, genre=self.genre) for book in books])
+        Book.language.through.objects.bulk_create([Book.language.through(book=book, language=self.language) for book in books])
+        BookInstance.objects.bulk_create([BookInstance(book=book, imprint='Imprint', status='a') for book in books])
+        index_books([book.pk for book in books])
+        return books
+
+    def add_copies(self, n, book=None, **fields):
+        BookInstance.objects.bulk_create([BookInstance(book=book or self.book, imprint='Imprint', **fields) for _ in range(n)])
+
+    def add_loans(self, n, days=7):
+        """Add n books with a copy on loan to the user, due in ``days`` days."""
+        due_back = datetime.date.today() + datetime.timedelta(days=days)
+        BookInstance.objects.filter(book__in=self.add_books(n)).update(status='o', borrower=self.user, due_back=due_back)
+
+    def add_genres_and_languages(self, n):
+        numbers = self.numbers(n)
+        genres = Genre.objects.bulk_create([Genre(name=f'Genre {number}') for number in numbers])
+        languages = Language.objects.bulk_create([Language(name=f'Language {number}') for number in numbers])
+        self.book.genre.add(*genres)
+        self.book.language.add(*languages)
+
+    def test_index(self):
+        self.assertConstantQueries(reverse('index'), self.add_books)
+
+    def test_book_list(self):
+        self.assertConstantQueries(reverse('books'), self.add_books)
+
+    def test_book_list_last_page(self):
+        self.assertConstantQueries(reverse('books') + '?page=last', self.add_books)
+
+    def test_book_detail_copies(self):
+        self.assertConstantQueries(reverse('book-detail', args=[self.book.pk]), lambda n: self.add_copies(n, status='o', due_back=datetime.date.today()))
+
+    def test_book_detail_genres_and_languages(self):
+        self.assertConstantQueries(reverse('book-detail', args=[self.book.pk]), self.add_genres_and_languages)
+
+    def test_author_list(self):
+        self.assertConstantQueries(reverse('authors'), self.add_books)
+
+    def test_author_detail(self):
+        self.assertConstantQueries(reverse('author-detail', args=[self.author.pk]), lambda n: self.add_books(n, self.author))
+
+    def test_search(self):
+        self.assertConstantQueries(reverse('search') + '?q=Book', self.add_books)
+
+    def test_browse(self):
+        url = reverse('browse') + f'?genre={self.genre.pk}&language={self.language.pk}'
+        self.assertConstantQueries(url, self.add_books)
+        self.assertConstantQueries(reverse('browse'), self.add_genres_and_languages)
+
+    def test_my_borrowed(self):
+        self.assertConstantQueries(reverse('my-borrowed'), self.add_loans)
+
+    def test_all_borrowed(self):
+        self.assertConstantQueries(reverse('all-borrowed'), self.add_loans)
+
+    def test_overdue(self):
+        self.assertConstantQueries(reverse('overdue'), lambda n: self.add_loans(n, days=-7))
+
+    def test_book_forms(self):
+        self.assertConstantQueries(reverse('book-create'), self.add_genres_and_languages)
+        self.assertConstantQueries(reverse('book-update', args=[self.book.pk]), self.add_genres_and_languages)
+
+    def test_book_delete(self):
+        self.assertConstantQueries(reverse('book-delete', args=[self.book.pk]), self.add_copies)
+
+    def test_author_delete(self):
+        self.assertConstantQueries(reverse('author-delete', args=[self.author.pk]), lambda n: self.add_books(n, self.author))
+
+    def test_admin_changelists(self):
+        self.assertConstantQueries(reverse('admin:catalog_book_changelist'), self.add_books)
+        self.assertConstantQueries(reverse('admin:catalog_author_changelist'), self.add_books)
+        self.assertConstantQueries(reverse('admin:catalog_bookinstance_changelist'), self.add_loans)
+
+    def test_admin_change_forms(self):
+        self.assertConstantQueries(reverse('admin:catalog_book_change', args=[self.book.pk]), self.add_copies)
+        self.assertConstantQueries(reverse('admin:catalog_author_change', args=[self.author.pk]), lambda n: self.add_books(n, self.author))
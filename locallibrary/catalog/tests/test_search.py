@@ -0,0 +1,102 @@
+# Tests for the full-text search index (catalog/search.py), the search view
+# and the rebuild_search_index management command.
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, Genre
+from catalog.search import SEARCH_TABLE, SearchResults, match_expression
+
+
+def search(query):
+    results = SearchResults(query)
+    return [book.title for book in results[0:results.count()]]
+
+
+class SearchIndexTest(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        self.genre = Genre.objects.create(name='Fantasy')
+        self.book = Book.objects.create(
+            title='A Wizard of Earthsea',
+            summary='A young wizard on the islands of Earthsea.',
+            isbn='9780553383041',
+            author=self.author,
+        )
+        self.book.genre.set([self.genre])
+        Book.objects.create(title='The Dispossessed', summary='Anarres and Urras.', isbn='9780061054884', author=self.author)
+
+    def test_match_expression_quotes_input(self):
+        self.assertEqual(match_expression('wizard AND "earth'), '"wizard" "AND" "earth"*')
+        self.assertEqual(match_expression('  ?! '), '')
+
+    def test_search_fields(self):
+        self.assertEqual(search('earthsea'), ['A Wizard of Earthsea'])
+        self.assertCountEqual(search('guin'), ['A Wizard of Earthsea', 'The Dispossessed'])
+        self.assertEqual(search('fantasy'), ['A Wizard of Earthsea'])
+        self.assertEqual(search('9780061054884'), ['The Dispossessed'])
+        self.assertEqual(search('wiz'), ['A Wizard of Earthsea'])
+
+    def test_title_ranks_above_summary(self):
+        Book.objects.create(title='Anarres', summary='Nothing else.', isbn='1', author=self.author)
+        self.assertEqual(search('anarres'), ['Anarres', 'The Dispossessed'])
+
+    def test_index_follows_writes(self):
+        self.book.title = 'Tombs of Atuan'
+        self.book.save()
+        self.assertEqual(search('atuan'), ['Tombs of Atuan'])
+        self.assertEqual(search('wizard'), ['Tombs of Atuan'])  # still in the summary
+
+        self.author.last_name = 'LeGuin'
+        self.author.save()
+        self.assertEqual(len(search('leguin')), 2)
+
+        self.genre.name = 'High Fantasy'
+        self.genre.save()
+        self.assertEqual(search('high'), ['Tombs of Atuan'])
+        self.book.genre.clear()
+        self.assertEqual(search('high'), [])
+
+        self.book.delete()
+        self.assertEqual(search('atuan'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        self.assertEqual(search('earthsea'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 2 books', out.getvalue())
+        self.assertEqual(search('earthsea'), ['A Wizard of Earthsea'])
+
+
+class BookSearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        for book_id in range(15):
+            Book.objects.create(title=f'Dragon {book_id}', isbn=f'{book_id:013}', author=author)
+
+    def test_ranked_paginated_results(self):
+        response = self.client.get(reverse('search'), {'q': 'dragon'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_search.html')
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['book_list']), 10)
+        self.assertEqual(response.context['paginator'].count, 15)
+        response = self.client.get(reverse('search'), {'q': 'dragon', 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 5)
+
+    def test_query_count(self):
+        # COUNT and MATCH on the index, then the page of books by id
+        with self.assertNumQueries(3):
+            self.client.get(reverse('search'), {'q': 'dragon'})
+
+    def test_empty_query(self):
+        response = self.client.get(reverse('search'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 0)
@@ -0,0 +1,60 @@
+# Tests for the cached home page statistics (catalog/stats.py).
+# The cache is cleared before each test because the local memory cache
+# outlives the transaction that every TestCase rolls back.
+
+import datetime
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre
+from catalog.stats import get_catalog_stats
+
+
+class CatalogStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        self.fiction = Genre.objects.create(name='Science Fiction')
+        Genre.objects.create(name='Poetry')
+        self.book = Book.objects.create(title='Book Title', isbn='ABCDEFG', author=author)
+        self.book.genre.set([self.fiction])
+        for status in ['a', 'a', 'o', 'm']:
+            BookInstance.objects.create(book=self.book, imprint='Imprint', status=status)
+
+    def test_counts(self):
+        stats = get_catalog_stats()
+        self.assertEqual(stats['num_books'], 1)
+        self.assertEqual(stats['num_instances'], 4)
+        self.assertEqual(stats['num_instances_available'], 2)
+        self.assertEqual(stats['num_instances_on_loan'], 1)
+        self.assertEqual(stats['num_instances_maintenance'], 1)
+        self.assertEqual(stats['num_authors'], 1)
+        self.assertEqual(stats['num_genres_fiction'], 1)
+        self.assertEqual(stats['num_books_with_fiction'], 1)
+
+    def test_overdue_count(self):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', due_back=yesterday)
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a', due_back=yesterday)
+        self.assertEqual(get_catalog_stats()['num_instances_overdue'], 1)
+
+    def test_single_query_then_cached(self):
+        with self.assertNumQueries(1):
+            get_catalog_stats()
+        with self.assertNumQueries(0):
+            get_catalog_stats()
+
+    def test_write_invalidates_cache(self):
+        get_catalog_stats()
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        self.assertEqual(get_catalog_stats()['num_instances_available'], 3)
+        self.book.genre.clear()
+        self.assertEqual(get_catalog_stats()['num_books_with_fiction'], 0)
+
+    def test_index_view_uses_stats(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_instances'], 4)
+        self.assertTemplateUsed(response, 'index.html')
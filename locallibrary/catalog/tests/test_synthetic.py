@@ -0,0 +1,113 @@
+# Tests for the synthetic catalog generator and the per-view benchmarks
+# (catalog/synthetic.py, catalog/benchmarks.py and their commands).
+
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.db.models import Count, Q
+from django.test import TestCase
+
+from catalog import urls as catalog_urls
+from catalog.benchmarks import POST_ONLY_URLS, catalog_targets, compare_results, percentile, run_benchmarks
+from catalog.models import Book, BookInstance, Genre
+from catalog.synthetic import CatalogGenerator
+
+User = get_user_model()
+
+
+class GenerateCatalogCommandTest(TestCase):
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_catalog', books=50, copies=200, patrons=10, loans=80, chunk_size=20, stdout=out, **options)
+        return out.getvalue()
+
+    def test_generates_catalog(self):
+        out = self.generate()
+        self.assertEqual(Book.objects.filter(isbn__startswith='SYN').count(), 50)
+        self.assertEqual(User.objects.filter(username__startswith='reader').count(), 10)
+        copies = BookInstance.objects.count()
+        loans = BookInstance.objects.filter(status__exact='o')
+        self.assertIn(f'{copies} copies', out)
+        self.assertIn(f'{loans.count()} loans', out)
+        self.assertFalse(loans.filter(Q(borrower=None) | Q(due_back=None)).exists())
+
+    def test_loans_concentrated_on_popular_books(self):
+        demand = CatalogGenerator(books=1000, copies=1000, patrons=1, loans=10000).loan_demand()
+        self.assertEqual(sum(demand.values()), 10000)
+        # One book in a hundred draws about half the loans.
+        self.assertGreater(sum(sorted(demand.values())[-10:]), 10000 / 3)
+        # The popular books have all their copies on loan.
+        self.generate()
+        loans = Count('bookinstance', filter=Q(bookinstance__status='o'))
+        book = Book.objects.annotate(loans=loans, copies=Count('bookinstance')).order_by('-loans').first()
+        self.assertEqual(book.loans, book.copies)
+
+    def test_counters_match_copies(self):
+        self.generate()
+        for genre in Genre.objects.all():
+            books = Book.objects.filter(genre=genre)
+            self.assertEqual(genre.book_count, books.count())
+            self.assertEqual(genre.available_count, BookInstance.objects.filter(book__in=books, status='a').count())
+
+    def test_same_seed_same_catalog(self):
+        self.generate(seed=3)
+        first = list(Book.objects.order_by('isbn').values_list('title', 'author__last_name'))
+        BookInstance.objects.all().delete()
+        Book.objects.all().delete()
+        User.objects.all().delete()
+        self.generate(seed=3)
+        self.assertEqual(list(Book.objects.order_by('isbn').values_list('title', 'author__last_name')), first)
+
+    def test_refuses_to_run_twice(self):
+        self.generate()
+        with self.assertRaises(CommandError):
+            self.generate()
+
+
+class BenchmarkViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_catalog', books=20, copies=40, patrons=5, loans=10, stdout=StringIO())
+
+    def test_every_catalog_url_benchmarked(self):
+        names = {pattern.name for pattern in catalog_urls.urlpatterns} - POST_ONLY_URLS
+        self.assertLessEqual(names, {name.split(' ')[0] for name, path in catalog_targets()})
+
+    def test_run(self):
+        results = run_benchmarks(repeat=2, names=['books', 'book-detail', 'admin:catalog.book'])
+        self.assertEqual(results['scale']['books'], 20)
+        self.assertEqual([result['name'] for result in results['results']], ['books', 'book-detail', 'admin:catalog.book'])
+        for result in results['results']:
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+        # The run commits like production requests and cleans up after itself.
+        self.assertFalse(User.objects.filter(username__startswith='benchmark').exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_compare(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump({'created': 'then', 'scale': {'books': 20}, 'results': [
+                {'name': 'books', 'p95_ms': 1000.0, 'queries': 99},
+                {'name': 'authors', 'p95_ms': 0.001, 'queries': 0},
+            ]}, f)
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 page(s) regressed'):
+            call_command(
+                'benchmark_views', repeat=1, pages=['books', 'authors'], compare=f.name,
+                fail_on_regression=True, stdout=out,
+            )
+        self.assertIn('REGRESSION', out.getvalue())
+
+    def test_helpers(self):
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        baseline = {'results': [{'name': 'a', 'p95_ms': 10, 'queries': 3}]}
+        results = {'results': [{'name': 'a', 'p95_ms': 11, 'queries': 4}, {'name': 'b', 'p95_ms': 1, 'queries': 1}]}
+        self.assertEqual(compare_results(results, baseline), [('a', 1.1, 1, True)])
@@ -1,11 +1,38 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 import datetime
 from django.utils import timezone
-from catalog.models import Author
+from catalog.models import Author, Book, BookInstance, Genre, Language
 import uuid
 
+class IndexViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_visits_counted_without_database_writes(self):
+        User.objects.create_user(username='patron', password='1X<ISRUkw+tuK')
+        self.client.login(username='patron', password='1X<ISRUkw+tuK')
+        for visit in range(1, 4):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('index'))
+            self.assertEqual(response.context['num_visits'], visit)
+            writes = [query['sql'] for query in queries if not query['sql'].startswith('SELECT')]
+            self.assertEqual(writes, [])
+
+    def test_tampered_visit_cookie_is_ignored(self):
+        self.client.cookies['num_visits'] = '1000'
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 1)
+
+
 class AuthorListViewTest(TestCase):
+    def setUp(self):
+        # Cached catalog pages outlive the test data rolled back after each test.
+        cache.clear()
+
     @classmethod
     def setUpTestData(cls):
         # Create 13 authors for pagination tests
@@ -46,6 +73,118 @@ class AuthorListViewTest(TestCase):
         self.assertEqual(len(response.context['author_list']), 3)
 
 
+class BookListViewTest(TestCase):
+    def setUp(self):
+        # Cached catalog pages outlive the test data rolled back after each test.
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        # Create 25 books (three pages) each with its own author
+        for book_id in range(25):
+            author = Author.objects.create(first_name=f'First {book_id}', last_name=f'Last {book_id}')
+            Book.objects.create(title=f'Title {book_id:02}', isbn=f'{book_id:013}', author=author)
+
+    def test_view_uses_correct_template(self):
+        response = self.client.get(reverse('books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_list.html')
+
+    def test_pagination_is_ten(self):
+        response = self.client.get(reverse('books'))
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['book_list']), 10)
+
+    def test_authors_fetched_with_books(self):
+        # One COUNT for the paginator and one SELECT joining the authors
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('books'))
+        self.assertContains(response, 'Last 9, First 9')
+
+    def test_keyset_pages_follow_on(self):
+        response = self.client.get(reverse('books'))
+        titles = [book.title for book in response.context['book_list']]
+        # Follow the "next" cursor to the end of the list without counting
+        while 'next_cursor' in response.context:
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('books'), {'after': response.context['next_cursor']})
+            self.assertTrue(response.context['keyset_paginated'])
+            titles += [book.title for book in response.context['book_list']]
+        self.assertEqual(titles, [f'Title {book_id:02}' for book_id in range(25)])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('books'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_available_filter(self):
+        book = Book.objects.get(title='Title 07')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('books'), {'available': '1'})
+        self.assertEqual(list(response.context['book_list']), [book])
+        self.assertContains(response, '1 of 2 copies available')
+
+
+class BookDetailViewTest(TestCase):
+    def setUp(self):
+        # Cached catalog pages outlive the test data rolled back after each test.
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.language = Language.objects.create(name='English')
+        cls.small_book = Book.objects.create(title='Small', isbn='1', author=author)
+        cls.big_book = Book.objects.create(title='Big', isbn='2', author=author)
+        for book, copies in [(cls.small_book, 3), (cls.big_book, 45)]:
+            book.genre.set([cls.genre])
+            book.language.set([cls.language])
+            for copy in range(copies):
+                BookInstance.objects.create(book=book, imprint='Imprint', status='a' if copy % 3 else 'o')
+
+    def test_query_count_does_not_grow_with_copies(self):
+        with self.assertNumQueries(5):
+            self.client.get(reverse('book-detail', args=[self.small_book.pk]))
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('book-detail', args=[self.big_book.pk]))
+        self.assertContains(response, 'Fantasy')
+        self.assertContains(response, 'English')
+
+    def test_copies_summarised_and_paginated(self):
+        response = self.client.get(reverse('book-detail', args=[self.big_book.pk]))
+        self.assertEqual(response.context['copy_count'], 45)
+        self.assertEqual(
+            [(summary['label'], summary['count']) for summary in response.context['copy_status_counts']],
+            [('On loan', 15), ('Available', 30)],
+        )
+        self.assertEqual(len(response.context['copies_page']), 20)
+        response = self.client.get(reverse('book-detail', args=[self.big_book.pk]), {'copies_page': 3})
+        self.assertEqual(len(response.context['copies_page']), 5)
+
+
+class AuthorDetailViewTest(TestCase):
+    def setUp(self):
+        # Cached catalog pages outlive the test data rolled back after each test.
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        genres = [Genre.objects.create(name=f'Genre {genre_id}') for genre_id in range(4)]
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        for book_id in range(30):
+            book = Book.objects.create(title=f'Title {book_id:02}', isbn=f'{book_id:013}', author=cls.author)
+            book.genre.set(genres)
+
+    def test_query_count_does_not_grow_with_books(self):
+        # Author, books and their genres
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertContains(response, 'Title 29')
+        self.assertContains(response, '(Genre 0, Genre 1, Genre 2)')
+
+
 ### Testing for the View that are restricted to the logged in users
 ##Here we first use SetUp() to create some user login accounts and 
 # BookInstance objects (along with their associated books and other records) 
@@ -58,6 +197,7 @@ class AuthorListViewTest(TestCase):
 
 # Get user model from settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
 User = get_user_model()
 
 from catalog.models import BookInstance, Book, Genre, Language
@@ -177,6 +317,97 @@ class LoanedBookInstancesByUserListViewTest(TestCase):
                 self.assertTrue(last_date <= book.due_back)
                 last_date = book.due_back
 
+class AllLoanedBooksListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        cls.patron = User.objects.create_user(username='patron', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Book Title', isbn='ABCDEFG', author=author)
+        today = datetime.date.today()
+        # (days until due, status, borrower)
+        copies = [
+            (-3, 'o', cls.patron),
+            (2, 'o', cls.patron),
+            (20, 'o', cls.librarian),
+            (5, 'a', None),
+            (-1, 'm', None),
+        ]
+        for days, status, borrower in copies:
+            BookInstance.objects.create(
+                book=book,
+                imprint='Unlikely Imprint, 2016',
+                due_back=today + datetime.timedelta(days=days),
+                borrower=borrower,
+                status=status,
+            )
+
+    def setUp(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+
+    def due_dates(self, **filters):
+        response = self.client.get(reverse('all-borrowed'), filters)
+        self.assertEqual(response.status_code, 200)
+        today = datetime.date.today()
+        return [(copy.due_back - today).days for copy in response.context['bookinstance_list']]
+
+    def test_only_copies_on_loan_in_due_date_order(self):
+        self.assertEqual(self.due_dates(), [-3, 2, 20])
+
+    def test_filters(self):
+        self.assertEqual(self.due_dates(overdue='on'), [-3])
+        self.assertEqual(self.due_dates(due_this_week='on'), [2])
+        self.assertEqual(self.due_dates(borrower='patron'), [-3, 2])
+
+    def test_book_and_borrower_joined(self):
+        # Session, user, permissions, then one COUNT and one SELECT
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('all-borrowed'))
+        self.assertContains(response, 'Book Title')
+
+
+class OverdueBooksListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        cls.patron = User.objects.create_user(username='patron', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Book Title', isbn='ABCDEFG', author=author)
+        today = datetime.date.today()
+        # (days until due, status): only the copies on loan and past due count.
+        for days, status in [(-3, 'o'), (-10, 'o'), (0, 'o'), (4, 'o'), (-5, 'a'), (-2, 'm')]:
+            BookInstance.objects.create(
+                book=book,
+                imprint='Unlikely Imprint, 2016',
+                due_back=today + datetime.timedelta(days=days),
+                borrower=cls.patron if status == 'o' else None,
+                status=status,
+            )
+
+    def test_redirect_if_not_logged_in(self):
+        response = self.client.get(reverse('overdue'))
+        self.assertRedirects(response, '/accounts/login/?next=/catalog/overdue/')
+
+    def test_forbidden_for_patrons(self):
+        self.client.login(username='patron', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.client.get(reverse('overdue')).status_code, 403)
+
+    def test_only_overdue_copies_oldest_first(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('overdue'))
+        self.assertEqual(response.status_code, 200)
+        today = datetime.date.today()
+        self.assertEqual([(copy.due_back - today).days for copy in response.context['bookinstance_list']], [-10, -3])
+
+    def test_overdue_annotation_matches_is_overdue(self):
+        copies = BookInstance.objects.with_overdue()
+        self.assertEqual(sum(copy.overdue for copy in copies), 2)
+        for copy in copies:
+            self.assertEqual(copy.is_overdue(), BookInstance.is_overdue(BookInstance.objects.get(pk=copy.pk)))
+
+
 ## Testing VIews for the forms####
 
 from catalog.forms import RenewBookForm
@@ -339,6 +570,58 @@ class RenewBookInstancesViewTest(TestCase):
         self.assertFormError(response.context['form'], 'renewal_date', 'Invalid date - renewal more than 4 weeks ahead')
 
 
+class BulkRenewReturnViewTest(TestCase):
+    def setUp(self):
+        self.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        self.librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        self.patron = User.objects.create_user(username='patron', password='1X<ISRUkw+tuK')
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        self.genre = Genre.objects.create(name='Fantasy')
+        book = Book.objects.create(title='Book Title', isbn='ABCDEFG', author=author)
+        book.genre.set([self.genre])
+        due = datetime.date.today() + datetime.timedelta(days=2)
+        self.loans = [
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o', due_back=due, borrower=self.patron)
+            for _ in range(3)
+        ]
+        self.available = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+
+    def post(self, action, copies, **data):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        data.update({'action': action, 'copies': [str(copy) for copy in copies]})
+        return self.client.post(reverse('bulk-renew-return'), data)
+
+    def test_forbidden_without_permission(self):
+        self.client.login(username='patron', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('bulk-renew-return'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_renew(self):
+        new_date = datetime.date.today() + datetime.timedelta(weeks=3)
+        missing = uuid.uuid4()
+        copies = [loan.pk for loan in self.loans] + [self.available.pk, missing]
+        response = self.post('renew', copies, renewal_date=new_date)
+        self.assertEqual(response.status_code, 200)
+        outcomes = {result['id']: result['outcome'] for result in response.context['results']}
+        self.assertEqual(outcomes[self.loans[0].pk], 'renewed')
+        self.assertEqual(outcomes[self.available.pk], 'not on loan')
+        self.assertEqual(outcomes[missing], 'not found')
+        self.assertEqual(BookInstance.objects.filter(due_back=new_date).count(), 3)
+
+    def test_bulk_renew_invalid_date(self):
+        past = datetime.date.today() - datetime.timedelta(days=1)
+        response = self.post('renew', [self.loans[0].pk], renewal_date=past)
+        self.assertFormError(response.context['form'], 'renewal_date', 'Invalid date - renewal in past')
+        self.assertIsNone(response.context['results'])
+
+    def test_bulk_return(self):
+        response = self.post('return', [loan.pk for loan in self.loans[:2]])
+        self.assertEqual([result['outcome'] for result in response.context['results']], ['returned', 'returned'])
+        self.assertEqual(BookInstance.objects.filter(status='a', borrower=None).count(), 3)
+        self.genre.refresh_from_db()
+        self.assertEqual(self.genre.available_count, 3)
+
+
 class AuthorCreateViewTest(TestCase):
     def setUp(self):
         # Create a user
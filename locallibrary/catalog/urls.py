@@ -12,6 +12,7 @@ urlpatterns = [
     path('books/', views.BookListView.as_view(), name='books'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('book/renew-return/', views.bulk_renew_return, name='bulk-renew-return'),
     path('book/create/', views.BookCreate.as_view(), name='book-create'),
     path('book/<int:pk>/update/', views.BookUpdate.as_view(), name='book-update'),
     path('book/<int:pk>/delete/', views.BookDelete.as_view(), name='book-delete'),
@@ -19,12 +20,25 @@ urlpatterns = [
 
 ]
 
+urlpatterns += [
+    path('search/', views.BookSearchView.as_view(), name='search'),
+    path('browse/', views.BookBrowseView.as_view(), name='browse'),
+]
+
 urlpatterns += [
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
+    path('myholds/', views.HoldsByUserListView.as_view(), name='my-holds'),
+    path('book/<int:pk>/hold/', views.book_hold, name='book-hold'),
+    path('hold/<int:pk>/cancel/', views.hold_cancel, name='hold-cancel'),
 ]
 
 urlpatterns += [
     path('allborrowed/', views.AllLoanedBooksListView.as_view(), name='all-borrowed'),
+    path('overdue/', views.OverdueBooksListView.as_view(), name='overdue'),
+]
+
+urlpatterns += [
+    path('export/<str:kind>/', views.export_catalog, name='export'),
 ]
 
 urlpatterns += [
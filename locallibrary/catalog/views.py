@@ -1,41 +1,56 @@
 from django.shortcuts import render
+from django.template.response import TemplateResponse
 from .models import Book, Author, BookInstance, Genre
 from django.utils.translation import gettext_lazy as _
+from .stats import aget_catalog_stats
 # from django.urls import reverse
 
 
+VISITS_COOKIE = 'num_visits'
+VISITS_COOKIE_AGE = 60 * 60 * 24 * 365
+
 # Create your views here.
-def index(request):
+async def index(request):
     """ View function for the home page of the site."""
-    #Generate counts of some of the main objects
-    num_books =Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
-    # Available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-    # The 'all()' is implied by default.
-    num_authors = Author.objects.count()
-    num_genres_fiction = Genre.objects.filter(name__icontains='fiction').count()
-    num_books_with_fiction = Book.objects.filter(genre__name__icontains='fiction').count()
-
-    # Number of visits to this view, as counted in the session variable.
-    num_visits = request.session.get('num_visits', 0)
+    # All the counts come from one aggregate query, cached until a catalog
+    # model is written (see catalog/stats.py and catalog/signals.py). The
+    # view is async, like the catalog views below (catalog/async_views.py).
+    stats = await aget_catalog_stats()
+
+    # Number of visits to this view, counted in a signed cookie rather than
+    # in the session: with the database session backend every front page hit
+    # would otherwise UPDATE django_session, and SQLite has a single writer.
+    # The signature stops visitors from setting the count themselves.
+    try:
+        num_visits = int(request.get_signed_cookie(VISITS_COOKIE, default=0, salt=VISITS_COOKIE))
+    except ValueError:
+        num_visits = 0
     num_visits +=1
-    request.session['num_visits'] = num_visits
 
     context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-        'num_genres_fiction': num_genres_fiction,
-        'num_books_with_fiction': num_books_with_fiction,
+        **stats,
         'num_visits': num_visits,
     }
 
-# Render the HTML template index.html with the data in the context variable
-    return render(request, 'index.html', context=context)
+# Render the HTML template index.html with the data in the context variable.
+# A TemplateResponse is rendered by Django in a worker thread, off the event loop.
+    response = TemplateResponse(request, 'index.html', context=context)
+    response.set_signed_cookie(
+        VISITS_COOKIE, num_visits, salt=VISITS_COOKIE, max_age=VISITS_COOKIE_AGE, httponly=True, samesite='Lax'
+    )
+    return response
 
+from django.core.paginator import Paginator
+from django.db.models import Prefetch
 from django.views import generic
+from .async_views import AsyncDetailMixin, AsyncListMixin
+from .pagination import KeysetPaginationMixin
+# The four catalog pages below are cached for anonymous visitors, keyed on
+# version stamps that writes replace, see catalog/caching.py.
+from .caching import (
+    AUTHOR_LIST, BOOK_LIST, StampedCacheMixin, author_stamp, book_stamp, copies_stamp, get_stamps,
+)
+from django.utils.functional import SimpleLazyObject
 #The generic view will query the database to get all records for the specified model (Book) and render them 
 # using a template.
 #located at /locallibrary/catalog/templates/catalog/book_list.html.
@@ -45,12 +60,29 @@ from django.views import generic
 # in this case, /locallibrary/catalog/book_list.html).
 # inside the applciaiton's (/application_name/templates/) directory.
 # /catalog/templates/catalog/book_list.html
-class BookListView(generic.ListView):
+class BookListView(StampedCacheMixin, KeysetPaginationMixin, AsyncListMixin, generic.ListView):
     model = Book
+    paginate_by = 10
+    # Deep pages seek past the last (title, id) seen instead of using OFFSET,
+    # see catalog/pagination.py. The Book index on (title, id) serves both.
+    keyset_fields = ('title', 'id')
     # context_object_name = 'book_list' # your own name for the list as a template variable
     # queryset = Book.objects.filter(title__icontains='war')[:5] # Get 5 books containing the title war
     # template_name='catalog/book_list'  # Specify your own template name/location
 
+    def get_cache_stamps(self):
+        return [BOOK_LIST]
+
+    def get_queryset(self):
+        # The template prints book.author for every row, so join the author
+        # into the same query rather than fetching it once per book.
+        books = Book.objects.select_related('author').order_by('title', 'id')
+        # ?available=1 lists only the books with a copy on the shelf, read
+        # from the maintained counter (see catalog/counters.py).
+        if self.request.GET.get('available'):
+            books = books.filter(available_count__gt=0)
+        return books
+
     def get_context_data(self, **kwargs):
         #Call the base implementation first to get the context
         context = super(BookListView, self).get_context_data(**kwargs)
@@ -58,16 +90,51 @@ class BookListView(generic.ListView):
         context['some_data'] = 'This is just some data'
         return context
     
-class BookDetailView(generic.DetailView):
+class BookDetailView(StampedCacheMixin, AsyncDetailMixin, generic.DetailView):
     model = Book
     # template_name = 'catalog/book_detail.html'  # Specify your own template name/location
     ## this is a generic view example that fetches the object based on the primary key(pk) 
     ## the only catch is that it expects the URL parameter to be named pk
     ## if you use generic.DetailsView the url configuration must use the name pk because the generic view looks  for the exact names
+    copies_paginate_by = 20
+
+    def get_cache_stamps(self):
+        return [book_stamp(self.kwargs['pk'])]
+
+    def get_queryset(self):
+        # Author joined, genres and languages prefetched: three queries in all
+        return Book.objects.select_related('author').prefetch_related('genre', 'language')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        copies = self.object.bookinstance_set.all()
+
+        # The per-status summary and the total come from the book's copy
+        # counters (see catalog/counters.py), so the template never loads or
+        # counts the copies for them.
+        context['copy_status_counts'] = [
+            {'status': status, 'label': label, 'count': count}
+            for status, label, count in self.object.copy_status_counts()
+        ]
+        context['copy_count'] = self.object.copy_count
+
+        # The copies themselves are shown a page at a time. Lazy: the copies
+        # block of the template is a cached fragment, and when it is served
+        # from the cache its queries do not run.
+        paginator = Paginator(copies.order_by('due_back', 'id'), self.copies_paginate_by)
+        context['copies_page'] = SimpleLazyObject(lambda: paginator.get_page(self.request.GET.get('copies_page')))
+        # Part of the fragment's cache key; replaced whenever a copy of the
+        # book is written (see catalog/caching.py).
+        context['copies_version'] = SimpleLazyObject(lambda: get_stamps([copies_stamp(self.object.pk)])[0])
+        return context
 
-class AuthorListView(generic.ListView):
+class AuthorListView(StampedCacheMixin, AsyncListMixin, generic.ListView):
     model = Author
     paginate_by = 10
+
+    def get_cache_stamps(self):
+        return [AUTHOR_LIST]
+
     # context_object_name = 'my_author_list'   # your own name for the list as a template variable
     # queryset = Author.objects.filter(last_name__icontains='smith')[:5] # Get 5 authors containing the name smith
     # template_name = 'catalog/author_list.html'  # Specify your own template name/location
@@ -75,10 +142,86 @@ class AuthorListView(generic.ListView):
     # the author_list.html template is in the correct location and that it can be accessed
     # using its name in the URL
 
-class AuthorDetailView(generic.DetailView):
+class AuthorDetailView(StampedCacheMixin, AsyncDetailMixin, generic.DetailView):
     model = Author
     # template_name = 'catalog/author_detail.html'  # Specify your own template name/location
 
+    def get_cache_stamps(self):
+        return [author_stamp(self.kwargs['pk'])]
+
+    def get_queryset(self):
+        # The template reads author.book_set.all several times and calls
+        # display_genre per book; prefetching both keeps the page at three
+        # queries however many books the author has written.
+        books = Book.objects.order_by('title').prefetch_related('genre')
+        return Author.objects.prefetch_related(Prefetch('book_set', queryset=books))
+
+## Faceted browsing, see catalog/facets.py
+# The page of books costs a COUNT and a SELECT; the facet counts come from
+# the cache or from four GROUP BY queries, and are lazy like the copies of
+# the book page, so they are computed while the template renders.
+from .caching import FACETS
+from .facets import FacetFilter, get_facet_counts
+
+class BookBrowseView(StampedCacheMixin, AsyncListMixin, generic.ListView):
+    model = Book
+    template_name = 'catalog/book_browse.html'
+    paginate_by = 10
+
+    def get_cache_stamps(self):
+        return [BOOK_LIST, FACETS]
+
+    def get_queryset(self):
+        self.facet_filter = FacetFilter.from_query(self.request.GET)
+        return self.facet_filter.apply(Book.objects.select_related('author').order_by('title', 'id'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['facet_filter'] = self.facet_filter
+        context['facets'] = SimpleLazyObject(self.facet_links)
+        return context
+
+    def facet_links(self):
+        """The facet counts, each value with the query string that selects or clears it."""
+        counts = get_facet_counts(self.facet_filter)
+        facets = {'books': counts['books'], 'lists': []}
+        for name, title in [('genre', 'Genre'), ('language', 'Language'), ('author', 'Author')]:
+            selected = getattr(self.facet_filter, name)
+            facets[name] = {
+                'title': title,
+                'clear': self.facet_filter.query(**{name: None}) if selected else None,
+                'values': [
+                    {'label': label, 'count': count, 'selected': pk == selected,
+                     'query': self.facet_filter.query(**{name: pk})}
+                    for pk, label, count in counts[name]
+                ],
+            }
+            facets['lists'].append(facets[name])
+        facets['available'] = {
+            'count': counts['available'],
+            'selected': self.facet_filter.available,
+            'query': self.facet_filter.query(available=not self.facet_filter.available),
+        }
+        return facets
+
+## Full-text search over the catalog, see catalog/search.py
+# The results come ranked from the FTS5 index; each page costs one COUNT and
+# one MATCH query on the index plus one query loading the books by id.
+from .search import SearchResults
+
+class BookSearchView(generic.ListView):
+    template_name = 'catalog/book_search.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+
+    def get_queryset(self):
+        return SearchResults(self.request.GET.get('q', ''))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
+
 ## Challenge:Yourself 
 # Showing the particular User all the books that are currently on loan to them.
 ## this is used to ensure that only logged in users can access the view
@@ -92,12 +235,22 @@ class LoanedBooksByUserListView(LoginRequiredMixin,generic.ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')
+        # Served by the partial (borrower, due_back) index on loaned copies;
+        # the book is joined because the template links to it for every row.
+        return (
+            BookInstance.objects.filter(borrower=self.request.user)
+            .filter(status__exact='o')
+            .with_overdue()
+            .select_related('book')
+            .order_by('due_back')
+        )
     
 
 ## Challenge:Yourself
 ## Create a similar page that is only visible for librarians, that displays all books that are currently on loan.
 
+import datetime
+from catalog.forms import LoanFilterForm
 from django.contrib.auth.mixins import PermissionRequiredMixin  ##ensures that the user has the required permission to access the view
 
 class AllLoanedBooksListView(PermissionRequiredMixin, generic.ListView):
@@ -105,7 +258,51 @@ class AllLoanedBooksListView(PermissionRequiredMixin, generic.ListView):
     template_name = 'catalog/bookinstance_list_borrowed_all.html'
     permission_required = 'catalog.can_mark_returned'
     paginate_by = 10
-    
+
+    def get_queryset(self):
+        # Only copies on loan, with book and borrower joined, in due date
+        # order: the (status, due_back) index serves both filter and sort.
+        queryset = (
+            BookInstance.objects.on_loan()
+            .with_overdue()
+            .select_related('book', 'borrower')
+            .order_by('due_back', 'id')
+        )
+        self.filter_form = LoanFilterForm(self.request.GET or None)
+        if self.filter_form.is_valid():
+            today = datetime.date.today()
+            if self.filter_form.cleaned_data['overdue']:
+                queryset = queryset.filter(due_back__lt=today)
+            if self.filter_form.cleaned_data['due_this_week']:
+                queryset = queryset.filter(due_back__gte=today, due_back__lte=today + datetime.timedelta(days=7))
+            if self.filter_form.cleaned_data['borrower']:
+                queryset = queryset.filter(borrower__username=self.filter_form.cleaned_data['borrower'])
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.filter_form
+        return context
+
+
+## Overdue report for librarians
+# Only the overdue copies are read, oldest due date first, one page at a
+# time: the filter, the order and the page COUNT are all served by the
+# partial index on loaned copies (see BookInstanceQuerySet.overdue).
+class OverdueBooksListView(PermissionRequiredMixin, generic.ListView):
+    """Generic class-based view listing the copies past their due date."""
+    model = BookInstance
+    template_name = 'catalog/bookinstance_list_overdue.html'
+    permission_required = 'catalog.can_mark_returned'
+    paginate_by = 20
+
+    def get_queryset(self):
+        return (
+            BookInstance.objects.overdue()
+            .select_related('book', 'borrower')
+            .order_by('due_back', 'id')
+        )
+
 
 #Form handling for a stand alone forms and also the example is for 
 # processing the form on the forms.py
@@ -115,12 +312,14 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponseRedirect
 from django.urls import reverse, reverse_lazy
-from catalog.forms import RenewBookForm
+from catalog.forms import CONFLICT_MESSAGE, RenewBookForm
+from catalog.models import ConcurrentUpdateError
 @login_required
 @permission_required('catalog.can_mark_returned', raise_exception=True)
 def renew_book_librarian(request, pk):
     """View function for renewing a specific BookInstance by librarian."""
     book_instance = get_object_or_404(BookInstance, pk=pk)
+    status = 200
 
     # If this is a POST request then process the Form data
     if request.method == 'POST':
@@ -132,22 +331,113 @@ def renew_book_librarian(request, pk):
         if form.is_valid():
             # process the data in form.cleaned_data as required (here we just write it to the model due_back field)
             book_instance.due_back = form.cleaned_data['renewal_date']
-            book_instance.save()
-
-            # redirect to a new URL:
-            return HttpResponseRedirect(reverse('all-borrowed'))
+            # save() only writes due_back, and only if the copy is still at
+            # the version shown in the form: a status or borrower change made
+            # in the meantime is reported as a conflict instead of overwritten.
+            if form.cleaned_data['version'] is not None:
+                book_instance.version = form.cleaned_data['version']
+            try:
+                book_instance.save()
+            except ConcurrentUpdateError:
+                form.add_error(None, CONFLICT_MESSAGE)
+                status = 409
+            else:
+                # redirect to a new URL:
+                return HttpResponseRedirect(reverse('all-borrowed'))
 
     # If this is a GET (or any other method) create the default form.
     else:
         proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
-        form = RenewBookForm(initial={'renewal_date': proposed_renewal_date})
+        form = RenewBookForm(initial={'renewal_date': proposed_renewal_date, 'version': book_instance.version})
 
     context = {
         'form': form,
         'book_instance': book_instance,
     }
 
-    return render(request, 'catalog/book_renew_librarian.html', context)
+    return render(request, 'catalog/book_renew_librarian.html', context, status=status)
+
+
+## Bulk renew and return for librarians, see catalog/circulation.py
+# The date is validated once by BulkLoanForm and all the copies are updated
+# with set-based UPDATEs in one transaction; the page then lists the outcome
+# for every copy.
+from catalog.circulation import renew_copies, return_copies
+from catalog.forms import BulkLoanForm
+
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def bulk_renew_return(request):
+    """View function for renewing or returning many BookInstances at once."""
+    results = None
+    if request.method == 'POST':
+        form = BulkLoanForm(request.POST)
+        if form.is_valid():
+            copy_ids = form.cleaned_data['copies']
+            if form.cleaned_data['action'] == 'renew':
+                outcomes = renew_copies(copy_ids, form.cleaned_data['renewal_date'])
+            else:
+                outcomes = return_copies(copy_ids)
+            titles = dict(BookInstance.objects.filter(pk__in=copy_ids).values_list('pk', 'book__title'))
+            results = [
+                {'id': pk, 'title': titles.get(pk, ''), 'outcome': outcome}
+                for pk, outcome in outcomes.items()
+            ]
+    else:
+        proposed_renewal_date = datetime.date.today() + datetime.timedelta(weeks=3)
+        form = BulkLoanForm(initial={
+            'renewal_date': proposed_renewal_date,
+            'copies': request.GET.getlist('copies'),
+        })
+
+    context = {
+        'form': form,
+        'results': results,
+    }
+
+    return render(request, 'catalog/bookinstance_bulk_update.html', context)
+
+
+## Holds: the reservation queue of a book, see catalog/holds.py
+# Patrons join and leave the queue with POST requests from the book page and
+# their holds page. The holds page reads a patron's active holds through the
+# partial (patron, id) index, and each queue position is an index-only COUNT.
+from django.views.decorators.http import require_POST
+from catalog.holds import cancel_hold, place_hold
+from catalog.models import Hold
+
+@login_required
+@require_POST
+def book_hold(request, pk):
+    """View function for placing a hold on a book."""
+    book = get_object_or_404(Book, pk=pk)
+    place_hold(book.pk, request.user)
+    return HttpResponseRedirect(reverse('my-holds'))
+
+
+@login_required
+@require_POST
+def hold_cancel(request, pk):
+    """View function for cancelling one of the current user's holds."""
+    hold = get_object_or_404(Hold.objects.active(), pk=pk, patron=request.user)
+    cancel_hold(hold)
+    return HttpResponseRedirect(reverse('my-holds'))
+
+
+class HoldsByUserListView(LoginRequiredMixin, generic.ListView):
+    """Generic class-based view listing the current user's active holds."""
+    model = Hold
+    template_name = 'catalog/hold_list_user.html'
+    paginate_by = 10
+
+    def get_queryset(self):
+        return (
+            Hold.objects.active()
+            .filter(patron=self.request.user)
+            .with_position()
+            .select_related('book')
+            .order_by('id')
+        )
 
 
 ## Form Handling using a Helper class ModelForm for Renew Book
@@ -208,7 +498,13 @@ class AuthorDelete(PermissionRequiredMixin, DeleteView):
     model = Author
     success_url = reverse_lazy('authors')
     permission_required = 'catalog.delete_author'
-    
+
+    def get_queryset(self):
+        # The page lists the author's books with their number of copies,
+        # read from the book's copy counter rather than one COUNT per book.
+        books = Book.objects.order_by('title')
+        return Author.objects.prefetch_related(Prefetch('book_set', queryset=books))
+
     def form_valid(self, form):
         try:
             self.object.delete()
@@ -242,3 +538,38 @@ class BookDelete(PermissionRequiredMixin, DeleteView):
             return HttpResponseRedirect(
                 reverse("book-delete", kwargs={"pk": self.object.pk})
             )
+
+
+## Streaming exports for the data warehouse, see catalog/export.py
+# The response body is produced line by line while it is being sent, so
+# exporting millions of rows needs no more memory than exporting ten.
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from .export import EXPORTS, FORMATS, export_lines, parse_since
+
+EXPORT_PERMISSIONS = {
+    'books': 'catalog.view_book',
+    'copies': 'catalog.view_bookinstance',
+}
+
+@login_required
+def export_catalog(request, kind):
+    """Stream every book or copy (optionally only those changed ?since=) as CSV or JSONL."""
+    if kind not in EXPORTS:
+        raise Http404(_('Unknown export.'))
+    if not request.user.has_perm(EXPORT_PERMISSIONS[kind]):
+        raise PermissionDenied
+
+    format = request.GET.get('format', 'csv')
+    if format not in FORMATS:
+        return HttpResponseBadRequest(_('Unknown format.'))
+    since = None
+    if request.GET.get('since'):
+        try:
+            since = parse_since(request.GET['since'])
+        except ValueError:
+            return HttpResponseBadRequest(_('Invalid since date.'))
+
+    response = StreamingHttpResponse(export_lines(kind, format, since), content_type=FORMATS[format][1])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{format}"'
+    return response
@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # First after security, so that it also counts the session and user queries.
+    "catalog.instrumentation.QueryInstrumentationMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -92,10 +94,94 @@ WSGI_APPLICATION = "locallibrary.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # DJANGO_DB_NAME picks another database file, e.g. one per benchmark scale.
+        "NAME": os.environ.get('DJANGO_DB_NAME', BASE_DIR / "db.sqlite3"),
     }
 }
 
+# SQLite production profile
+# SQLite allows one writer at a time. With the default rollback journal a
+# writer also blocks every reader, and two transactions that both read
+# before writing can deadlock, which SQLite reports at once as "database is
+# locked". The production profile:
+#  - runs every connection in WAL mode, so readers never wait for the writer,
+#    with synchronous=NORMAL (durable at checkpoints; safe with WAL);
+#  - waits up to busy_timeout ms for the write lock instead of failing;
+#  - memory-maps the file and enlarges the page cache (negative cache_size
+#    is in KiB) for fewer read() calls;
+#  - starts transactions with BEGIN IMMEDIATE, taking the write lock up
+#    front, so a transaction never fails half way trying to upgrade its lock;
+#  - keeps connections open across requests instead of reconnecting (and
+#    re-running the pragmas) for every request.
+# Selected with DJANGO_SQLITE_PROFILE=production, the default when DEBUG is
+# off. "manage.py benchmark_sqlite" compares it with the defaults.
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 128 * 1024 * 1024,
+    "cache_size": -20000,
+    "temp_store": "MEMORY",
+}
+
+SQLITE_PROFILE = os.environ.get('DJANGO_SQLITE_PROFILE', 'default' if DEBUG else 'production')
+
+if SQLITE_PROFILE == 'production':
+    DATABASES["default"].update({
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": "".join(f"PRAGMA {name}={value};" for name, value in SQLITE_PRAGMAS.items()),
+            "transaction_mode": "IMMEDIATE",
+        },
+    })
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The catalog keeps derived data (home page statistics and the like) here.
+# Local memory is per process; point DJANGO_CACHE_BACKEND at the file based
+# backend to share the cache between worker processes.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.environ.get('DJANGO_CACHE_LOCATION', 'locallibrary'),
+    }
+}
+
+# Per-request SQL instrumentation (catalog/instrumentation.py)
+# Share of the requests measured (0 to 1): every request while developing,
+# one in a hundred in production unless DJANGO_INSTRUMENTATION_SAMPLE_RATE
+# says otherwise. A statement run this many times in one request is
+# reported as a repeated query (an N+1 pattern).
+
+CATALOG_INSTRUMENTATION_SAMPLE_RATE = float(
+    os.environ.get('DJANGO_INSTRUMENTATION_SAMPLE_RATE', '1' if DEBUG else '0.01')
+)
+CATALOG_REPEATED_QUERY_THRESHOLD = 5
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+# The instrumentation records are one JSON object per line on the console.
+# While developing only the repeated query warnings are logged; the figures
+# of every request are in its Server-Timing header (browser developer tools).
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "catalog.instrumentation": {
+            "handlers": ["console"],
+            "level": os.environ.get('DJANGO_INSTRUMENTATION_LOG_LEVEL', 'WARNING' if DEBUG else 'INFO'),
+            "propagate": False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators